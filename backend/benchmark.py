@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Benchmark do backend: gera dados sintéticos, sobe a API e mede latência, vazão e RSS
+
+    python benchmark.py generate --dir /tmp/ftp-bench --log-size 1GB --users 100000
+    python benchmark.py run --dir /tmp/ftp-bench --concurrency 16 --requests 500 \\
+        --output result.json --baseline baseline.json
+    python benchmark.py compare baseline.json result.json
+
+A API roda em um subprocesso com VSFTPD_LOG, VIRTUAL_USERS_FILE e
+FTP_HOME_BASE apontando para o diretório gerado; nada em /etc ou /var é tocado.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+import psutil
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Endpoints medidos por padrão; "{offset}" é sorteado entre os usuários gerados
+ENDPOINTS = {
+    "dashboard_stats": "/api/dashboard/stats",
+    "recent_users": "/api/dashboard/recent-users?limit=10",
+    "logs_tail": "/api/logs/vsftpd?tail=1000",
+    "users_page": "/api/users?offset={offset}&limit=50",
+}
+# Opcionais (caros em logs grandes): selecione com --endpoints
+OPTIONAL_ENDPOINTS = {
+    "logs_full": "/api/logs/vsftpd",
+    "logs_search": "/api/logs/search?user={user}&limit=100",
+    "throughput": "/api/stats/throughput?hours=24",
+}
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+IPS = [f"10.0.{i // 256}.{i % 256}" for i in range(512)]
+ACTIONS = ("UPLOAD", "DOWNLOAD")
+
+
+def parse_size(value: str) -> int:
+    """"10GB" -> bytes"""
+    value = value.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+
+def username_for(index: int) -> str:
+    return f"user{index:06d}"
+
+
+def generate_users(path: str, count: int):
+    with open(path, 'w') as f:
+        f.writelines(f"{username_for(i)}\nsenha{i:06d}\n" for i in range(count))
+
+
+def generate_home(base: str, users: int, files_per_user: int):
+    """Create one directory per user with sparse files (real sizes, no disk usage)"""
+    rng = random.Random(1)
+    for i in range(users):
+        user_dir = os.path.join(base, username_for(i), "uploads")
+        os.makedirs(user_dir, exist_ok=True)
+        for n in range(files_per_user):
+            with open(os.path.join(user_dir, f"file{n:04d}.bin"), 'wb') as f:
+                f.truncate(rng.randint(1024, 50 * 1024 * 1024))
+
+
+def generate_log(path: str, size: int, users: int, fmt: str, days: float):
+    """Write ~`size` bytes of vsftpd log spread over the last `days`, oldest first"""
+    rng = random.Random(42)
+    now = time.time()
+    start = now - days * 86400
+    ts_cache: Tuple[int, str] = (-1, "")
+    last_second = 0
+    written = 0
+    n = 0
+    with open(path, 'w', buffering=1024 * 1024) as f:
+        while written < size:
+            batch = []
+            position = written
+            while len(batch) < 10000 and position < size:
+                # Horário proporcional aos bytes já escritos: a última linha cai em `now`,
+                # qualquer que seja o tamanho médio das linhas do formato
+                second = int(start + (now - start) * position / size)
+                if second != ts_cache[0]:
+                    ts_cache = (second, datetime.fromtimestamp(second).strftime("%a %b %d %H:%M:%S %Y"))
+                ts = ts_cache[1]
+                last_second = second
+                user = username_for(rng.randrange(users))
+                ip = rng.choice(IPS)
+                size_bytes = rng.randint(100, 200 * 1024 * 1024)
+                seconds = max(1, size_bytes // rng.randint(100_000, 50_000_000))
+                line_fmt = fmt if fmt != "mixed" else rng.choice(("native", "xferlog"))
+                if line_fmt == "xferlog":
+                    direction = rng.choice("io")
+                    line = (f"{ts} {seconds} {ip} {size_bytes} /uploads/file{n}.bin b _ {direction} r "
+                            f"{user} ftp 0 * c\n")
+                else:
+                    line = (f'{ts} [pid {1000 + n % 30000}] [{user}] OK {rng.choice(ACTIONS)}: '
+                            f'Client "::ffff:{ip}", "/uploads/file{n}.bin", {size_bytes} bytes, '
+                            f'{size_bytes / 1024 / seconds:.2f}Kbyte/sec\n')
+                batch.append(line)
+                position += len(line)
+                n += 1
+            chunk = "".join(batch)
+            f.write(chunk)
+            written += len(chunk)
+    # Registros no futuro deixariam sessões abertas e distorceriam as janelas de 24h
+    if last_second > now:
+        raise RuntimeError(f"Generated log ends in the future ({datetime.fromtimestamp(last_second)})")
+
+
+def cmd_generate(args) -> int:
+    os.makedirs(args.dir, exist_ok=True)
+    started = time.time()
+    generate_users(os.path.join(args.dir, "virtual_users.txt"), args.users)
+    generate_home(os.path.join(args.dir, "home"), min(args.users, args.home_users), args.home_files)
+    generate_log(os.path.join(args.dir, "vsftpd.log"), parse_size(args.log_size), args.users,
+                 args.format, args.days)
+    meta = {"users": args.users, "log_size": parse_size(args.log_size), "format": args.format,
+            "home_users": min(args.users, args.home_users), "home_files": args.home_files}
+    with open(os.path.join(args.dir, "dataset.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Dataset gerado em {args.dir} ({time.time() - started:.1f}s)", file=sys.stderr)
+    return 0
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RssSampler(threading.Thread):
+    """Track the peak RSS of the server process"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.peak = max(self.peak, self.process.memory_info().rss)
+            except psutil.Error:
+                return
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir: str, port: int) -> subprocess.Popen:
+    state_dir = os.path.join(data_dir, "state")
+    os.makedirs(state_dir, exist_ok=True)
+    env = dict(os.environ,
+               VSFTPD_LOG=os.path.join(data_dir, "vsftpd.log"),
+               VIRTUAL_USERS_FILE=os.path.join(data_dir, "virtual_users.txt"),
+               VIRTUAL_USERS_DB=os.path.join(state_dir, "virtual_users.db"),
+               QUOTAS_FILE=os.path.join(state_dir, "user_quotas.json"),
+               FTP_HOME_BASE=os.path.join(data_dir, "home"))
+    # cwd isolado: config.json e os bancos SQLite ficam dentro do diretório do benchmark
+    with open(os.path.join(state_dir, "server.log"), 'ab') as server_log:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=state_dir, env=env, stdout=server_log, stderr=subprocess.STDOUT,
+        )
+
+
+def wait_ready(port: int, process: subprocess.Popen, timeout: float) -> float:
+    started = time.time()
+    while time.time() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            conn.request("GET", "/api/dashboard/stats")
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200:
+                return time.time() - started
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+def run_endpoint(port: int, make_path: Callable[[random.Random], str], requests: int,
+                 concurrency: int) -> Dict[str, Any]:
+    """Issue `requests` GETs from `concurrency` keep-alive connections"""
+    latencies: List[float] = []
+    errors = 0
+    received = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(seed: int):
+        nonlocal errors, received
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        local_latencies, local_errors, local_bytes = [], 0, 0
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            path = make_path(rng)
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                body = response.read()
+                if response.status >= 400:
+                    local_errors += 1
+                local_bytes += len(body)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+            local_latencies.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+            received += local_bytes
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "bytes": received,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def cmd_run(args) -> int:
+    dataset_path = os.path.join(args.dir, "dataset.json")
+    if not os.path.exists(dataset_path):
+        print(f"{dataset_path} não encontrado; rode 'generate' antes", file=sys.stderr)
+        return 2
+    with open(dataset_path) as f:
+        dataset = json.load(f)
+    users = max(1, dataset["users"])
+    all_endpoints = {**ENDPOINTS, **OPTIONAL_ENDPOINTS}
+    names = args.endpoints.split(",") if args.endpoints else list(ENDPOINTS)
+    unknown = [name for name in names if name not in all_endpoints]
+    if unknown:
+        print(f"Endpoints desconhecidos: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    port = free_port()
+    process = start_server(args.dir, port)
+    sampler = RssSampler(process.pid)
+    sampler.start()
+    try:
+        startup = wait_ready(port, process, args.startup_timeout)
+        results = {}
+        for name in names:
+            template = all_endpoints[name]
+
+            def make_path(rng: random.Random, template=template) -> str:
+                return template.format(offset=rng.randrange(users), user=username_for(rng.randrange(users)))
+
+            # Aquecimento: caches, índices e conexões antes da medição
+            run_endpoint(port, make_path, min(args.warmup, args.requests), 1)
+            results[name] = run_endpoint(port, make_path, args.requests, args.concurrency)
+            print(f"{name}: p95={results[name]['p95_ms']}ms rps={results[name]['rps']}", file=sys.stderr)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        sampler.stop()
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+        "dataset": dataset,
+        "concurrency": args.concurrency,
+        "startup_seconds": round(startup, 3),
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(output + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if print_comparison(baseline, report, args.tolerance) else 0
+    return 0
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """List metric changes; `regression` is set when one is worse than `tolerance` allows"""
+    rows = []
+
+    def check(name: str, old: float, new: float, higher_is_worse: bool):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        rows.append({"metric": name, "baseline": old, "current": new,
+                     "change_pct": round(change * 100, 1), "regression": worse})
+
+    for endpoint, old in baseline.get("endpoints", {}).items():
+        new = current.get("endpoints", {}).get(endpoint)
+        if new is None:
+            continue
+        check(f"{endpoint}.p95_ms", old["p95_ms"], new["p95_ms"], True)
+        check(f"{endpoint}.rps", old["rps"], new["rps"], False)
+        if new["errors"] > old["errors"]:
+            rows.append({"metric": f"{endpoint}.errors", "baseline": old["errors"], "current": new["errors"],
+                         "change_pct": None, "regression": True})
+    check("peak_rss_mb", baseline.get("peak_rss_mb", 0), current.get("peak_rss_mb", 0), True)
+    check("startup_seconds", baseline.get("startup_seconds", 0), current.get("startup_seconds", 0), True)
+    return rows
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> bool:
+    rows = compare(baseline, current, tolerance)
+    for row in rows:
+        flag = "REGRESSÃO" if row["regression"] else "ok"
+        change = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "-"
+        print(f"{row['metric']:<32} {row['baseline']:>12} {row['current']:>12} {change:>9}  {flag}",
+              file=sys.stderr)
+    return any(row["regression"] for row in rows)
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return 1 if print_comparison(baseline, current, args.tolerance) else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do backend do FTP Dashboard")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Gera log, usuários e árvore /home sintéticos")
+    gen.add_argument("--dir", required=True)
+    gen.add_argument("--log-size", default="100MB", help="Tamanho do log (ex.: 1MB, 10GB)")
+    gen.add_argument("--format", choices=("native", "xferlog", "mixed"), default="native")
+    gen.add_argument("--days", type=float, default=7.0, help="Período coberto pelo log")
+    gen.add_argument("--users", type=int, default=10000)
+    gen.add_argument("--home-users", type=int, default=1000, help="Usuários com diretório em home/")
+    gen.add_argument("--home-files", type=int, default=20, help="Arquivos (esparsos) por usuário")
+
+    run = sub.add_parser("run", help="Sobe a API sobre o dataset e mede os endpoints")
+    run.add_argument("--dir", required=True)
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--requests", type=int, default=200, help="Requisições por endpoint")
+    run.add_argument("--warmup", type=int, default=10)
+    run.add_argument("--endpoints", help=f"Lista separada por vírgula: {', '.join({**ENDPOINTS, **OPTIONAL_ENDPOINTS})}")
+    run.add_argument("--startup-timeout", type=float, default=600.0)
+    run.add_argument("--output", help="Arquivo JSON do resultado (padrão: stdout)")
+    run.add_argument("--baseline", help="Compara com este resultado e sai com 1 se houver regressão")
+    run.add_argument("--save-baseline", help="Grava o resultado também como novo baseline")
+    run.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa aceita (0.2 = 20%%)")
+
+    cmp_ = sub.add_parser("compare", help="Compara dois resultados JSON")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args()
+    return {"generate": cmd_generate, "run": cmd_run, "compare": cmd_compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
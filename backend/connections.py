@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Contagem de conexões FTP lendo /proc/net/tcp{,6} diretamente
+"""
+import os
+import socket
+import struct
+import logging
+from typing import Dict, Any, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+PROC_TCP_FILES = ("/proc/net/tcp", "/proc/net/tcp6")
+TCP_ESTABLISHED = "01"
+# Porta de dados do modo ativo (connect_from_port_20)
+FTP_ACTIVE_DATA_PORT = 20
+
+
+def _decode_address(hex_addr: str) -> str:
+    """Decode a /proc/net/tcp address (host byte order, 32-bit words) to text"""
+    if len(hex_addr) == 8:
+        return socket.inet_ntop(socket.AF_INET, struct.pack("=I", int(hex_addr, 16)))
+    words = [int(hex_addr[i:i + 8], 16) for i in range(0, 32, 8)]
+    addr = socket.inet_ntop(socket.AF_INET6, struct.pack("=4I", *words))
+    # IPv4 mapeado em IPv6 (::ffff:a.b.c.d) é reportado como IPv4
+    if addr.startswith("::ffff:") and "." in addr:
+        return addr[7:]
+    return addr
+
+
+def _empty_sample() -> Dict[str, Any]:
+    return {"control": 0, "data": 0, "per_ip": {}}
+
+
+def sample_from_proc(control_port: int, passive_range: Tuple[int, int]) -> Dict[str, Any]:
+    """Count established FTP control/data connections from /proc/net/tcp and tcp6.
+
+    Only the state and local port columns are inspected for every socket; the
+    remote address is decoded just for the matching ones.
+    """
+    pasv_min, pasv_max = passive_range
+    sample = _empty_sample()
+    per_ip = sample["per_ip"]
+    for path in PROC_TCP_FILES:
+        try:
+            with open(path, "r") as f:
+                next(f, None)  # cabeçalho
+                for line in f:
+                    fields = line.split(None, 4)
+                    if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                        continue
+                    local_port = int(fields[1].rsplit(":", 1)[1], 16)
+                    if local_port == control_port:
+                        sample["control"] += 1
+                        remote_ip = _decode_address(fields[2].rsplit(":", 1)[0])
+                        per_ip[remote_ip] = per_ip.get(remote_ip, 0) + 1
+                    elif pasv_min <= local_port <= pasv_max or local_port == FTP_ACTIVE_DATA_PORT:
+                        sample["data"] += 1
+        except FileNotFoundError:
+            continue
+    return sample
+
+
+def sample_from_psutil(control_port: int, passive_range: Tuple[int, int]) -> Dict[str, Any]:
+    """Fallback for hosts without /proc (slower: walks and resolves every socket)"""
+    pasv_min, pasv_max = passive_range
+    sample = _empty_sample()
+    per_ip = sample["per_ip"]
+    for conn in psutil.net_connections(kind='tcp'):
+        if conn.status != psutil.CONN_ESTABLISHED or not conn.laddr:
+            continue
+        port = conn.laddr.port
+        if port == control_port:
+            sample["control"] += 1
+            if conn.raddr:
+                per_ip[conn.raddr.ip] = per_ip.get(conn.raddr.ip, 0) + 1
+        elif pasv_min <= port <= pasv_max or port == FTP_ACTIVE_DATA_PORT:
+            sample["data"] += 1
+    return sample
+
+
+def sample_connections(control_port: int, passive_range: Tuple[int, int]) -> Dict[str, Any]:
+    """Return control/data connection counts and per-remote-IP control counts"""
+    if os.path.exists(PROC_TCP_FILES[0]):
+        return sample_from_proc(control_port, passive_range)
+    return sample_from_psutil(control_port, passive_range)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Reconstrução agrupada (debounce) do banco de usuários do vsftpd
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RebuildScheduler:
+    """Coalesce user-database rebuild requests into batches.
+
+    Each `schedule()` call waits until no new request has arrived for `delay`
+    seconds (but never more than `max_delay` after the first request of the
+    batch), then one rebuild runs for the whole batch and every caller gets
+    its result. Requests arriving while a rebuild runs go to the next batch.
+    """
+
+    def __init__(self, rebuild: Callable[[], Awaitable[tuple[bool, str]]],
+                 delay: float = 0.5, max_delay: float = 5.0):
+        self._rebuild = rebuild
+        self.delay = delay
+        self.max_delay = max_delay
+        self._waiters: List[asyncio.Future] = []
+        self._first_request: Optional[float] = None
+        self._deadline = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def schedule(self) -> tuple[bool, str]:
+        """Request a rebuild and wait for the batch that includes it"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append(future)
+        now = loop.time()
+        if self._first_request is None:
+            self._first_request = now
+        self._deadline = min(now + self.delay, self._first_request + self.max_delay)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # O prazo pode ser adiado por novos pedidos enquanto esperamos
+            while (remaining := self._deadline - loop.time()) > 0:
+                await asyncio.sleep(remaining)
+            waiters, self._waiters = self._waiters, []
+            self._first_request = None
+            logger.info(f"Rebuilding user database for {len(waiters)} queued change(s)")
+            try:
+                result = await self._rebuild()
+            except Exception as e:
+                logger.error(f"Error rebuilding user database: {e}")
+                result = (False, str(e))
+            for future in waiters:
+                if not future.done():
+                    future.set_result(result)
+            if not self._waiters:
+                self._task = None
+                return
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Listagem paginada (cursor) dos diretórios dos usuários, com cache invalidado pelo mtime do diretório
+"""
+import base64
+import binascii
+import itertools
+import json
+import os
+import stat
+import threading
+import time
+import logging
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SORTS = ("none", "name", "-name", "size", "-size", "mtime", "-mtime")
+# Tamanho/mtime dos arquivos não mudam o mtime do diretório: listagens mais velhas que isso são refeitas
+MAX_AGE = 30.0
+# Total de entradas em cache somando todos os diretórios
+MAX_CACHED_ENTRIES = 1_000_000
+
+# (nome, tipo, tamanho, mtime)
+Entry = Tuple[str, str, Optional[int], float]
+
+
+class PathOutsideHome(ValueError):
+    """The requested path resolves outside the user's home directory"""
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed or belongs to another sort order"""
+
+
+def resolve_under(root: str, relative: str) -> str:
+    """Absolute real path of `relative` inside `root`; symlinks leaving `root` are refused"""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative.lstrip("/")))
+    if os.path.commonpath([root, path]) != root:
+        raise PathOutsideHome(relative)
+    return path
+
+
+def _entry(entry: os.DirEntry) -> Entry:
+    # No Linux o DirEntry guarda o lstat feito aqui; o tipo vem do próprio readdir
+    st = entry.stat(follow_symlinks=False)
+    if stat.S_ISDIR(st.st_mode):
+        return entry.name, "dir", None, st.st_mtime
+    if stat.S_ISLNK(st.st_mode):
+        return entry.name, "link", st.st_size, st.st_mtime
+    if stat.S_ISREG(st.st_mode):
+        return entry.name, "file", st.st_size, st.st_mtime
+    return entry.name, "other", st.st_size, st.st_mtime
+
+
+def _sort_key(sort: str):
+    field = sort.lstrip("-")
+    if field == "name":
+        return lambda e: (e[0],)
+    if field == "size":
+        # Diretórios (sem tamanho) antes dos arquivos vazios
+        return lambda e: (-1 if e[2] is None else e[2], e[0])
+    return lambda e: (e[3], e[0])
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(data, dict) or data.get("s") != sort:
+        raise InvalidCursor(cursor)
+    return data
+
+
+class Listing:
+    """Every entry of one directory as of `version`, plus the sorted views built from it"""
+    __slots__ = ("version", "entries", "listed_at", "_views", "_lock")
+
+    def __init__(self, version: tuple, entries: List[Entry]):
+        self.version = version
+        self.entries = entries
+        self.listed_at = time.monotonic()
+        # ordenação -> (entradas em ordem crescente, chaves para bisect)
+        self._views: Dict[str, Tuple[List[Entry], List[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def view(self, sort: str) -> Tuple[List[Entry], List[tuple]]:
+        field = sort.lstrip("-")
+        with self._lock:
+            view = self._views.get(field)
+            if view is None:
+                key = _sort_key(field)
+                ordered = sorted(self.entries, key=key)
+                view = self._views[field] = (ordered, [key(e) for e in ordered])
+            return view
+
+
+class DirectoryBrowser:
+    """Cursor-paginated directory listings built on os.scandir.
+
+    sort=none pages through directory order straight from scandir and stops
+    after the page, so the first page of a huge directory costs only
+    `limit` entries. Sorted pages need the whole directory once; that
+    listing is cached until the directory's (inode, mtime) changes or it is
+    older than MAX_AGE, and later pages are found by bisecting on the last
+    key of the previous one, so they stay correct when entries come and go.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_ENTRIES, max_age: float = MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Listing]" = OrderedDict()
+        self._cached_entries = 0
+        # Um único scandir completo por diretório, mesmo com requisições simultâneas
+        self._building: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def _version(path: str) -> tuple:
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            raise NotADirectoryError(path)
+        return st.st_ino, st.st_mtime_ns
+
+    def _cached(self, path: str, version: tuple) -> Optional[Listing]:
+        with self._lock:
+            listing = self._cache.get(path)
+            if listing is None:
+                return None
+            if listing.version != version or time.monotonic() - listing.listed_at > self.max_age:
+                self._drop(path)
+                return None
+            self._cache.move_to_end(path)
+            return listing
+
+    def _drop(self, path: str):
+        listing = self._cache.pop(path)
+        self._cached_entries -= len(listing.entries)
+
+    def _listing(self, path: str, version: tuple) -> Tuple[Listing, bool]:
+        listing = self._cached(path, version)
+        if listing is not None:
+            return listing, True
+        with self._lock:
+            build_lock = self._building.setdefault(path, threading.Lock())
+        try:
+            with build_lock:
+                # Outra requisição pode ter acabado de montar a mesma listagem
+                listing = self._cached(path, version)
+                if listing is not None:
+                    return listing, True
+                entries = []
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            entries.append(_entry(entry))
+                        except FileNotFoundError:
+                            continue
+                listing = Listing(version, entries)
+                self._store(path, listing)
+        finally:
+            with self._lock:
+                self._building.pop(path, None)
+        return listing, False
+
+    def _store(self, path: str, listing: Listing):
+        if len(listing.entries) > self.max_entries:
+            return
+        with self._lock:
+            if path in self._cache:
+                self._drop(path)
+            self._cache[path] = listing
+            self._cached_entries += len(listing.entries)
+            while self._cached_entries > self.max_entries:
+                self._drop(next(iter(self._cache)))
+
+    def _stream(self, path: str, offset: int, limit: int) -> Tuple[List[Entry], bool]:
+        page: List[Entry] = []
+        with os.scandir(path) as it:
+            for entry in itertools.islice(it, offset, None):
+                if len(page) == limit:
+                    return page, True
+                try:
+                    page.append(_entry(entry))
+                except FileNotFoundError:
+                    continue
+        return page, False
+
+    def list(self, path: str, sort: str = "none", cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """One page of `path`; pass the returned `next_cursor` back (with the same sort) for the next"""
+        if sort not in SORTS:
+            raise ValueError(f"Invalid sort: {sort}")
+        state = decode_cursor(cursor, sort) if cursor else {}
+        version = self._version(path)
+        total: Optional[int] = None
+        cached = False
+
+        if sort == "none":
+            offset = state.get("o", 0)
+            if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+                raise InvalidCursor(cursor)
+            listing = self._cached(path, version)
+            if listing is not None:
+                cached = True
+                page = listing.entries[offset:offset + limit]
+                has_more = offset + limit < len(listing.entries)
+                total = len(listing.entries)
+            else:
+                page, has_more = self._stream(path, offset, limit)
+            next_state = {"s": sort, "o": offset + len(page)}
+        else:
+            listing, cached = self._listing(path, version)
+            ordered, keys = listing.view(sort)
+            total = len(ordered)
+            try:
+                after = None
+                if "k" in state:
+                    if not isinstance(state["k"], list):
+                        raise TypeError(state["k"])
+                    after = tuple(state["k"])
+                if not sort.startswith("-"):
+                    start = bisect_right(keys, after) if after is not None else 0
+                    page = ordered[start:start + limit]
+                    has_more = start + limit < total
+                else:
+                    end = bisect_left(keys, after) if after is not None else total
+                    page = ordered[max(0, end - limit):end][::-1]
+                    has_more = end - limit > 0
+            except TypeError:
+                # Chave de outro formato (cursor adulterado)
+                raise InvalidCursor(cursor)
+            next_state = {"s": sort, "k": list(_sort_key(sort)(page[-1]))} if page else None
+
+        return {
+            "sort": sort,
+            "entries": [
+                {"name": name, "type": kind, "size": size,
+                 "mtime": datetime.fromtimestamp(mtime).isoformat()}
+                for name, kind, size, mtime in page
+            ],
+            "total": total,
+            "cached": cached,
+            "next_cursor": encode_cursor(next_state) if has_more and next_state else None,
+        }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Camada de execução: tira I/O bloqueante, psutil e subprocessos do event loop
+"""
+import asyncio
+import contextvars
+import functools
+import time
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from profiling import record_phase
+from telemetry import COMMAND_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Máximo de operações simultâneas por tipo; o que não está listado usa "default"
+OPERATION_LIMITS: Dict[str, int] = {
+    "default": 4,
+    "stats": 4,
+    "psutil": 2,
+    "logs": 4,
+    "users": 4,
+    "config": 1,
+    "config_apply": 1,
+    "command": 4,
+    "db_load": 1,
+    "usage": 1,
+    "log_index": 1,
+    "log_ingest": 1,
+    "archive": 2,
+    "profile": 1,
+    "jobs": 4,
+    "job_work": 2,
+    "browse": 4,
+}
+
+# Timeout padrão (segundos) por tipo de operação
+OPERATION_TIMEOUTS: Dict[str, float] = {
+    "default": 30.0,
+    "stats": 10.0,
+    "psutil": 10.0,
+    "logs": 30.0,
+    "command": 30.0,
+    "db_load": 120.0,
+    # Aplicar o vsftpd.conf pode reiniciar o serviço: systemctl (30s) + porta de volta (5s), e no erro
+    # outro restart para restaurar (30s); com folga para outro worker segurando o lock do arquivo
+    "config_apply": 150.0,
+    "usage": 3600.0,
+    "log_index": 3600.0,
+    # Leitura inicial do log atual (janela de retenção) na partida
+    "log_ingest": 3600.0,
+    "archive": 300.0,
+    "profile": 90.0,
+    "jobs": 30.0,
+    # Remoção de árvores enormes roda em job, sem cliente esperando
+    "job_work": 24 * 3600.0,
+}
+
+# Fase (no detalhamento de requisições lentas) de cada tipo de operação
+OPERATION_PHASES: Dict[str, str] = {
+    "logs": "file_io",
+    "users": "file_io",
+    "config": "file_io",
+    "config_apply": "subprocess",
+    "usage": "file_io",
+    "psutil": "psutil",
+    "log_index": "log_parsing",
+    "log_ingest": "log_parsing",
+    "archive": "log_parsing",
+    "job_work": "file_io",
+    "browse": "file_io",
+}
+
+# Cabe todos os limites ao mesmo tempo: um tipo de operação nunca espera thread de outro
+IO_POOL_SIZE = int(os.environ.get("FTP_IO_POOL_SIZE", str(sum(OPERATION_LIMITS.values()))))
+
+_io_pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="ftp-io")
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class OperationTimeout(Exception):
+    """Raised when an offloaded operation exceeds its timeout"""
+
+    def __init__(self, operation: str, timeout: float):
+        super().__init__(f"Operation '{operation}' timed out after {timeout:.0f}s")
+        self.operation = operation
+        self.timeout = timeout
+
+
+def _semaphore(operation: str) -> asyncio.Semaphore:
+    # Tipos não listados dividem o limite "default", para o total de threads ficar limitado
+    if operation not in OPERATION_LIMITS:
+        operation = "default"
+    sem = _semaphores.get(operation)
+    if sem is None:
+        sem = _semaphores[operation] = asyncio.Semaphore(OPERATION_LIMITS[operation])
+    return sem
+
+
+def _release_when_done(sem: asyncio.Semaphore, future: asyncio.Future):
+    def done(finished: asyncio.Future):
+        sem.release()
+        # Resultado de uma chamada que já expirou: ninguém mais o lê
+        if not finished.cancelled():
+            finished.exception()
+    future.add_done_callback(done)
+
+
+def _timeout_for(operation: str, timeout: Optional[float]) -> float:
+    if timeout is not None:
+        return timeout
+    return OPERATION_TIMEOUTS.get(operation, OPERATION_TIMEOUTS["default"])
+
+
+async def run_blocking(func: Callable[..., Any], *args, operation: str = "default",
+                       timeout: Optional[float] = None, **kwargs) -> Any:
+    """Run a blocking callable on the bounded I/O pool.
+
+    At most OPERATION_LIMITS[operation] calls of the same kind run at once,
+    so one slow kind of work cannot take every worker thread. A call that
+    times out keeps its slot until its thread actually finishes.
+    """
+    timeout = _timeout_for(operation, timeout)
+    loop = asyncio.get_running_loop()
+    queued = time.perf_counter()
+    sem = _semaphore(operation)
+    await sem.acquire()
+    started = time.perf_counter()
+    record_phase("executor_wait", started - queued)
+    try:
+        # Leva o contexto (trace da requisição) para a thread do pool
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(_io_pool, context.run, functools.partial(func, *args, **kwargs))
+    except BaseException:
+        sem.release()
+        raise
+    _release_when_done(sem, future)
+    try:
+        # shield: o timeout (ou o cancelamento da requisição) não marca a thread como encerrada
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Operation '{operation}' timed out after {timeout}s")
+        raise OperationTimeout(operation, timeout)
+    finally:
+        record_phase(OPERATION_PHASES.get(operation, operation), time.perf_counter() - started)
+
+
+async def run_command(command: str, check: bool = True, operation: str = "command",
+                      timeout: Optional[float] = None) -> tuple[bool, str]:
+    """Execute system command without blocking the event loop and return success status and output"""
+    timeout = _timeout_for(operation, timeout)
+    argv = command.split()
+    async with _semaphore(operation):
+        started = time.perf_counter()
+        try:
+            with COMMAND_DURATION.time(command=os.path.basename(argv[0]) if argv else ""):
+                return await _run_process(argv, check, timeout)
+        finally:
+            record_phase("subprocess", time.perf_counter() - started)
+
+
+async def _run_process(argv: List[str], check: bool, timeout: float) -> tuple[bool, str]:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except Exception as e:
+        return False, str(e)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False, "Command timeout"
+    if check and proc.returncode != 0:
+        return False, stderr.decode(errors='replace').strip()
+    return proc.returncode == 0, stdout.decode(errors='replace').strip()
+
+
+def shutdown():
+    _io_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Fila persistente (SQLite) de tarefas administrativas lentas, com pool de workers assíncronos
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Um job "running" sem heartbeat há mais que isso é de um processo que morreu: volta para a fila
+LEASE_SECONDS = 60.0
+HEARTBEAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 3
+STOP_GRACE = 0.2
+# Jobs concluídos ficam consultáveis por este tempo
+RETENTION_SECONDS = 7 * 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+
+class JobContext:
+    """What a handler sees: its parameters and a progress dict persisted on every heartbeat.
+
+    Progress survives restarts, so a resumed handler can skip steps it
+    already finished and keep accumulating counters. `add` may be called
+    from executor threads.
+    """
+
+    def __init__(self, job_id: str, kind: str, params: Dict[str, Any], progress: Dict[str, Any], attempt: int):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.attempt = attempt
+        self._progress = progress
+        self._lock = threading.Lock()
+        # Sinal para trabalho em threads (que não recebe o cancelamento da task) parar
+        self.stopping = threading.Event()
+
+    @property
+    def progress(self) -> Dict[str, Any]:
+        return self.snapshot()
+
+    def set(self, **values):
+        with self._lock:
+            self._progress.update(values)
+
+    def add(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._progress[key] = self._progress.get(key, 0) + delta
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self._progress))
+
+
+JobHandler = Callable[[JobContext], Awaitable[Any]]
+
+
+class JobQueue:
+    """Durable job queue with `workers` concurrent runners per process.
+
+    Jobs are claimed atomically (BEGIN IMMEDIATE), so several processes can
+    share the database. Runners hold a lease renewed by heartbeats; a job
+    whose owner died is requeued after LEASE_SECONDS and its handler resumes
+    with the persisted progress.
+    """
+
+    def __init__(self, db_path: str, workers: int = 2, poll_interval: float = 1.0):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Autocommit: as transações são explícitas
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    # --- API pública (assíncrona) ---
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        """Queue a job and return its id"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        await run_blocking(self._insert, job_id, kind, params, operation="jobs")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_blocking(self._get, job_id, operation="jobs")
+
+    async def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return await run_blocking(self._list, status, limit, operation="jobs")
+
+    def start(self):
+        """Start the runners in this process (submit works without them)"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    # --- Banco ---
+
+    def _insert(self, job_id: str, kind: str, params: Dict[str, Any]):
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+
+    def _row_to_dict(self, row) -> Dict[str, Any]:
+        (job_id, kind, params, status, progress, result, error, attempts,
+         created_at, started_at, finished_at) = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "params": json.loads(params),
+            "status": status,
+            "progress": json.loads(progress),
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    _COLUMNS = ("id, kind, params, status, progress, result, error, attempts, "
+                "created_at, started_at, finished_at")
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def _list(self, status: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        query = f"SELECT {self._COLUMNS} FROM jobs"
+        args: list = []
+        if status:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._connection().execute(query, args).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Requeue expired leases, then take the oldest queued job this process can run"""
+        now = time.time()
+        kinds = list(self._handlers)
+        if not kinds:
+            return None
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    """UPDATE jobs SET status = 'failed', finished_at = ?, owner = NULL,
+                              error = 'Abandoned after ' || attempts || ' interrupted attempts'
+                       WHERE status = 'running' AND heartbeat < ? AND attempts >= ?""",
+                    (now, now - LEASE_SECONDS, MAX_ATTEMPTS),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND heartbeat < ?",
+                    (now - LEASE_SECONDS,),
+                )
+                row = conn.execute(
+                    f"""SELECT id, kind, params, progress, attempts FROM jobs
+                        WHERE status = 'queued' AND kind IN ({','.join('?' * len(kinds))})
+                        ORDER BY created_at LIMIT 1""",
+                    kinds,
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        """UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?,
+                                  started_at = COALESCE(started_at, ?), attempts = attempts + 1
+                           WHERE id = ?""",
+                        (self.owner, now, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, kind, params, progress, attempts = row
+        return {"id": job_id, "kind": kind, "params": json.loads(params),
+                "progress": json.loads(progress), "attempt": attempts + 1}
+
+    def purge_finished(self) -> int:
+        """Delete jobs that finished more than RETENTION_SECONDS ago (periodic task)"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM jobs WHERE finished_at < ?", (time.time() - RETENTION_SECONDS,)
+            )
+        return cursor.rowcount
+
+    def _heartbeat(self, job_id: str, progress: Dict[str, Any]):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ? AND owner = ?",
+                (json.dumps(progress), time.time(), job_id, self.owner),
+            )
+
+    def _finish(self, job_id: str, status: str, progress: Dict[str, Any],
+                result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self._connection().execute(
+                """UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ?,
+                          owner = NULL, heartbeat = NULL
+                   WHERE id = ? AND owner = ?""",
+                (status, json.dumps(progress), None if result is None else json.dumps(result, default=str),
+                 error, time.time(), job_id, self.owner),
+            )
+
+    def _release(self, job_id: str, progress: Dict[str, Any]):
+        """Put an interrupted job back in the queue right away (clean shutdown)"""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'queued', progress = ?, owner = NULL, heartbeat = NULL "
+                "WHERE id = ? AND owner = ?",
+                (json.dumps(progress), job_id, self.owner),
+            )
+
+    # --- Execução ---
+
+    async def _work(self):
+        while True:
+            try:
+                job = await run_blocking(self._claim, operation="jobs")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]):
+        ctx = JobContext(job["id"], job["kind"], job["params"], job["progress"], job["attempt"])
+        logger.info(f"Job {ctx.id} ({ctx.kind}) started, attempt {ctx.attempt}")
+        task = asyncio.create_task(self._handlers[ctx.kind](ctx))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=HEARTBEAT_INTERVAL)
+                if done:
+                    break
+                await run_blocking(self._heartbeat, ctx.id, ctx.snapshot(), operation="jobs")
+        except asyncio.CancelledError:
+            ctx.stopping.set()
+            task.cancel()
+            # Dá um instante para o trabalho em threads parar e reportar o que já fez
+            await asyncio.sleep(STOP_GRACE)
+            # Encerramento: devolve à fila na hora em vez de esperar o lease expirar
+            await run_blocking(self._release, ctx.id, ctx.snapshot(), operation="jobs")
+            raise
+        try:
+            result = task.result()
+        except Exception as e:
+            logger.error(f"Job {ctx.id} ({ctx.kind}) failed: {e}")
+            await run_blocking(self._finish, ctx.id, "failed", ctx.snapshot(), error=str(e), operation="jobs")
+            return
+        logger.info(f"Job {ctx.id} ({ctx.kind}) succeeded")
+        await run_blocking(self._finish, ctx.id, "succeeded", ctx.snapshot(), result, operation="jobs")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Canal de eventos em tempo real (SSE) para linhas de log e métricas do dashboard
+"""
+import asyncio
+import json
+import os
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Set
+
+from executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Limite lido por ciclo; o restante fica para o próximo
+MAX_READ_PER_TICK = 1024 * 1024
+
+
+class Subscriber:
+    """One connected client with a bounded outgoing queue"""
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = False
+
+
+class LiveFeed:
+    """Follow the vsftpd log with a single watcher and fan events out to all subscribers.
+
+    The watcher stats the log every `poll_interval` seconds and reads only the
+    appended bytes. Metric snapshots are computed when the log changes (at
+    most every `min_stats_interval` seconds) and otherwise every
+    `stats_interval` seconds, regardless of how many clients are
+    connected; a snapshot marked `ready: false` is resent every
+    `min_stats_interval` seconds until it is complete. A subscriber whose
+    queue fills up is dropped instead of slowing down everybody else.
+    """
+
+    def __init__(self, path: str,
+                 stats_provider: Callable[[], Dict[str, Any]],
+                 recent_users_provider: Callable[[], Any],
+                 poll_interval: float = 1.0,
+                 stats_interval: float = 30.0,
+                 min_stats_interval: float = 2.0,
+                 max_queue: int = 256):
+        self.path = path
+        self.stats_provider = stats_provider
+        self.recent_users_provider = recent_users_provider
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.min_stats_interval = min_stats_interval
+        self.max_queue = max_queue
+        self._subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._partial = b""
+        self._last_stats: Optional[Dict[str, Any]] = None
+        self._last_recent_users: Any = None
+        self._last_stats_at = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.max_queue)
+        # Novo cliente recebe o último snapshot imediatamente
+        if self._last_stats is not None:
+            sub.queue.put_nowait(("stats", self._last_stats))
+        if self._last_recent_users is not None:
+            sub.queue.put_nowait(("recent-users", self._last_recent_users))
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    def publish(self, event: str, data: Any):
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Backpressure: cliente lento é desconectado
+                logger.warning("Dropping slow live-feed subscriber")
+                sub.dropped = True
+                self._subscribers.discard(sub)
+
+    async def _run(self):
+        # Começa no fim do arquivo: o histórico é servido por /api/logs/vsftpd
+        try:
+            st = os.stat(self.path)
+            self._inode, self._offset = st.st_ino, st.st_size
+        except FileNotFoundError:
+            pass
+
+        while True:
+            try:
+                changed = await run_blocking(self._read_new_lines, operation="logs")
+                if changed:
+                    self.publish("log", changed)
+                now = time.monotonic()
+                elapsed = now - self._last_stats_at
+                # Snapshot ainda sem a primeira coleta (ready=false): reenvia até ficar completo
+                pending = self._last_stats is not None and self._last_stats.get("ready") is False
+                due = elapsed >= self.stats_interval or ((changed or pending) and elapsed >= self.min_stats_interval)
+                if self._subscribers and due:
+                    await self._publish_metrics()
+                    self._last_stats_at = now
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Live feed watcher error: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _publish_metrics(self):
+        stats = await run_blocking(self.stats_provider, operation="stats")
+        self._last_stats = stats
+        self.publish("stats", stats)
+        recent_users = await run_blocking(self.recent_users_provider, operation="logs")
+        self._last_recent_users = recent_users
+        self.publish("recent-users", recent_users)
+
+    def _read_new_lines(self) -> Optional[Dict[str, Any]]:
+        """Read complete lines appended since the last tick, with their byte range"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if self._inode != st.st_ino or st.st_size < self._offset:
+            self._inode = st.st_ino
+            self._offset = 0
+            self._partial = b""
+        if st.st_size == self._offset:
+            return None
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(min(st.st_size - self._offset, MAX_READ_PER_TICK))
+        start = self._offset - len(self._partial)
+        self._offset += len(data)
+        data = self._partial + data
+        # Só publica linhas completas
+        cut = data.rfind(b"\n") + 1
+        self._partial = data[cut:]
+        if not cut:
+            return None
+        return {
+            "start": start,
+            "end": start + cut,
+            "inode": self._inode,
+            "text": data[:cut].decode('utf-8', errors='replace'),
+        }
+
+
+def format_sse(event: str, data: Any) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data, default=str)
+    lines = "".join(f"data: {line}\n" for line in payload.split("\n"))
+    return f"event: {event}\n{lines}\n"
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Análise contínua do log com memória limitada: arquivos, usuários e IPs mais ativos e clientes distintos
+"""
+import hashlib
+import heapq
+import math
+import threading
+import time
+import logging
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+from log_parser import LogRecord
+
+logger = logging.getLogger(__name__)
+
+# Itens acompanhados por bucket em cada sketch Space-Saving. Somando os buckets de uma janela,
+# o erro de cada item fica limitado a (eventos da janela) / capacidade: usuários são poucos e
+# baratos, então a capacidade cobre a maioria das instalações e o erro de 24h/7d fica pequeno
+FILE_CAPACITY = 100
+USER_CAPACITY = 500
+IP_CAPACITY = 100
+# 2^12 registradores (4 KiB) por HyperLogLog: erro padrão ~1,6%
+HLL_PRECISION = 12
+
+FINE = 300
+COARSE = 3600
+# Janela -> (resolução dos buckets usados, duração)
+WINDOWS = {
+    "1h": (FINE, 3600),
+    "24h": (COARSE, 86400),
+    "7d": (COARSE, 7 * 86400),
+}
+# Por quanto tempo os buckets de cada resolução são mantidos
+RETENTION = {FINE: 3600 + FINE, COARSE: 7 * 86400 + COARSE}
+# Quantos itens cada janela publica por ranking
+REPORT_TOP = 100
+BACKFILL_BATCH = 5000
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "big")
+
+
+class SpaceSaving:
+    """Top-K counter (Metwally et al.) that tracks at most `capacity` keys.
+
+    A new key evicts the current minimum and inherits its count as `error`,
+    so every reported count overestimates the true one by at most `error`,
+    and any key whose real count exceeds total/capacity is guaranteed to be
+    tracked. The minimum is found through a heap with lazy deletion.
+    """
+    __slots__ = ("capacity", "counts", "_heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # chave -> [contagem, erro, bytes]
+        self.counts: Dict[Hashable, List[int]] = {}
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    def add(self, key: Hashable, bytes_: int = 0):
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += 1
+            entry[2] += bytes_
+            heapq.heappush(self._heap, (entry[0], key))
+            if len(self._heap) > 4 * self.capacity:
+                self._compact()
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = [1, 0, bytes_]
+            heapq.heappush(self._heap, (1, key))
+            return
+        # Entradas antigas do heap ficam com contagem menor que a atual: descarta até achar uma válida
+        while True:
+            count, victim = heapq.heappop(self._heap)
+            victim_entry = self.counts.get(victim)
+            if victim_entry is not None and victim_entry[0] == count:
+                break
+        del self.counts[victim]
+        self.counts[key] = [count + 1, count, bytes_]
+        heapq.heappush(self._heap, (count + 1, key))
+
+    def _compact(self):
+        self._heap = [(entry[0], key) for key, entry in self.counts.items()]
+        heapq.heapify(self._heap)
+
+
+class HyperLogLog:
+    """Distinct-count estimator in 2^precision one-byte registers"""
+    __slots__ = ("precision", "registers")
+
+    _POWERS = [2.0 ** -rank for rank in range(65)]
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_hash(self, hashed: int):
+        width = 64 - self.precision
+        index = hashed >> width
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def copy(self) -> "HyperLogLog":
+        clone = HyperLogLog(self.precision)
+        clone.registers = bytearray(self.registers)
+        return clone
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(self._POWERS[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        # Correção para poucos elementos (contagem linear)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class _Bucket:
+    """Sketches for the records of one time slot"""
+    __slots__ = ("files", "users", "ips", "clients", "user_set", "records", "version")
+
+    def __init__(self):
+        self.files = SpaceSaving(FILE_CAPACITY)
+        self.users = SpaceSaving(USER_CAPACITY)
+        self.ips = SpaceSaving(IP_CAPACITY)
+        self.clients = HyperLogLog()
+        self.user_set = HyperLogLog()
+        self.records = 0
+        # Muda a cada registro: invalida o resumo em cache das janelas que incluem o bucket
+        self.version = 0
+
+
+class _MergedCounts:
+    """Space-Saving counters of several buckets summed, keeping the overestimate guarantee.
+
+    A key a full bucket does not track may still have occurred there up to
+    that bucket's minimum tracked count, so that minimum is added to the
+    key's count and error. `floor` sums the minimums of every merged
+    bucket; each entry remembers the part of it from buckets that did
+    track the key, and the rest is added when the counts are read.
+    Keys are ranked by their guaranteed count (count - error), which the
+    floor does not inflate, and keys whose error exceeds that guaranteed
+    count are left out: with no real heavy hitters (e.g. every file
+    transferred about as often) the ranking is empty instead of noise.
+    """
+    __slots__ = ("counts", "floor")
+
+    def __init__(self):
+        # chave -> [contagem, erro, bytes, soma dos mínimos dos buckets que rastreavam a chave]
+        self.counts: Dict[Hashable, List[int]] = {}
+        self.floor = 0
+
+    def copy(self) -> "_MergedCounts":
+        clone = _MergedCounts()
+        clone.counts = {key: list(entry) for key, entry in self.counts.items()}
+        clone.floor = self.floor
+        return clone
+
+    def add(self, sketch: SpaceSaving):
+        # Sketch que não encheu rastreou todas as chaves que viu: as ausentes tiveram contagem 0
+        minimum = min(entry[0] for entry in sketch.counts.values()) if len(sketch.counts) >= sketch.capacity else 0
+        self.floor += minimum
+        for key, (count, error, bytes_) in sketch.counts.items():
+            entry = self.counts.get(key)
+            if entry is None:
+                self.counts[key] = [count, error, bytes_, minimum]
+            else:
+                entry[0] += count
+                entry[1] += error
+                entry[2] += bytes_
+                entry[3] += minimum
+
+    def top(self, limit: int) -> List[Tuple[Hashable, Tuple[int, int, int]]]:
+        """(key, (count, error, bytes)) of the `limit` largest guaranteed counts (count - error)"""
+        floor = self.floor
+        reliable = ((key, entry) for key, entry in self.counts.items()
+                    if entry[1] + floor - entry[3] <= entry[0] - entry[1])
+        largest = heapq.nlargest(limit, reliable, key=lambda item: item[1][0] - item[1][1])
+        return [(key, (count + floor - seen, error + floor - seen, bytes_))
+                for key, (count, error, bytes_, seen) in largest]
+
+
+class _Summary:
+    """Several buckets merged for one query"""
+    __slots__ = ("files", "users", "ips", "clients", "user_set", "records")
+
+    def __init__(self):
+        self.files = _MergedCounts()
+        self.users = _MergedCounts()
+        self.ips = _MergedCounts()
+        self.clients = HyperLogLog()
+        self.user_set = HyperLogLog()
+        self.records = 0
+
+    def copy(self) -> "_Summary":
+        clone = _Summary()
+        clone.files = self.files.copy()
+        clone.users = self.users.copy()
+        clone.ips = self.ips.copy()
+        clone.clients = self.clients.copy()
+        clone.user_set = self.user_set.copy()
+        clone.records = self.records
+        return clone
+
+    def add(self, bucket: _Bucket):
+        self.files.add(bucket.files)
+        self.users.add(bucket.users)
+        self.ips.add(bucket.ips)
+        self.clients.merge(bucket.clients)
+        self.user_set.merge(bucket.user_set)
+        self.records += bucket.records
+
+
+class LogAnalytics:
+    """Heavy hitters and distinct counts over sliding 1h/24h/7d windows, fed from the log-ingest path.
+
+    Records land in 5-minute buckets (for the last hour) and hourly buckets
+    (for 24h and 7d), each holding fixed-size Space-Saving and HyperLogLog
+    sketches, so memory depends on the number of buckets and not on how
+    many distinct paths, users or IPs the log has. Windows are rounded to
+    bucket boundaries. Counts are estimates: each item reports the most it
+    may be overcounted by (`error`), and items with more error than
+    guaranteed count are not reported.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, Dict[int, _Bucket]] = {FINE: {}, COARSE: {}}
+        self._backfilled = False
+        # janela -> (chave dos buckets fechados, resumo deles)
+        self._closed: Dict[str, Tuple[tuple, _Summary]] = {}
+
+    def apply_record(self, record: LogRecord):
+        """Account one parsed log record (log listener)"""
+        with self._lock:
+            self._add(record, time.time())
+
+    def _add(self, record: LogRecord, now: float):
+        if not record.remote_host:
+            return
+        transfer = record.is_transfer and record.ok and record.user
+        client_hash = _hash64(record.remote_host)
+        user_hash = _hash64(record.user) if record.user else None
+        for resolution, buckets in self._buckets.items():
+            if record.timestamp < now - RETENTION[resolution]:
+                continue
+            start = int(record.timestamp // resolution * resolution)
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = _Bucket()
+                self._expire(resolution, now)
+            bucket.ips.add(record.remote_host)
+            bucket.clients.add_hash(client_hash)
+            if user_hash is not None:
+                bucket.user_set.add_hash(user_hash)
+            if transfer:
+                bucket.files.add((record.user, record.path or ""), record.bytes)
+                bucket.users.add(record.user, record.bytes)
+            bucket.records += 1
+            bucket.version += 1
+
+    def _expire(self, resolution: int, now: float):
+        buckets = self._buckets[resolution]
+        cutoff = now - RETENTION[resolution]
+        for start in [start for start in buckets if start + resolution <= cutoff]:
+            del buckets[start]
+
+    def backfill(self, records: Iterable[LogRecord]):
+        """Account history read elsewhere (rotated logs), once per process; skips newer calls"""
+        if self._backfilled:
+            return 0
+        self._backfilled = True
+        added = 0
+        batch: List[LogRecord] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= BACKFILL_BATCH:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        logger.info(f"Log analytics backfilled with {added} records")
+        return added
+
+    def _add_batch(self, batch: List[LogRecord]) -> int:
+        now = time.time()
+        with self._lock:
+            for record in batch:
+                self._add(record, now)
+        return len(batch)
+
+    def _summary(self, window: str, now: float) -> _Summary:
+        resolution, duration = WINDOWS[window]
+        with self._lock:
+            self._expire(resolution, now)
+            current = int(now // resolution * resolution)
+            selected = sorted((start, bucket) for start, bucket in self._buckets[resolution].items()
+                              if start + resolution > now - duration)
+            closed = [(start, bucket) for start, bucket in selected if start < current]
+            key = tuple((start, bucket.version) for start, bucket in closed)
+            cached = self._closed.get(window)
+            if cached is not None and cached[0] == key:
+                summary = cached[1].copy()
+            else:
+                # Buckets fechados raramente mudam: o resumo deles é reaproveitado entre consultas
+                base = _Summary()
+                for _, bucket in closed:
+                    base.add(bucket)
+                self._closed[window] = (key, base)
+                summary = base.copy()
+            for start, bucket in selected:
+                if start >= current:
+                    summary.add(bucket)
+        return summary
+
+    def report(self, limit: int = REPORT_TOP) -> Dict[str, Any]:
+        """Top files, users and IPs plus distinct counts for every window"""
+        now = time.time()
+        result: Dict[str, Any] = {}
+        for window in WINDOWS:
+            summary = self._summary(window, now)
+            result[window] = {
+                "events": summary.records,
+                "distinct_clients": summary.clients.count(),
+                "distinct_users": summary.user_set.count(),
+                "top_files": [
+                    {"user": user, "path": path, "transfers": count, "error": error, "bytes": bytes_}
+                    for (user, path), (count, error, bytes_) in summary.files.top(limit)
+                ],
+                "top_users": [
+                    {"user": user, "transfers": count, "error": error, "bytes": bytes_}
+                    for user, (count, error, bytes_) in summary.users.top(limit)
+                ],
+                "top_ips": [
+                    {"ip": ip, "events": count, "error": error}
+                    for ip, (count, error, _) in summary.ips.top(limit)
+                ],
+            }
+        return result
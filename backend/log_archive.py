@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Histórico completo do log: arquivo atual + rotacionados (.N, .N.gz, .N.zst) como um só fluxo
+"""
+import os
+import math
+import heapq
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from log_parser import LogRecord, parse_line
+from log_reader import iter_lines_reverse, list_segments, open_segment
+
+logger = logging.getLogger(__name__)
+
+# Linhas lidas nas pontas de um segmento para achar o primeiro/último horário
+BOUNDARY_PROBE_LINES = 100
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class TransferSummary:
+    """Mergeable aggregate of successful transfers (one per segment, then combined)"""
+    __slots__ = ("transfers", "upload_bytes", "download_bytes", "transfer_seconds", "durations",
+                 "user_counts", "user_bytes", "last_access")
+
+    def __init__(self):
+        self.transfers = 0
+        self.upload_bytes = 0
+        self.download_bytes = 0
+        self.transfer_seconds = 0.0
+        self.durations: List[float] = []
+        self.user_counts: Dict[str, int] = {}
+        self.user_bytes: Dict[str, int] = {}
+        self.last_access: Dict[str, float] = {}
+
+    def add(self, record: LogRecord):
+        self.transfers += 1
+        if record.action == "UPLOAD":
+            self.upload_bytes += record.bytes
+        else:
+            self.download_bytes += record.bytes
+        self.transfer_seconds += record.seconds
+        self.durations.append(record.seconds)
+        username = record.user
+        self.user_counts[username] = self.user_counts.get(username, 0) + 1
+        self.user_bytes[username] = self.user_bytes.get(username, 0) + record.bytes
+        if record.timestamp > self.last_access.get(username, 0.0):
+            self.last_access[username] = record.timestamp
+
+    def merge(self, other: "TransferSummary"):
+        self.transfers += other.transfers
+        self.upload_bytes += other.upload_bytes
+        self.download_bytes += other.download_bytes
+        self.transfer_seconds += other.transfer_seconds
+        self.durations.extend(other.durations)
+        for username, count in other.user_counts.items():
+            self.user_counts[username] = self.user_counts.get(username, 0) + count
+            self.user_bytes[username] = self.user_bytes.get(username, 0) + other.user_bytes[username]
+            if other.last_access[username] > self.last_access.get(username, 0.0):
+                self.last_access[username] = other.last_access[username]
+
+    def activity(self) -> Dict[str, Any]:
+        """Same shape as LogIngestor.snapshot()"""
+        return {
+            "transfers": self.transfers,
+            "user_activity": {
+                username: {
+                    "last_access": datetime.fromtimestamp(self.last_access[username]),
+                    "transfers": count,
+                    "bytes": self.user_bytes[username],
+                }
+                for username, count in self.user_counts.items()
+            },
+        }
+
+    def throughput(self, window_seconds: float, top: int = 10) -> Dict[str, Any]:
+        """Byte totals, MB/s, p50/p95 transfer duration and top users by bytes"""
+        durations = sorted(self.durations)
+        total_bytes = self.upload_bytes + self.download_bytes
+        return {
+            "window_hours": window_seconds / 3600,
+            "transfers": self.transfers,
+            "upload_bytes": self.upload_bytes,
+            "download_bytes": self.download_bytes,
+            "total_bytes": total_bytes,
+            # Média no período inteiro vs. taxa efetiva enquanto havia transferência
+            "average_mbps": round(total_bytes / window_seconds / 1_000_000, 3) if window_seconds else 0.0,
+            "transfer_mbps": (round(total_bytes / self.transfer_seconds / 1_000_000, 3)
+                              if self.transfer_seconds else 0.0),
+            "duration_p50": round(_percentile(durations, 0.50), 3),
+            "duration_p95": round(_percentile(durations, 0.95), 3),
+            "top_users": [
+                {"username": username, "bytes": size}
+                for username, size in heapq.nlargest(top, self.user_bytes.items(), key=lambda item: item[1])
+            ],
+        }
+
+
+def _first_timestamp(lines) -> Optional[float]:
+    for count, line in enumerate(lines):
+        if count >= BOUNDARY_PROBE_LINES:
+            break
+        record = parse_line(line if isinstance(line, str) else line.decode('utf-8', errors='replace'))
+        if record is not None:
+            return record.timestamp
+    return None
+
+
+class LogArchive:
+    """The live vsftpd log and its logrotate siblings, read as one time-ordered stream.
+
+    Each segment's first and last timestamps are cached by (inode, mtime,
+    size), so a query skips segments outside its window without opening
+    them again. Compressed segments are decompressed incrementally; zstd
+    needs the optional `zstandard` package.
+    """
+
+    def __init__(self, path: str, workers: int = 4):
+        self.path = path
+        self.workers = workers
+        self._lock = threading.Lock()
+        # caminho -> ((inode, mtime, tamanho), primeiro horário, último horário)
+        self._bounds: Dict[str, Tuple[tuple, Optional[float], Optional[float]]] = {}
+
+    def _segment_bounds(self, path: str) -> Tuple[Optional[float], Optional[float]]:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._bounds.get(path)
+        if cached and cached[0] == key:
+            return cached[1], cached[2]
+
+        with open_segment(path) as f:
+            first = _first_timestamp(f)
+        if path.endswith((".gz", ".zst")):
+            # Sem leitura reversa em arquivo comprimido: percorre uma vez e guarda no cache
+            last = None
+            with open_segment(path) as f:
+                for raw in f:
+                    record = parse_line(raw.decode('utf-8', errors='replace'))
+                    if record is not None:
+                        last = record.timestamp
+        else:
+            last = _first_timestamp(iter_lines_reverse(path))
+        with self._lock:
+            self._bounds[path] = (key, first, last)
+        return first, last
+
+    def segments(self, start: Optional[float] = None, end: Optional[float] = None) -> List[str]:
+        """Segments (oldest first) whose time range can overlap [start, end)"""
+        selected = []
+        paths = list_segments(self.path)
+        with self._lock:
+            for stale in set(self._bounds) - set(paths):
+                del self._bounds[stale]
+        for path in paths:
+            try:
+                first, last = self._segment_bounds(path)
+            except (OSError, EOFError) as e:
+                logger.warning(f"Skipping unreadable log segment {path}: {e}")
+                continue
+            if start is not None and last is not None and last < start:
+                continue
+            if end is not None and first is not None and first >= end:
+                continue
+            selected.append(path)
+        return selected
+
+    @staticmethod
+    def _iter_segment(path: str, start: Optional[float], end: Optional[float]) -> Iterator[LogRecord]:
+        with open_segment(path) as f:
+            for raw in f:
+                record = parse_line(raw.decode('utf-8', errors='replace'))
+                if record is None:
+                    continue
+                if start is not None and record.timestamp < start:
+                    continue
+                if end is not None and record.timestamp >= end:
+                    continue
+                yield record
+
+    def iter_records(self, start: Optional[float] = None, end: Optional[float] = None,
+                     include_live: bool = True) -> Iterator[LogRecord]:
+        """Yield parsed records in [start, end) from the oldest segment to the live file"""
+        for path in self.segments(start, end):
+            if include_live or path != self.path:
+                yield from self._iter_segment(path, start, end)
+
+    def map_segments(self, func: Callable[[Iterator[LogRecord]], Any],
+                     start: Optional[float] = None, end: Optional[float] = None) -> List[Any]:
+        """Apply `func` to each overlapping segment's records in parallel; results in segment order"""
+        paths = self.segments(start, end)
+        if len(paths) <= 1:
+            return [func(self._iter_segment(path, start, end)) for path in paths]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(paths)),
+                                thread_name_prefix="log-archive") as pool:
+            return list(pool.map(lambda path: func(self._iter_segment(path, start, end)), paths))
+
+    def transfer_summary(self, start: Optional[float] = None, end: Optional[float] = None) -> TransferSummary:
+        """Aggregate successful transfers in [start, end) across all segments"""
+        def summarize(records: Iterator[LogRecord]) -> TransferSummary:
+            summary = TransferSummary()
+            for record in records:
+                if record.is_transfer and record.ok and record.user:
+                    summary.add(record)
+            return summary
+
+        total = TransferSummary()
+        for partial in self.map_segments(summarize, start, end):
+            total.merge(partial)
+        return total
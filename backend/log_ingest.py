@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Ingestão incremental do vsftpd.log
+"""
+import os
+import heapq
+import math
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from log_archive import TransferSummary
+from log_parser import LogRecord, parse_line
+from log_reader import timestamp_offset
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _duration_key(seconds: float) -> str:
+    # 3 algarismos significativos: exato para o tempo inteiro do xferlog, <0,5% de erro no resto
+    return f"{seconds:.3g}"
+
+
+class LogIngestor:
+    """Follow a vsftpd log file and keep a rolling aggregate of transfers.
+
+    Only bytes appended since the last refresh are parsed. The (inode, offset)
+    cursor is reset when the file is rotated (inode change) or truncated
+    (size smaller than the offset). The first read of the process
+    (`catch_up`) starts at the first line of the retention window, found by
+    binary search, or earlier when `resume` reports that a listener still
+    needs older lines of the same file. Until it finishes, `refresh` returns
+    at once, so periodic callers never do the cold read themselves.
+    """
+
+    def __init__(self, path: str, window: timedelta = timedelta(hours=24),
+                 resume: Optional[Callable[[int], Optional[int]]] = None):
+        self.path = path
+        self.window = window
+        # inode -> offset a partir do qual algum listener ainda precisa das linhas desse arquivo
+        self._resume = resume
+        # _read_lock: um leitor do arquivo por vez; _lock: agregados (tomado por bloco lido)
+        self._read_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._partial = b""
+        # (inode, offset logo após a linha) do registro sendo entregue aos listeners
+        self._position: Tuple[Optional[int], int] = (None, 0)
+        # LogRecord de cada transferência, em ordem de chegada
+        self._events: deque = deque()
+        self._user_counts: Dict[str, int] = {}
+        self._user_bytes: Dict[str, int] = {}
+        self._last_access: Dict[str, float] = {}
+        # Outros consumidores recebem cada registro novo uma única vez, já interpretado
+        self._listeners: List[Callable[[LogRecord], None]] = []
+        self.ready = False
+        # Horário da primeira linha lida nesta execução: o que é anterior vem do histórico (log_archive)
+        self.start_timestamp: Optional[float] = None
+
+    def add_listener(self, callback: Callable[[LogRecord], None]):
+        """Register a callback invoked with every newly parsed log record"""
+        self._listeners.append(callback)
+
+    @property
+    def position(self) -> Tuple[Optional[int], int]:
+        """(inode, end offset) of the line being dispatched; listeners may use it to dedupe across restarts"""
+        return self._position
+
+    def catch_up(self) -> int:
+        """First read of the process (startup task); return how many transfers were added"""
+        with self._read_lock:
+            started = time.time()
+            added = self._read_new_lines()
+            if self.start_timestamp is None:
+                self.start_timestamp = started
+            with self._lock:
+                self._expire(datetime.now())
+            self.ready = True
+        logger.info(f"Log ingest: caught up on {self.path} in {time.time() - started:.1f}s ({added} transfers)")
+        return added
+
+    def refresh(self) -> int:
+        """Parse lines appended since the last call; return how many transfers were added.
+
+        Returns 0 without reading before `catch_up` finished or while another
+        refresh is reading.
+        """
+        if not self.ready or not self._read_lock.acquire(blocking=False):
+            return 0
+        try:
+            added = self._read_new_lines()
+            with self._lock:
+                self._expire(datetime.now())
+            return added
+        finally:
+            self._read_lock.release()
+
+    def _initial_offset(self, inode: int) -> int:
+        offset = timestamp_offset(self.path, time.time() - self.window.total_seconds())
+        needed = self._resume(inode) if self._resume else None
+        if needed is not None and needed < offset:
+            logger.info(f"Log ingest: replaying {offset - needed} bytes of {self.path} not yet stored")
+            offset = needed
+        return offset
+
+    def _read_new_lines(self) -> int:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+
+        if self._inode != st.st_ino or st.st_size < self._offset:
+            if self._inode is None:
+                self._offset = self._initial_offset(st.st_ino)
+            else:
+                logger.info(f"{self.path} rotated or truncated, restarting from offset 0")
+                self._offset = 0
+            self._inode = st.st_ino
+            self._partial = b""
+
+        if st.st_size == self._offset:
+            return 0
+
+        added = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                line_start = self._offset - len(self._partial)
+                self._offset += len(chunk)
+                data = self._partial + chunk
+                lines = data.split(b"\n")
+                # Última linha pode estar incompleta; guarda para a próxima leitura
+                self._partial = lines.pop()
+                # Agregados travados por bloco: consultas não esperam a leitura inteira
+                with self._lock:
+                    for raw in lines:
+                        line_start += len(raw) + 1
+                        record = parse_line(raw.decode('utf-8', errors='replace'))
+                        if record is None:
+                            continue
+                        if self.start_timestamp is None:
+                            self.start_timestamp = record.timestamp
+                        if self._ingest_record(record):
+                            added += 1
+                        self._position = (self._inode, line_start)
+                        for listener in self._listeners:
+                            try:
+                                listener(record)
+                            except Exception as e:
+                                logger.error(f"Log listener error: {e}")
+        return added
+
+    def _ingest_record(self, record: LogRecord) -> bool:
+        if not record.is_transfer or not record.ok or not record.user:
+            return False
+        if record.timestamp < datetime.now().timestamp() - self.window.total_seconds():
+            return False
+
+        username = record.user
+        self._events.append(record)
+        self._user_counts[username] = self._user_counts.get(username, 0) + 1
+        self._user_bytes[username] = self._user_bytes.get(username, 0) + record.bytes
+        if username not in self._last_access or record.timestamp > self._last_access[username]:
+            self._last_access[username] = record.timestamp
+        return True
+
+    def _expire(self, now: datetime):
+        cutoff = (now - self.window).timestamp()
+        events = self._events
+        while events and events[0].timestamp < cutoff:
+            record = events.popleft()
+            username = record.user
+            remaining = self._user_counts[username] - 1
+            if remaining:
+                self._user_counts[username] = remaining
+                self._user_bytes[username] -= record.bytes
+            else:
+                del self._user_counts[username]
+                del self._user_bytes[username]
+                del self._last_access[username]
+
+    def _window_records(self, hours: Optional[int]) -> List[LogRecord]:
+        if hours is None or hours >= self.window.total_seconds() / 3600:
+            return list(self._events)
+        cutoff = datetime.now().timestamp() - hours * 3600
+        records = []
+        for record in reversed(self._events):
+            if record.timestamp < cutoff:
+                break
+            records.append(record)
+        return records
+
+    def snapshot(self, hours: Optional[int] = None) -> Dict[str, Any]:
+        """Return transfer count and per-user activity for the last `hours` (capped at the window)"""
+        with self._lock:
+            window_hours = self.window.total_seconds() / 3600
+            if hours is None or hours >= window_hours:
+                return {
+                    "transfers": len(self._events),
+                    "user_activity": {
+                        username: {
+                            "last_access": datetime.fromtimestamp(self._last_access[username]),
+                            "transfers": count,
+                            "bytes": self._user_bytes[username],
+                        }
+                        for username, count in self._user_counts.items()
+                    },
+                }
+
+            # Janela menor que a retenção: percorre apenas a cauda recente
+            records = self._window_records(hours)
+        user_activity: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            data = user_activity.setdefault(record.user, {"last_access": record.timestamp, "transfers": 0, "bytes": 0})
+            data["transfers"] += 1
+            data["bytes"] += record.bytes
+            if record.timestamp > data["last_access"]:
+                data["last_access"] = record.timestamp
+        for data in user_activity.values():
+            data["last_access"] = datetime.fromtimestamp(data["last_access"])
+        return {"transfers": len(records), "user_activity": user_activity}
+
+    def throughput(self, hours: Optional[int] = None, top: int = 10) -> Dict[str, Any]:
+        """Byte totals, MB/s, p50/p95 transfer duration and top users by bytes for the last `hours`"""
+        with self._lock:
+            records = self._window_records(hours)
+        window_seconds = min(hours * 3600, self.window.total_seconds()) if hours else self.window.total_seconds()
+        summary = TransferSummary()
+        for record in records:
+            summary.add(record)
+        return summary.throughput(window_seconds, top)
+
+    def throughput_hours(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Mergeable per-hour partials of the last `hours`, newest first (see `merge_throughput_hours`)"""
+        now = datetime.now().timestamp()
+        with self._lock:
+            records = self._window_records(hours)
+        partials = [
+            {"transfers": 0, "upload_bytes": 0, "download_bytes": 0, "transfer_seconds": 0.0,
+             "durations": {}, "user_bytes": {}}
+            for _ in range(hours)
+        ]
+        for record in records:
+            age = int((now - record.timestamp) // 3600)
+            if not 0 <= age < hours:
+                continue
+            partial = partials[age]
+            partial["transfers"] += 1
+            partial["upload_bytes" if record.action == "UPLOAD" else "download_bytes"] += record.bytes
+            partial["transfer_seconds"] += record.seconds
+            key = _duration_key(record.seconds)
+            partial["durations"][key] = partial["durations"].get(key, 0) + 1
+            partial["user_bytes"][record.user] = partial["user_bytes"].get(record.user, 0) + record.bytes
+        return partials
+
+
+def merge_throughput_hours(partials: List[Dict[str, Any]], hours: int, top: int = 10) -> Dict[str, Any]:
+    """Same result as `LogIngestor.throughput(hours, top)` from the newest `hours` published partials"""
+    selected = partials[:hours]
+    transfers = upload_bytes = download_bytes = 0
+    transfer_seconds = 0.0
+    durations: Dict[float, int] = {}
+    user_bytes: Dict[str, int] = {}
+    for partial in selected:
+        transfers += partial["transfers"]
+        upload_bytes += partial["upload_bytes"]
+        download_bytes += partial["download_bytes"]
+        transfer_seconds += partial["transfer_seconds"]
+        for key, count in partial["durations"].items():
+            durations[float(key)] = durations.get(float(key), 0) + count
+        for username, size in partial["user_bytes"].items():
+            user_bytes[username] = user_bytes.get(username, 0) + size
+
+    ordered = sorted(durations.items())
+
+    def percentile(fraction: float) -> float:
+        # Mesmo critério (nearest-rank) de log_archive._percentile, sobre o histograma
+        rank = max(1, math.ceil(fraction * transfers))
+        seen = 0
+        for value, count in ordered:
+            seen += count
+            if seen >= rank:
+                return value
+        return 0.0
+
+    window_seconds = hours * 3600
+    total_bytes = upload_bytes + download_bytes
+    return {
+        "window_hours": window_seconds / 3600,
+        "transfers": transfers,
+        "upload_bytes": upload_bytes,
+        "download_bytes": download_bytes,
+        "total_bytes": total_bytes,
+        "average_mbps": round(total_bytes / window_seconds / 1_000_000, 3),
+        "transfer_mbps": round(total_bytes / transfer_seconds / 1_000_000, 3) if transfer_seconds else 0.0,
+        "duration_p50": round(percentile(0.50), 3),
+        "duration_p95": round(percentile(0.95), 3),
+        "top_users": [
+            {"username": username, "bytes": size}
+            for username, size in heapq.nlargest(top, user_bytes.items(), key=lambda item: item[1])
+        ],
+    }
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Parser único para os formatos de log do vsftpd (xferlog padrão e nativo)
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+# xferlog padrão (xferlog_std_format=YES):
+# "Fri Oct 17 10:00:00 2026 3 1.2.3.4 1048576 /dir/file b _ i r alice ftp 0 * c"
+XFERLOG_RE = re.compile(
+    r'^\w{3} (\w{3}\s+\d+ \d+:\d+:\d+ \d{4}) (\d+) (\S+) (\d+) (.+) '
+    r'[ab] \S+ ([ioad]) [agr] (\S+) \S+ \d \S+ ([ci])$'
+)
+# Nativo (xferlog_std_format=NO / log_ftp_protocol=YES):
+# "Fri Oct 17 10:00:00 2026 [pid 123] [alice] OK UPLOAD: Client "1.2.3.4", "/file", 1048576 bytes, 341.33Kbyte/sec"
+NATIVE_RE = re.compile(
+    r'^\w{3} (\w{3}\s+\d+ \d+:\d+:\d+ \d{4}) \[pid (\d+)\] (?:\[([^\]]*)\] )?(.*)$'
+)
+# Mesmo corpo, via syslog (syslog_enable=YES): "Oct 17 10:00:00 host vsftpd[123]: [alice] OK UPLOAD: ..."
+SYSLOG_RE = re.compile(
+    r'^(\w{3}\s+\d+ \d+:\d+:\d+) \S+ vsftpd\[(\d+)\]: (?:\[([^\]]*)\] )?(.*)$'
+)
+NATIVE_BODY_RE = re.compile(
+    r'^(?:(OK|FAIL) )?([A-Za-z ]+?): Client "([^"]*)"(?:, "((?:[^"\\]|\\.)*)")?'
+    r'(?:, "((?:[^"\\]|\\.)*)")?(?:, (\d+) bytes, ([\d.]+)Kbyte/sec)?'
+)
+
+XFERLOG_DIRECTIONS = {"i": "UPLOAD", "o": "DOWNLOAD", "d": "DELETE"}
+
+
+def parse_syslog_timestamp(timestamp_str: str, now: Optional[datetime] = None) -> datetime:
+    """Parse a year-less "Mon DD HH:MM:SS" timestamp.
+
+    The year is taken from `now`, unless that puts the entry more than a day
+    in the future (a December line read in January), then it is last year.
+    """
+    now = now or datetime.now()
+    timestamp = datetime.strptime(f"{now.year} {timestamp_str}", "%Y %b %d %H:%M:%S")
+    if timestamp > now + timedelta(days=1):
+        timestamp = timestamp.replace(year=now.year - 1)
+    return timestamp
+
+
+class LogRecord:
+    """One parsed vsftpd log event.
+
+    `action` is the vsftpd verb (UPLOAD, DOWNLOAD, DELETE, LOGIN, CONNECT,
+    FTP command, ...); `ok` is False for FAIL entries and incomplete
+    xferlog transfers. `timestamp` is a Unix epoch.
+    """
+    __slots__ = ("timestamp", "pid", "user", "ok", "action", "remote_host", "path",
+                 "target", "bytes", "seconds")
+
+    def __init__(self, timestamp: float, pid: Optional[int], user: Optional[str], ok: bool,
+                 action: str, remote_host: str, path: Optional[str] = None,
+                 target: Optional[str] = None, bytes_: int = 0, seconds: float = 0.0):
+        self.timestamp = timestamp
+        self.pid = pid
+        self.user = user
+        self.ok = ok
+        self.action = action
+        self.remote_host = remote_host
+        self.path = path
+        self.target = target
+        self.bytes = bytes_
+        self.seconds = seconds
+
+    @property
+    def is_transfer(self) -> bool:
+        return self.action in ("UPLOAD", "DOWNLOAD")
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "pid": self.pid,
+            "user": self.user,
+            "ok": self.ok,
+            "action": self.action,
+            "remote_host": self.remote_host,
+            "path": self.path,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def _parse_native_body(timestamp: float, pid: str, user: Optional[str], body: str) -> Optional[LogRecord]:
+    match = NATIVE_BODY_RE.match(body)
+    if not match:
+        return None
+    status, action, client, path, target, size, rate = match.groups()
+    bytes_ = int(size) if size else 0
+    seconds = 0.0
+    if rate:
+        kbps = float(rate)
+        seconds = bytes_ / 1024 / kbps if kbps > 0 else 0.0
+    return LogRecord(timestamp, int(pid), user or None, status != "FAIL", action, client,
+                     path, target, bytes_, seconds)
+
+
+def parse_line(line: str) -> Optional[LogRecord]:
+    """Parse one vsftpd log line in any supported format; None if it is not recognized"""
+    line = line.rstrip("\r\n")
+    if not line:
+        return None
+    try:
+        match = NATIVE_RE.match(line)
+        if match:
+            ts_str, pid, user, body = match.groups()
+            timestamp = datetime.strptime(ts_str, "%b %d %H:%M:%S %Y").timestamp()
+            return _parse_native_body(timestamp, pid, user, body)
+        match = XFERLOG_RE.match(line)
+        if match:
+            ts_str, seconds, host, size, path, direction, user, completion = match.groups()
+            timestamp = datetime.strptime(ts_str, "%b %d %H:%M:%S %Y").timestamp()
+            return LogRecord(timestamp, None, user, completion == "c",
+                             XFERLOG_DIRECTIONS.get(direction, direction), host, path,
+                             None, int(size), float(seconds))
+        match = SYSLOG_RE.match(line)
+        if match:
+            ts_str, pid, user, body = match.groups()
+            timestamp = parse_syslog_timestamp(ts_str).timestamp()
+            return _parse_native_body(timestamp, pid, user, body)
+    except ValueError:
+        return None
+    return None
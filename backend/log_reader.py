@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Leitura parcial de arquivos de log (tail e intervalos de bytes)
+"""
+import io
+import os
+import re
+import gzip
+from typing import BinaryIO, Iterator, List, Tuple
+
+from log_parser import parse_line
+
+try:
+    import zstandard
+except ImportError:  # opcional: só necessário para segmentos .zst
+    zstandard = None
+
+BLOCK_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Arquivos rotacionados pelo logrotate: vsftpd.log.1, vsftpd.log.2.gz, vsftpd.log.3.zst, ...
+ROTATED_SUFFIX_RE = re.compile(r'\.(\d+)(\.gz|\.zst)?$')
+
+
+def tail_offset(path: str, lines: int, block_size: int = BLOCK_SIZE) -> int:
+    """Return the byte offset where the last `lines` lines of the file start.
+
+    The file is read backwards from EOF in fixed-size blocks, so the cost
+    depends on the size of the tail, not of the file.
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if lines <= 0 or end == 0:
+            return end
+
+        pos = end
+        newlines = 0
+        # Um "\n" final não abre uma linha nova
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            newlines = -1
+
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            block = f.read(read_size)
+            idx = len(block)
+            while True:
+                idx = block.rfind(b"\n", 0, idx)
+                if idx == -1:
+                    break
+                newlines += 1
+                if newlines == lines:
+                    return pos + idx + 1
+        return 0
+
+
+def timestamp_offset(path: str, timestamp: float, block_size: int = BLOCK_SIZE) -> int:
+    """Return the byte offset of the first line stamped at or after `timestamp`.
+
+    The log is written in chronological order, so this is a binary search
+    over byte positions: only a few lines per probe are read, whatever the
+    size of the file. Lines that do not parse are skipped.
+    """
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        # Tudo antes de `low` (sempre um início de linha) é anterior a `timestamp`
+        low, high = 0, size
+        while high - low > block_size:
+            middle = (low + high) // 2
+            # Completa a linha em que `middle` caiu; a sondagem começa na seguinte
+            f.seek(middle - 1)
+            f.readline()
+            end = f.tell()
+            probed = None
+            while end < high:
+                raw = f.readline()
+                if not raw:
+                    break
+                end += len(raw)
+                probed = parse_line(raw.decode('utf-8', errors='replace'))
+                if probed is not None:
+                    break
+            if probed is None or probed.timestamp >= timestamp:
+                high = middle
+            else:
+                low = end
+        f.seek(low)
+        offset = low
+        for raw in f:
+            record = parse_line(raw.decode('utf-8', errors='replace'))
+            if record is not None and record.timestamp >= timestamp:
+                return offset
+            offset += len(raw)
+        return offset
+
+
+def iter_lines_reverse(path: str, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Yield the lines of the file from last to first.
+
+    Blocks are read backwards from EOF, so a caller that stops after a few
+    lines only touches the end of the file. Lines are yielded without the
+    trailing newline.
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        # Pedaço de linha que começa antes do bloco atual
+        partial = b""
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            block = f.read(read_size) + partial
+            lines = block.split(b"\n")
+            partial = lines.pop(0)
+            for raw in reversed(lines):
+                if raw:
+                    yield raw.decode('utf-8', errors='replace')
+        if partial:
+            yield partial.decode('utf-8', errors='replace')
+
+
+def iter_range(path: str, start: int, end: int, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the bytes in [start, end) of the file in chunks of at most `chunk_size`"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def resolve_range(path: str, since_offset: int = None, tail: int = None,
+                  inode: int = None) -> Tuple[int, int, int, bool]:
+    """Compute the (start, end, inode) to serve and whether the cursor was reset.
+
+    A `since_offset` beyond EOF, or an `inode` different from the current
+    file's, means the log was truncated or rotated, so the read restarts from
+    the beginning of the new file.
+    """
+    st = os.stat(path)
+    end = st.st_size
+    reset = False
+    if since_offset is not None:
+        start = since_offset
+        if start > end or (inode is not None and inode != st.st_ino):
+            start = 0
+            reset = True
+    elif tail is not None:
+        start = tail_offset(path, tail)
+    else:
+        start = 0
+    return start, end, st.st_ino, reset
+
+
+def list_segments(path: str) -> List[str]:
+    """Return the live log and its rotated siblings, oldest first"""
+    directory = os.path.dirname(path) or "."
+    base = os.path.basename(path)
+    rotated = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if not name.startswith(base + "."):
+            continue
+        match = ROTATED_SUFFIX_RE.fullmatch(name[len(base):])
+        if match:
+            rotated.append((int(match.group(1)), os.path.join(directory, name)))
+    segments = [p for _n, p in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def is_compressed(path: str) -> bool:
+    return path.endswith((".gz", ".zst"))
+
+
+def open_segment(path: str) -> BinaryIO:
+    """Open a log segment for binary reading, decompressing .gz/.zst incrementally.
+
+    Offsets on the returned file are positions in the uncompressed stream;
+    compressed segments only seek forward cheaply.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"{path}: install the 'zstandard' package to read .zst logs")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(reader)
+    return open(path, 'rb')
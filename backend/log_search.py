@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Busca no vsftpd.log (e nos arquivos rotacionados) com índice esparso em SQLite
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple
+
+from log_parser import LogRecord, parse_line
+from log_reader import is_compressed, list_segments, open_segment
+
+logger = logging.getLogger(__name__)
+
+# Linhas por bloco: cada bloco tem um checkpoint (offset + faixa de horário). Pequeno para que
+# as postings de usuário/IP levem a poucas linhas além das que casam
+CHECKPOINT_LINES = 64
+READ_CHUNK_SIZE = 1024 * 1024
+# Grava o progresso da indexação a cada tantos blocos
+COMMIT_BLOCKS = 4096
+# Muda quando o formato do índice muda; um banco de outra versão é refeito do zero
+INDEX_VERSION = 2
+# Leitores de segmentos comprimidos mantidos abertos entre páginas da mesma busca
+MAX_OPEN_READERS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    indexed_offset INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0,
+    first_ts REAL,
+    last_ts REAL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    segment_id INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    min_ts REAL,
+    max_ts REAL,
+    PRIMARY KEY (segment_id, block)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    segment_id INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (kind, value, segment_id, block)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_ip(address: str) -> str:
+    """Strip the IPv4-mapped IPv6 prefix vsftpd logs for dual-stack listeners"""
+    return address[7:] if address.startswith("::ffff:") else address
+
+
+def segment_fingerprint(path: str) -> Optional[str]:
+    """Identify a segment by its first line, which survives rename and compression"""
+    try:
+        with open_segment(path) as f:
+            first_line = f.readline(4096)
+    except (OSError, EOFError):
+        return None
+    if not first_line.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first_line).hexdigest()
+
+
+def _coalesce(blocks: List[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+    """Merge byte-adjacent blocks into (start, end, block count) reads"""
+    merged: List[Tuple[int, int, int]] = []
+    for start, end in blocks:
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end, merged[-1][2] + 1)
+        else:
+            merged.append((start, end, 1))
+    return merged
+
+
+class LogFilter:
+    """Search criteria; matches() checks one parsed record and its raw line"""
+    __slots__ = ("user", "ip", "filename", "action", "ok", "text", "start", "end")
+
+    def __init__(self, user: Optional[str] = None, ip: Optional[str] = None,
+                 filename: Optional[str] = None, action: Optional[str] = None,
+                 ok: Optional[bool] = None, text: Optional[str] = None,
+                 start: Optional[float] = None, end: Optional[float] = None):
+        self.user = user
+        self.ip = normalize_ip(ip) if ip else None
+        self.filename = filename
+        self.action = action.upper() if action else None
+        self.ok = ok
+        self.text = text.lower() if text else None
+        self.start = start
+        self.end = end
+
+    def needles(self) -> List[bytes]:
+        """Byte strings every matching raw line contains (checked before parsing)"""
+        return [value.encode('utf-8', errors='surrogateescape') for value in (self.user, self.ip) if value]
+
+    def matches(self, record: LogRecord, line: str) -> bool:
+        if self.start is not None and record.timestamp < self.start:
+            return False
+        if self.end is not None and record.timestamp >= self.end:
+            return False
+        if self.user is not None and record.user != self.user:
+            return False
+        if self.ip is not None and normalize_ip(record.remote_host) != self.ip:
+            return False
+        if self.action is not None and record.action != self.action:
+            return False
+        if self.ok is not None and record.ok != self.ok:
+            return False
+        if self.filename is not None and (not record.path or self.filename not in record.path):
+            return False
+        if self.text is not None and self.text not in line.lower():
+            return False
+        return True
+
+
+class LogSearchIndex:
+    """Sparse index over the live vsftpd log and its rotated/compressed siblings.
+
+    Every CHECKPOINT_LINES lines form a block with its byte range and time
+    range; per-user and per-IP posting lists record which blocks mention
+    them. A query only reads the blocks that can contain a match, with
+    adjacent blocks merged into one read. Segments are identified by a hash
+    of their first line, so the index built for vsftpd.log survives its
+    rotation to vsftpd.log.1 and then .2.gz. Compressed segments can only
+    seek by decompressing up to the target, so their readers are kept open
+    and the next page of a search continues from where the last one stopped.
+    """
+
+    def __init__(self, log_path: str, db_path: str, checkpoint_lines: int = CHECKPOINT_LINES):
+        self.log_path = log_path
+        self.db_path = db_path
+        self.checkpoint_lines = checkpoint_lines
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (caminho, inode) -> leitor aberto de segmento comprimido, parado no fim da última leitura
+        self._readers: "OrderedDict[Tuple[str, int], BinaryIO]" = OrderedDict()
+        self._readers_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                # Blocos de outro tamanho: as postings antigas não valem mais
+                with self._conn:
+                    for table in ("segments", "blocks", "postings"):
+                        self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _open(self, path: str, position: int) -> Tuple[BinaryIO, Tuple[str, int]]:
+        """Reader for `path`, reusing a compressed one that has not gone past `position`"""
+        key = (path, os.stat(path).st_ino)
+        with self._readers_lock:
+            f = self._readers.pop(key, None)
+        if f is not None and f.tell() <= position:
+            return f, key
+        if f is not None:
+            f.close()
+        return open_segment(path), key
+
+    def _keep(self, key: Tuple[str, int], f: BinaryIO):
+        if not is_compressed(key[0]):
+            f.close()
+            return
+        with self._readers_lock:
+            self._readers[key] = f
+            while len(self._readers) > MAX_OPEN_READERS:
+                self._readers.popitem(last=False)[1].close()
+
+    def refresh(self) -> int:
+        """Index new segments and lines appended since the last call; return lines indexed"""
+        with self._lock:
+            conn = self._connection()
+            seen: Set[int] = set()
+            indexed = 0
+            for path in list_segments(self.log_path):
+                fingerprint = segment_fingerprint(path)
+                if fingerprint is None:
+                    continue
+                row = conn.execute(
+                    "SELECT id, indexed_offset, lines, complete FROM segments WHERE fingerprint = ?",
+                    (fingerprint,),
+                ).fetchone()
+                if row is None:
+                    with conn:
+                        cursor = conn.execute(
+                            "INSERT INTO segments (fingerprint, path) VALUES (?, ?)", (fingerprint, path)
+                        )
+                    row = (cursor.lastrowid, 0, 0, 0)
+                else:
+                    with conn:
+                        conn.execute("UPDATE segments SET path = ? WHERE id = ?", (path, row[0]))
+                segment_id, offset, lines, complete = row
+                seen.add(segment_id)
+                if not complete:
+                    indexed += self._index_segment(conn, segment_id, path, offset, lines,
+                                                   live=path == self.log_path)
+            self._forget_missing(conn, seen)
+            return indexed
+
+    def _forget_missing(self, conn: sqlite3.Connection, seen: Set[int]):
+        gone = [row[0] for row in conn.execute("SELECT id FROM segments") if row[0] not in seen]
+        if not gone:
+            return
+        with conn:
+            for segment_id in gone:
+                conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+                conn.execute("DELETE FROM blocks WHERE segment_id = ?", (segment_id,))
+                conn.execute("DELETE FROM postings WHERE segment_id = ?", (segment_id,))
+        logger.info(f"Log index: dropped {len(gone)} segment(s) no longer on disk")
+
+    def _index_segment(self, conn: sqlite3.Connection, segment_id: int, path: str,
+                       offset: int, lines: int, live: bool) -> int:
+        started_lines = lines
+        n = self.checkpoint_lines
+        # bloco -> [start_offset, end_offset, min_ts, max_ts]
+        blocks: Dict[int, List[Any]] = {}
+        postings: Set[Tuple[str, str, int]] = set()
+
+        def save(final: bool):
+            min_ts = min((b[2] for b in blocks.values() if b[2] is not None), default=None)
+            max_ts = max((b[3] for b in blocks.values() if b[3] is not None), default=None)
+            with conn:
+                conn.executemany(
+                    """INSERT INTO blocks (segment_id, block, start_offset, end_offset, min_ts, max_ts)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (segment_id, block) DO UPDATE SET
+                         end_offset = excluded.end_offset,
+                         min_ts = MIN(COALESCE(min_ts, excluded.min_ts), COALESCE(excluded.min_ts, min_ts)),
+                         max_ts = MAX(COALESCE(max_ts, excluded.max_ts), COALESCE(excluded.max_ts, max_ts))""",
+                    [(segment_id, block, *values) for block, values in blocks.items()],
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO postings (kind, value, segment_id, block) VALUES (?, ?, ?, ?)",
+                    [(kind, value, segment_id, block) for kind, value, block in postings],
+                )
+                conn.execute(
+                    """UPDATE segments SET indexed_offset = ?, lines = ?, complete = ?,
+                         first_ts = COALESCE(first_ts, ?),
+                         last_ts = MAX(COALESCE(last_ts, ?), COALESCE(?, last_ts))
+                       WHERE id = ?""",
+                    (offset, lines, int(final), min_ts, max_ts, max_ts, segment_id),
+                )
+            blocks.clear()
+            postings.clear()
+
+        def add_line(raw: bytes, terminated: bool = True):
+            nonlocal offset, lines
+            block = lines // n
+            entry = blocks.get(block)
+            if entry is None:
+                entry = blocks[block] = [offset, offset, None, None]
+            offset += len(raw) + int(terminated)
+            lines += 1
+            entry[1] = offset
+            record = parse_line(raw.decode('utf-8', errors='replace'))
+            if record is None:
+                return
+            if entry[2] is None or record.timestamp < entry[2]:
+                entry[2] = record.timestamp
+            if entry[3] is None or record.timestamp > entry[3]:
+                entry[3] = record.timestamp
+            if record.user:
+                postings.add(("user", record.user, block))
+            if record.remote_host:
+                postings.add(("ip", normalize_ip(record.remote_host), block))
+
+        with open_segment(path) as f:
+            f.seek(offset)
+            partial = b""
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = partial + chunk
+                raw_lines = data.split(b"\n")
+                partial = raw_lines.pop()
+                for raw in raw_lines:
+                    add_line(raw)
+                if len(blocks) >= COMMIT_BLOCKS:
+                    save(final=False)
+        # Segmento rotacionado não cresce mais: a última linha sem "\n" também conta
+        if partial and not live:
+            add_line(partial, terminated=False)
+        save(final=not live)
+        return lines - started_lines
+
+    def search(self, criteria: LogFilter, cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """Return up to `limit` matching records in log order and the cursor for the next page"""
+        after_segment, after_offset = 0, 0
+        if cursor:
+            try:
+                after_segment, after_offset = (int(part) for part in cursor.split(":", 1))
+            except ValueError:
+                raise ValueError("Invalid cursor")
+        with self._lock:
+            conn = self._connection()
+            segments = conn.execute(
+                """SELECT id, path FROM segments
+                   WHERE id >= ? AND (? IS NULL OR last_ts IS NULL OR last_ts >= ?)
+                     AND (? IS NULL OR first_ts IS NULL OR first_ts < ?)
+                   ORDER BY id""",
+                (after_segment, criteria.start, criteria.start, criteria.end, criteria.end),
+            ).fetchall()
+            plan = [(segment_id, path, _coalesce(self._candidate_blocks(
+                        conn, segment_id, criteria, after_offset if segment_id == after_segment else 0)))
+                    for segment_id, path in segments]
+
+        results: List[Dict[str, Any]] = []
+        scanned = 0
+        needles = criteria.needles()
+        for segment_id, path, blocks in plan:
+            if not blocks:
+                continue
+            min_offset = after_offset if segment_id == after_segment else 0
+            try:
+                f, key = self._open(path, max(blocks[0][0], min_offset))
+            except FileNotFoundError:
+                continue
+            try:
+                for start_offset, end_offset, count in blocks:
+                    scanned += count
+                    position = max(start_offset, min_offset)
+                    f.seek(position)
+                    data = f.read(end_offset - position)
+                    for raw in data.split(b"\n"):
+                        position += len(raw) + 1
+                        if not raw or any(needle not in raw for needle in needles):
+                            continue
+                        line = raw.decode('utf-8', errors='replace')
+                        record = parse_line(line)
+                        if record is None or not criteria.matches(record, line):
+                            continue
+                        results.append({**record.to_dict(), "segment": os.path.basename(path)})
+                        if len(results) >= limit:
+                            # A próxima página começa aqui: o leitor fica parado nesse ponto
+                            f.seek(min(position, end_offset))
+                            self._keep(key, f)
+                            return {"results": results, "next_cursor": f"{segment_id}:{position}",
+                                    "scanned_blocks": scanned}
+            except BaseException:
+                f.close()
+                raise
+            f.close()
+        return {"results": results, "next_cursor": None, "scanned_blocks": scanned}
+
+    def _candidate_blocks(self, conn: sqlite3.Connection, segment_id: int, criteria: LogFilter,
+                          min_offset: int) -> List[Tuple[int, int]]:
+        query = ["SELECT start_offset, end_offset FROM blocks WHERE segment_id = ? AND end_offset > ?"]
+        params: List[Any] = [segment_id, min_offset]
+        if criteria.start is not None:
+            query.append("AND (max_ts IS NULL OR max_ts >= ?)")
+            params.append(criteria.start)
+        if criteria.end is not None:
+            query.append("AND (min_ts IS NULL OR min_ts < ?)")
+            params.append(criteria.end)
+        for kind, value in (("user", criteria.user), ("ip", criteria.ip)):
+            if value is not None:
+                query.append("AND block IN (SELECT block FROM postings WHERE kind = ? AND value = ? AND segment_id = ?)")
+                params.extend((kind, value, segment_id))
+        query.append("ORDER BY block")
+        return conn.execute(" ".join(query), params).fetchall()
@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from starlette.routing import Match
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import subprocess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
 import hashlib
+import hmac
+import heapq
 import os
-import re
 import json
+import signal
 import psutil
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
-import shutil
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
+from fastapi.encoders import jsonable_encoder
+from log_ingest import LogIngestor, merge_throughput_hours
+from log_archive import LogArchive
+from log_parser import parse_line
+from log_reader import resolve_range, iter_range, iter_lines_reverse
+from live_feed import LiveFeed, format_sse
+from metrics_collector import MetricsCollector, MetricPending
+from profiling import SlowRequestLog, SamplingProfiler, start_trace, current_trace, end_trace, to_collapsed, to_speedscope
+from telemetry import REGISTRY, CONTENT_TYPE, REQUEST_DURATION, REQUESTS_IN_FLIGHT, Gauge, timed
+from connections import sample_connections
+from process_tracker import VsftpdProcessTracker
+from user_store import UserStore, QuotaStore
+from usage_index import UsageIndex
+from transfer_stats import TransferStatsStore
+from session_tracker import SessionTracker
+from log_analytics import LogAnalytics, WINDOWS as ANALYTICS_WINDOWS, RETENTION as ANALYTICS_RETENTION
+from log_search import LogSearchIndex, LogFilter
+from db_rebuild import RebuildScheduler
+from shared_state import SharedState, SharedUsage, file_lock, async_file_lock
+from response_cache import ResponseCache, content_etag, respond, not_modified, etag_matches
+from jobs import JobQueue, JobContext
+from tree_removal import remove_tree
+from dir_browser import DirectoryBrowser, InvalidCursor, SORTS as BROWSE_SORTS, resolve_under
+from vsftpd_config import VsftpdConfigEngine, ConfigValidationError
+from executor import run_blocking, run_command, OperationTimeout, shutdown as shutdown_executor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,14 +51,51 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="FTP Manager API", version="1.0.0")
 
 # Middleware para log detalhado de requisições
+# Requisições lentas (com tempo por fase) e profiler sob demanda para diagnóstico
+slow_requests = SlowRequestLog()
+profiler = SamplingProfiler()
+
+def route_template(request: Request) -> str:
+    """Route path pattern (e.g. /api/users/{username}) to keep metric labels bounded"""
+    partial = None
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
 @app.middleware("http")
 async def log_requests(request, call_next):
     start_time = time.time()
-    response = await call_next(request)
+    route = route_template(request)
+    REQUESTS_IN_FLIGHT.inc(method=request.method, route=route)
+    trace_token = start_trace(request.method, request.url.path, route)
+    trace = current_trace()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        REQUESTS_IN_FLIGHT.dec(method=request.method, route=route)
+        REQUEST_DURATION.observe(time.time() - start_time, method=request.method, route=route, status=str(status))
+        end_trace(trace_token)
     process_time = (time.time() - start_time) * 1000
+    trace.duration_ms = process_time
+    trace.status = status
+    if slow_requests.offer(trace):
+        logger.warning(f"Slow request: {request.method} {request.url.path} {process_time:.2f}ms "
+                       f"{trace.to_dict()['phases']}")
     logger.info(f"{request.method} {request.url.path} {response.status_code} {process_time:.2f}ms")
     return response
 
+# Operação lenta demais: 504 em vez de prender o worker
+@app.exception_handler(OperationTimeout)
+async def operation_timeout_handler(request, exc: OperationTimeout):
+    logger.error(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # Documentação automática FastAPI
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
@@ -62,6 +126,12 @@ class UserInfo(BaseModel):
     home_dir: str
     quota_mb: int
     created_at: str
+    used_bytes: Optional[int] = None
+    file_count: Optional[int] = None
+    quota_percent: Optional[float] = None
+
+class BulkDeleteRequest(BaseModel):
+    usernames: List[str]
 
 class DashboardStats(BaseModel):
     active_users: int
@@ -80,112 +150,184 @@ class RecentUser(BaseModel):
     transfers: int
 
 # Configuration
-VIRTUAL_USERS_FILE = "/etc/vsftpd/virtual_users.txt"
-VIRTUAL_USERS_DB = "/etc/vsftpd/virtual_users.db"
-VSFTPD_LOG = "/var/log/vsftpd.log"
-FTP_HOME_BASE = "/home/ftpusers"
+# Caminhos podem ser sobrescritos pelo ambiente (ex.: benchmark com dados sintéticos)
+VIRTUAL_USERS_FILE = os.environ.get("VIRTUAL_USERS_FILE", "/etc/vsftpd/virtual_users.txt")
+VIRTUAL_USERS_DB = os.environ.get("VIRTUAL_USERS_DB", "/etc/vsftpd/virtual_users.db")
+QUOTAS_FILE = os.environ.get("QUOTAS_FILE", "/etc/vsftpd/user_quotas.json")
+VSFTPD_LOG = os.environ.get("VSFTPD_LOG", "/var/log/vsftpd.log")
+FTP_HOME_BASE = os.environ.get("FTP_HOME_BASE", "/home/ftpusers")
+VSFTPD_CONF = os.environ.get("VSFTPD_CONF", "/etc/vsftpd.conf")
+# Unidade do systemd que controla o vsftpd (reload/restart passam sempre por ela)
+VSFTPD_SERVICE = os.environ.get("VSFTPD_SERVICE", "vsftpd")
 CONFIG_FILE = "config.json"
+TRANSFER_STATS_DB = "transfer_stats.db"
+LOG_INDEX_DB = "log_index.db"
+JOBS_DB = "jobs.db"
+# Trechos do log maiores que isso são enviados em streaming, sem cache/compressão
+MAX_CACHED_LOG_RANGE = 1024 * 1024
+SHARED_STATE_DB = os.environ.get("FTP_SHARED_STATE_DB", "shared_state.db")
+
+# Papel do processo (ver start.py): "all" = processo único; "collector" = coleta e publica
+# métricas/uso de disco no estado compartilhado; "worker" = só serve HTTP lendo esse estado
+ROLE = os.environ.get("FTP_ROLE", "all")
+if ROLE not in ("all", "collector", "worker"):
+    raise RuntimeError(f"Invalid FTP_ROLE: {ROLE}")
+shared_state = SharedState(SHARED_STATE_DB) if ROLE != "all" else None
+
+DEFAULT_CONFIG = {
+    "ftp_port": 21,
+    "passive_ports": "40000-40100",
+    "max_clients": 50,
+    "max_per_ip": 10,
+    "log_level": "detalhado",
+    "ssl_enabled": True,
+    "ssl_cert_file": "/etc/ssl/cert.pem",
+    "ssl_key_file": "/etc/ssl/key.pem",
+    "default_quota_mb": 100,
+    "dashboard_theme": "auto",
+    "language": "pt-BR"
+}
+
+# Índice dos usuários virtuais, recarregado quando o arquivo muda
+user_store = UserStore(VIRTUAL_USERS_FILE)
+
+# Quotas por usuário e uso de disco indexado (crawl inicial + eventos do log)
+quota_store = QuotaStore(QUOTAS_FILE)
+usage_index = UsageIndex(FTP_HOME_BASE)
+# Workers leem o uso publicado pelo coletor em vez de varrer /home
+usage_reader = SharedUsage(shared_state) if ROLE == "worker" else usage_index
+
+# PID do master do vsftpd em cache; só varre processos quando ele some
+process_tracker = VsftpdProcessTracker()
+
+# Ingestão incremental do log (mantém offset/inode entre requisições). Na partida lê só a janela
+# de 24h, ou desde o ponto que o histórico de transferências ainda não gravou
+log_ingestor = LogIngestor(VSFTPD_LOG, window=timedelta(hours=24),
+                           resume=lambda inode: transfer_stats.resume_offset(inode))
+log_ingestor.add_listener(usage_index.apply_record)
+
+# Histórico de transferências em buckets, alimentado pelo mesmo ingestor
+transfer_stats = TransferStatsStore(TRANSFER_STATS_DB, position=lambda: log_ingestor.position)
+log_ingestor.add_listener(transfer_stats.apply_record)
+
+# Sessões FTP (quem está conectado e fazendo o quê) a partir do log de protocolo
+session_tracker = SessionTracker()
+log_ingestor.add_listener(session_tracker.apply_record)
+
+# Rankings (arquivos, usuários, IPs) e clientes distintos em sketches de tamanho fixo
+log_analytics = LogAnalytics()
+log_ingestor.add_listener(log_analytics.apply_record)
+
+# Janelas maiores que as 24h em memória são lidas do log atual + rotacionados
+log_archive = LogArchive(VSFTPD_LOG)
+
+# Índice de busca do log (inclui arquivos rotacionados e .gz)
+log_search = LogSearchIndex(VSFTPD_LOG, LOG_INDEX_DB)
 
 # Utility functions
 def hash_password(password: str) -> str:
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
-def run_command(command: str, check: bool = True) -> tuple[bool, str]:
-    """Execute system command and return success status and output"""
+def file_version(path: str) -> Optional[tuple]:
+    """Identify a file's current version by (inode, mtime, size); None if missing"""
     try:
-        result = subprocess.run(command.split(), capture_output=True, text=True, timeout=30)
-        if check and result.returncode != 0:
-            return False, result.stderr.strip()
-        return result.returncode == 0, result.stdout.strip()
-    except subprocess.TimeoutExpired:
-        return False, "Command timeout"
-    except Exception as e:
-        return False, str(e)
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
+@timed("get_vsftpd_status", phase="psutil")
 def get_vsftpd_status() -> Dict[str, Any]:
     """Get vsftpd server status and information"""
     try:
-        # Check if vsftpd process is running
-        for proc in psutil.process_iter(['pid', 'name', 'create_time']):
-            if 'vsftpd' in proc.info['name']:
-                uptime_seconds = time.time() - proc.info['create_time']
-                uptime_str = str(timedelta(seconds=int(uptime_seconds)))
-                
-                return {
-                    "status": "online",
-                    "version": "vsftpd v3.0.5",
-                    "uptime": uptime_str,
-                    "pid": proc.info['pid']
-                }
-        
-        return {
-            "status": "offline",
-            "version": "vsftpd v3.0.5",
-            "uptime": "0",
-            "pid": None
-        }
+        return process_tracker.status()
     except Exception as e:
         logger.error(f"Error getting vsftpd status: {e}")
         return {
             "status": "unknown",
-            "version": "vsftpd v3.0.5",
+            "version": process_tracker.version,
             "uptime": "0",
             "pid": None
         }
 
-def get_active_connections() -> int:
-    """Get number of active FTP connections"""
+def collect_ftp_sessions() -> Dict[str, Any]:
+    """Sessions rebuilt from the protocol log, cross-checked with the last process sample"""
+    log_ingestor.refresh()
+    processes, sampled_at = metrics.get("sessions"), metrics.updated_at("sessions")
+    if processes is None:
+        # Primeira passada: ainda não há amostra de processos
+        sampled_at = time.time()
+        processes = get_vsftpd_sessions()
+    session_tracker.reconcile(processes, sampled_at)
+    return session_tracker.snapshot()
+
+def online_users() -> Optional[set]:
+    """Users with an open FTP session; None when the log has no session events (xferlog only)"""
+    snapshot = metrics.get("ftp_sessions")
+    if not snapshot or not snapshot["tracking"]:
+        return None
+    return set(snapshot["online_users"])
+
+def get_vsftpd_sessions() -> List[Dict[str, Any]]:
+    """Get vsftpd child session processes with their CPU and memory usage"""
+    try:
+        return process_tracker.sessions()
+    except Exception as e:
+        logger.error(f"Error getting vsftpd sessions: {e}")
+        return []
+
+def load_config() -> Dict[str, Any]:
+    """Load config.json, falling back to the defaults"""
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            return {**DEFAULT_CONFIG, **json.load(f)}
+    except Exception:
+        return dict(DEFAULT_CONFIG)
+
+def get_ftp_ports(config: Dict[str, Any]) -> tuple[int, tuple[int, int]]:
+    """Return the configured control port and passive port range"""
+    passive = str(config.get("passive_ports", "40000-40100")).split("-")
+    return int(config.get("ftp_port", 21)), (int(passive[0]), int(passive[-1]))
+
+@timed("get_connection_sample", phase="psutil")
+def get_connection_sample() -> Dict[str, Any]:
+    """Get FTP control/data connection counts and per-IP control connections"""
     try:
-        # Count active connections on port 21
-        connections = psutil.net_connections(kind='inet')
-        active_ftp = sum(1 for conn in connections 
-                        if conn.laddr.port == 21 and conn.status == 'ESTABLISHED')
-        return active_ftp
+        config = load_config()
+        control_port, passive_range = get_ftp_ports(config)
+        sample = sample_connections(control_port, passive_range)
+        max_per_ip = int(config.get("max_per_ip", 10))
+        sample["over_limit"] = {ip: n for ip, n in sample["per_ip"].items() if n >= max_per_ip}
+        return sample
     except Exception as e:
         logger.error(f"Error getting active connections: {e}")
-        return 0
+        return {"control": 0, "data": 0, "per_ip": {}, "over_limit": {}}
 
+@timed("parse_vsftpd_logs", phase="log_parsing")
 def parse_vsftpd_logs(hours: int = 24) -> Dict[str, Any]:
     """Parse vsftpd logs for transfer statistics and recent activity"""
     try:
         if not os.path.exists(VSFTPD_LOG):
             return {"transfers": 0, "recent_users": []}
         
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        transfers = 0
-        user_activity = {}
+        if timedelta(hours=hours) > log_ingestor.window:
+            # Além da janela em memória: agrega o histórico rotacionado
+            snapshot = log_archive.transfer_summary(time.time() - hours * 3600).activity()
+        else:
+            # Only the bytes appended since the last call are parsed
+            log_ingestor.refresh()
+            snapshot = log_ingestor.snapshot(hours)
+        transfers = snapshot["transfers"]
+        user_activity = snapshot["user_activity"]
         
-        with open(VSFTPD_LOG, 'r') as f:
-            for line in f:
-                # Parse log line for timestamp and user activity
-                # vsftpd log format: timestamp [pid] username info
-                match = re.match(r'(\w+\s+\d+\s+\d+:\d+:\d+).*?\[(\d+)\]\s+(\w+).*?(UPLOAD|DOWNLOAD)', line)
-                if match:
-                    timestamp_str, pid, username, action = match.groups()
-                    try:
-                        # Parse timestamp (assumes current year)
-                        timestamp = datetime.strptime(f"{datetime.now().year} {timestamp_str}", "%Y %b %d %H:%M:%S")
-                        
-                        if timestamp >= cutoff_time:
-                            transfers += 1
-                            
-                            if username not in user_activity:
-                                user_activity[username] = {
-                                    "last_access": timestamp,
-                                    "transfers": 0,
-                                    "status": "offline"
-                                }
-                            
-                            user_activity[username]["transfers"] += 1
-                            if timestamp > user_activity[username]["last_access"]:
-                                user_activity[username]["last_access"] = timestamp
-                    except ValueError:
-                        continue
+        # Top 10 recent users, without sorting every active user
+        most_recent = heapq.nlargest(10, user_activity.items(), key=lambda item: item[1]["last_access"])
         
         # Convert to recent users format
+        online = online_users()
         recent_users = []
-        for username, data in user_activity.items():
+        for username, data in most_recent:
             time_diff = datetime.now() - data["last_access"]
             if time_diff.total_seconds() < 300:  # 5 minutes
                 last_access = "Agora"
@@ -199,6 +341,9 @@ def parse_vsftpd_logs(hours: int = 24) -> Dict[str, Any]:
             else:
                 last_access = f"{int(time_diff.days)}d atrás"
                 status = "offline"
+            if online is not None:
+                # Com o log de protocolo, "online" é ter uma sessão aberta
+                status = "online" if username in online else "offline"
             
             recent_users.append({
                 "name": username,
@@ -207,18 +352,16 @@ def parse_vsftpd_logs(hours: int = 24) -> Dict[str, Any]:
                 "transfers": data["transfers"]
             })
         
-        # Sort by last access
-        recent_users.sort(key=lambda x: user_activity[x["name"]]["last_access"], reverse=True)
-        
         return {
             "transfers": transfers,
-            "recent_users": recent_users[:10]  # Top 10 recent users
+            "recent_users": recent_users
         }
         
     except Exception as e:
         logger.error(f"Error parsing vsftpd logs: {e}")
         return {"transfers": 0, "recent_users": []}
 
+@timed("get_disk_usage", phase="psutil")
 def get_disk_usage() -> Dict[str, float]:
     """Get disk usage statistics for FTP home directory"""
     try:
@@ -234,56 +377,35 @@ def get_disk_usage() -> Dict[str, float]:
         return {
             "total_gb": round(total_gb, 1),
             "used_gb": round(used_gb, 1),
-            "usage_percent": round(usage_percent, 1)
+            "usage_percent": round(usage_percent, 1),
+            "total_bytes": usage.total,
+            "used_bytes": usage.used
         }
     except Exception as e:
         logger.error(f"Error getting disk usage: {e}")
         return {"total_gb": 100.0, "used_gb": 0.0, "usage_percent": 0.0}
 
-def apply_vsftpd_config(config):
-    """Atualiza o arquivo /etc/vsftpd.conf com as configurações fornecidas"""
-    conf_path = "/etc/vsftpd.conf"
-    # Carregar config existente (ou criar novo)
-    lines = []
-    if os.path.exists(conf_path):
-        with open(conf_path, "r") as f:
-            lines = f.readlines()
-    # Dicionário para atualizar
-    conf_map = {
-        "listen_port": str(config.get("ftp_port", 21)),
-        "pasv_min_port": config.get("passive_ports", "40000-40100").split("-")[0],
-        "pasv_max_port": config.get("passive_ports", "40000-40100").split("-")[-1],
-        "max_clients": str(config.get("max_clients", 50)),
-        "max_per_ip": str(config.get("max_per_ip", 10)),
-        "ssl_enable": "YES" if config.get("ssl_enabled", True) else "NO",
-        "rsa_cert_file": config.get("ssl_cert_file", "/etc/ssl/cert.pem"),
-        "rsa_private_key_file": config.get("ssl_key_file", "/etc/ssl/key.pem"),
-        # Adicione mais conforme necessário
-    }
-    # Atualizar linhas existentes ou adicionar
-    new_lines = []
-    keys_set = set()
-    for line in lines:
-        updated = False
-        for key, value in conf_map.items():
-            if line.strip().startswith(f"{key}="):
-                new_lines.append(f"{key}={value}\n")
-                keys_set.add(key)
-                updated = True
-                break
-        if not updated:
-            new_lines.append(line)
-    # Adicionar chaves que não existiam
-    for key, value in conf_map.items():
-        if key not in keys_set:
-            new_lines.append(f"{key}={value}\n")
-    # Backup antes de sobrescrever
-    shutil.copy2(conf_path, conf_path+".bak") if os.path.exists(conf_path) else None
-    with open(conf_path, "w") as f:
-        f.writelines(new_lines)
-    # Reiniciar vsftpd
-    run_command("pkill vsftpd", check=False)
-    run_command("vsftpd &", check=False)
+# vsftpd.conf: diff contra o arquivo atual e aplicação por SIGHUP (ou restart só do master)
+vsftpd_config = VsftpdConfigEngine(VSFTPD_CONF, process_tracker, service=VSFTPD_SERVICE)
+
+# Respostas serializadas (e comprimidas) reaproveitadas enquanto a origem não muda
+response_cache = ResponseCache()
+
+async def cached_json(request: Request, key: tuple, version: tuple, build,
+                      volatile: Tuple[str, ...] = ()) -> Response:
+    """Serve `build()` (async, returns (content, headers)) from the cache while `version` holds.
+
+    `volatile` names fields rebuilt with a new value every time; they are
+    left out of the ETag so an unchanged response still gets a 304.
+    """
+    entry = response_cache.lookup(key, version)
+    if entry is None:
+        content, headers = await build()
+        encoded = jsonable_encoder(content)
+        body = JSONResponse(content=encoded).body
+        etag = content_etag(encoded, volatile) if volatile else None
+        entry = response_cache.store(key, version, body, "application/json", headers, etag=etag)
+    return await respond(request, entry)
 
 # API Routes
 
@@ -291,231 +413,861 @@ def apply_vsftpd_config(config):
 async def root():
     return {"message": "FTP Manager API", "version": "1.0.0"}
 
+async def read_usage(func: Callable, *args) -> Any:
+    """Call a usage_reader accessor: SQLite in the executor for workers, the in-memory index otherwise"""
+    if ROLE == "worker":
+        return await run_blocking(func, *args, operation="stats")
+    return func(*args)
+
+def get_user_usage(username: str, default_quota_mb: int, usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Quota and indexed disk usage (from usage_reader) for one user"""
+    quota_mb = quota_store.get(username, default_quota_mb)
+    if usage is None:
+        return {"quota_mb": quota_mb, "used_bytes": None, "file_count": None, "quota_percent": None}
+    quota_percent = round(usage["bytes"] / (quota_mb * 1024 * 1024) * 100, 1) if quota_mb else None
+    return {
+        "quota_mb": quota_mb,
+        "used_bytes": usage["bytes"],
+        "file_count": usage["files"],
+        "quota_percent": quota_percent,
+    }
+
+def build_user_info(username: str, default_quota_mb: int, usage: Optional[Dict[str, Any]]) -> UserInfo:
+    user_dir = f"{FTP_HOME_BASE}/{username}"
+    return UserInfo(
+        username=username,
+        home_dir=user_dir,
+        created_at=datetime.now().isoformat(),
+        **get_user_usage(username, default_quota_mb, usage)
+    )
+
+def create_user_entry(username: str, password: str, user_dir: str, quota_mb: Optional[int]) -> bool:
+    """Add a user to the users file and create its home directory; False if it already exists"""
+    # Salvar senha em texto puro (NÃO hash!)
+    if not user_store.add(username, password):
+        return False
+    if quota_mb is not None:
+        quota_store.set_many({username: quota_mb})
+    os.makedirs(user_dir, exist_ok=True)
+    return True
+
+def delete_user_entries(usernames: List[str]) -> tuple[List[str], List[str]]:
+    """Remove users from the users file, quotas and usage index"""
+    removed, missing = user_store.remove_many(usernames)
+    quota_store.remove_many(removed)
+    for username in removed:
+        usage_reader.forget(username)
+    return removed, missing
+
 @app.get("/api/users", response_model=List[UserInfo])
-async def list_users():
-    """List all virtual FTP users"""
+async def list_users(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    prefix: str = "",
+):
+    """List virtual FTP users sorted by name (total matching in X-Total-Count)"""
+    async def build():
+        usernames, total = await run_blocking(user_store.list, offset, limit, prefix, operation="users")
+        default_quota_mb = int((await run_blocking(load_config, operation="config"))["default_quota_mb"])
+        # Uso da página inteira numa consulta, não uma por usuário
+        usages = await read_usage(usage_reader.get_many, usernames)
+        headers = {"X-Total-Count": str(total), "Access-Control-Expose-Headers": "X-Total-Count, ETag"}
+        return [build_user_info(username, default_quota_mb, usages.get(username)) for username in usernames], headers
+
     try:
-        if not os.path.exists(VIRTUAL_USERS_FILE):
-            return []
-        
-        users = []
-        with open(VIRTUAL_USERS_FILE, 'r') as f:
-            lines = f.readlines()
-            for i in range(0, len(lines), 2):
-                if i + 1 < len(lines):
-                    username = lines[i].strip()
-                    user_dir = f"{FTP_HOME_BASE}/{username}"
-                    users.append(UserInfo(
-                        username=username,
-                        home_dir=user_dir,
-                        quota_mb=100,  # Default quota
-                        created_at=datetime.now().isoformat()
-                    ))
-        return users
+        # Usuários, quotas, quota padrão e uso de disco: muda qualquer um, muda a resposta
+        version = (file_version(VIRTUAL_USERS_FILE), file_version(QUOTAS_FILE),
+                   file_version(CONFIG_FILE), await read_usage(lambda: usage_reader.version))
+        # created_at ainda é o horário da listagem, não um dado do usuário
+        return await cached_json(request, ("users", offset, limit, prefix), version, build,
+                                 volatile=("created_at",))
+    except OperationTimeout:
+        raise
     except Exception as e:
         logger.error(f"Error listing users: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/users")
+@timed("db_load_rebuild", phase="subprocess")
+async def rebuild_user_db() -> tuple[bool, str]:
+    """Rebuild the Berkeley DB from a users snapshot into a temp file and swap it in atomically"""
+    tmp_source = f"{VIRTUAL_USERS_DB}.src.tmp"
+    tmp_db = f"{VIRTUAL_USERS_DB}.tmp"
+    # Um rebuild por vez no host: sem o lock, um worker com snapshot antigo poderia substituir o banco por último
+    async with async_file_lock(VIRTUAL_USERS_DB):
+        try:
+            await run_blocking(user_store.export, tmp_source, operation="users")
+            # db_load acrescenta a um banco existente; começa sempre de um arquivo novo
+            if os.path.exists(tmp_db):
+                os.remove(tmp_db)
+            success, output = await run_command(f"db_load -T -t hash -f {tmp_source} {tmp_db}", operation="db_load")
+            if not success:
+                return False, output
+            os.chmod(tmp_db, 0o600)
+            os.replace(tmp_db, VIRTUAL_USERS_DB)
+        finally:
+            if os.path.exists(tmp_source):
+                os.remove(tmp_source)
+    # Restart vsftpd
+    await run_command(f"systemctl reload {VSFTPD_SERVICE}")
+    return True, output
+
+# Mutações próximas no tempo compartilham um único db_load + reload
+db_rebuilder = RebuildScheduler(rebuild_user_db)
+
+def chunked(items: List[str], size: int = 200):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+async def prepare_user_dirs(user_dirs: List[str]):
+    """Set ownership and permissions on new home directories, many paths per command"""
+    for chunk in chunked(user_dirs):
+        paths = " ".join(chunk)
+        await run_command(f"chown ftpuser:ftpuser {paths}")
+        await run_command(f"chmod 755 {paths}")
+
+def user_home(username: str) -> str:
+    """Home directory of `username`, refusing anything that escapes FTP_HOME_BASE"""
+    base = os.path.realpath(FTP_HOME_BASE)
+    path = os.path.realpath(os.path.join(base, username))
+    if os.path.dirname(path) != base:
+        raise ValueError(f"Invalid home directory for user {username!r}")
+    return path
+
+# Listagens dos diretórios dos usuários, em cache até o mtime do diretório mudar
+dir_browser = DirectoryBrowser()
+
+# Tarefas lentas (remoção de homes, permissões, db_load) rodam em jobs persistentes;
+# as rotas respondem 202 com o id do job e /api/jobs/{id} mostra o progresso
+job_queue = JobQueue(JOBS_DB)
+
+async def provision_users_job(ctx: JobContext) -> Dict[str, Any]:
+    """Set ownership/permissions on new home directories, then rebuild the user database"""
+    if not ctx.progress.get("permissions_set"):
+        await prepare_user_dirs(ctx.params["user_dirs"])
+        ctx.set(permissions_set=True)
+    success, output = await db_rebuilder.schedule()
+    if not success:
+        raise RuntimeError(f"Failed to rebuild user database: {output}")
+    return {"created": ctx.params["usernames"]}
+
+async def delete_homes_job(ctx: JobContext) -> Dict[str, Any]:
+    """Revoke access (database rebuild) and then remove the users' home directories"""
+    if not ctx.progress.get("db_rebuilt"):
+        success, output = await db_rebuilder.schedule()
+        if not success:
+            raise RuntimeError(f"Failed to rebuild user database: {output}")
+        ctx.set(db_rebuilt=True)
+    errors: List[str] = []
+    for username in ctx.params["usernames"]:
+        if username in ctx.progress.get("removed", []) or username in ctx.progress.get("skipped", []):
+            continue
+        # Recriado enquanto o job esperava: o diretório agora é do novo usuário
+        if await run_blocking(user_store.exists, username, operation="users"):
+            ctx.set(skipped=ctx.progress.get("skipped", []) + [username])
+            continue
+        ctx.set(current=username)
+        gone, user_errors = await run_blocking(remove_tree, user_home(username), ctx.add,
+                                               should_stop=ctx.stopping.is_set, operation="job_work")
+        errors.extend(user_errors)
+        if gone:
+            ctx.set(removed=ctx.progress.get("removed", []) + [username])
+    ctx.set(current=None)
+    if errors:
+        raise RuntimeError(f"{len(errors)} entries could not be removed: {errors[:5]}")
+    progress = ctx.progress
+    return {"removed": progress.get("removed", []), "skipped": progress.get("skipped", []),
+            "files": progress.get("files", 0), "bytes": progress.get("bytes", 0)}
+
+job_queue.register("provision_users", provision_users_job)
+job_queue.register("delete_homes", delete_homes_job)
+
+@app.post("/api/users", status_code=202)
 async def create_user(user: VirtualUser):
-    """Create a new virtual FTP user"""
+    """Create a new virtual FTP user (permissions and database rebuild run as a job)"""
     try:
-        # Check if user already exists
-        if os.path.exists(VIRTUAL_USERS_FILE):
-            with open(VIRTUAL_USERS_FILE, 'r') as f:
-                content = f.read()
-                if f"\n{user.username}\n" in f"\n{content}\n":
-                    raise HTTPException(status_code=400, detail="User already exists")
-        
-        # Salvar senha em texto puro (NÃO hash!)
-        with open(VIRTUAL_USERS_FILE, 'a') as f:
-            f.write(f"{user.username}\n{user.password}\n")
-        
-        # Create user directory
+        # Save credentials and create user directory (fails if the user already exists)
         user_dir = user.home_dir or f"{FTP_HOME_BASE}/{user.username}"
-        os.makedirs(user_dir, exist_ok=True)
-        
-        # Set proper permissions
-        run_command(f"chown ftpuser:ftpuser {user_dir}")
-        run_command(f"chmod 755 {user_dir}")
-        
-        # Rebuild database
-        success, output = run_command(f"db_load -T -t hash -f {VIRTUAL_USERS_FILE} {VIRTUAL_USERS_DB}")
-        if not success:
-            raise HTTPException(status_code=500, detail=f"Failed to rebuild user database: {output}")
+        if not await run_blocking(create_user_entry, user.username, user.password, user_dir, user.quota_mb, operation="users"):
+            raise HTTPException(status_code=400, detail="User already exists")
         
-        # Restart vsftpd
-        run_command("systemctl reload vsftpd")
+        # Set proper permissions and rebuild database in the background
+        job_id = await job_queue.submit("provision_users", {"usernames": [user.username], "user_dirs": [user_dir]})
         
-        return {"message": f"User {user.username} created successfully"}
+        return {"message": f"User {user.username} created", "job_id": job_id}
         
-    except HTTPException:
+    except (HTTPException, OperationTimeout):
         raise
     except Exception as e:
         logger.error(f"Error creating user: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/api/users/{username}")
+def create_user_entries(users: List[VirtualUser]) -> tuple[List[str], List[str], List[str]]:
+    """Add many users with one write and create their home directories"""
+    added, existing = user_store.add_many([(u.username, u.password) for u in users])
+    added_set = set(added)
+    quota_store.set_many({u.username: u.quota_mb for u in users if u.username in added_set and u.quota_mb is not None})
+    user_dirs = []
+    for user in users:
+        if user.username in added_set:
+            user_dir = user.home_dir or f"{FTP_HOME_BASE}/{user.username}"
+            os.makedirs(user_dir, exist_ok=True)
+            user_dirs.append(user_dir)
+    return added, existing, user_dirs
+
+@app.post("/api/users/bulk")
+async def create_users_bulk(users: List[VirtualUser], response: Response):
+    """Create many virtual FTP users with a single database rebuild and reload (as a job)"""
+    try:
+        added, existing, user_dirs = await run_blocking(create_user_entries, users, operation="users")
+        job_id = None
+        if added:
+            job_id = await job_queue.submit("provision_users", {"usernames": added, "user_dirs": user_dirs})
+            response.status_code = 202
+        return {"created": added, "already_exists": existing, "job_id": job_id}
+    except (HTTPException, OperationTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error creating users in bulk: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/users/bulk")
+async def delete_users_bulk(request: BulkDeleteRequest, response: Response):
+    """Delete many virtual FTP users; home directories are removed by a job"""
+    try:
+        removed, missing = await run_blocking(delete_user_entries, request.usernames, operation="users")
+        job_id = None
+        if removed:
+            job_id = await job_queue.submit("delete_homes", {"usernames": removed})
+            response.status_code = 202
+        return {"deleted": removed, "not_found": missing, "job_id": job_id}
+    except (HTTPException, OperationTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting users in bulk: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/users/{username}", status_code=202)
 async def delete_user(username: str):
-    """Delete a virtual FTP user"""
+    """Delete a virtual FTP user; the database rebuild and home removal run as a job"""
     try:
-        if not os.path.exists(VIRTUAL_USERS_FILE):
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Read current users
-        with open(VIRTUAL_USERS_FILE, 'r') as f:
-            lines = f.readlines()
-        
-        # Remove user and password lines
-        new_lines = []
-        i = 0
-        found = False
-        while i < len(lines):
-            if i + 1 < len(lines) and lines[i].strip() == username:
-                found = True
-                i += 2  # Skip username and password lines
-            else:
-                new_lines.append(lines[i])
-                i += 1
-        
-        if not found:
+        removed, _ = await run_blocking(delete_user_entries, [username], operation="users")
+        if not removed:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Write updated file
-        with open(VIRTUAL_USERS_FILE, 'w') as f:
-            f.writelines(new_lines)
-        
-        # Remove user directory
-        user_dir = f"{FTP_HOME_BASE}/{username}"
-        if os.path.exists(user_dir):
-            run_command(f"rm -rf {user_dir}")
-        
-        # Rebuild database
-        run_command(f"db_load -T -t hash -f {VIRTUAL_USERS_FILE} {VIRTUAL_USERS_DB}")
+        job_id = await job_queue.submit("delete_homes", {"usernames": removed})
         
-        # Restart vsftpd
-        run_command("systemctl reload vsftpd")
+        return {"message": f"User {username} deleted", "job_id": job_id}
         
-        return {"message": f"User {username} deleted successfully"}
-        
-    except HTTPException:
+    except (HTTPException, OperationTimeout):
         raise
     except Exception as e:
         logger.error(f"Error deleting user: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def collect_analytics() -> Dict[str, Any]:
+    """Rankings and distinct counts for every window, after reading what was appended to the log"""
+    log_ingestor.refresh()
+    return log_analytics.report()
+
+# Cada métrica é atualizada em background no seu próprio intervalo
+def publish_usage():
+    """Copy usage changes since the last pass into the shared state (collector process)"""
+    changes, full = usage_index.drain_changes()
+    shared_state.put_usage(changes, replace=full)
+    shared_state.set_flag("usage_ready", usage_index.ready)
+    if changes or full:
+        shared_state.set_flag("usage_version", usage_index.version)
+
+def after_log_catch_up(func: Callable[[], Any]) -> Callable[[], Any]:
+    """Metric function that reads the ingestor; the metric stays pending until the startup catch-up is done"""
+    def collect():
+        if not log_ingestor.ready:
+            raise MetricPending("log catch-up in progress")
+        return func()
+    return collect
+
+# Referência à tarefa de leitura inicial (o event loop só guarda referências fracas)
+log_catch_up: Optional[asyncio.Task] = None
+
+async def catch_up_log():
+    """Startup read of the live log, then the older history (rotated files) for the analytics windows"""
+    try:
+        await run_blocking(log_ingestor.catch_up, operation="log_ingest")
+        # O que o ingestor não leu (antes do seu primeiro registro) vem do histórico, uma única vez
+        await run_blocking(lambda: log_analytics.backfill(log_archive.iter_records(
+            time.time() - max(ANALYTICS_RETENTION.values()), log_ingestor.start_timestamp)), operation="archive")
+    except Exception as e:
+        logger.error(f"Log catch-up failed: {e}")
+        log_ingestor.ready = True
+
+# Cada métrica é atualizada em background no seu próprio intervalo
+# (com vários workers, só o processo coletor executa; os workers leem o que ele publica)
+metrics = MetricsCollector(store=shared_state, reader=ROLE == "worker")
+metrics.register("server", get_vsftpd_status, interval=5)
+metrics.register("sessions", get_vsftpd_sessions, interval=5)
+metrics.register("ftp_sessions", after_log_catch_up(collect_ftp_sessions), interval=5)
+metrics.register("connections", get_connection_sample, interval=2)
+metrics.register("transfers", after_log_catch_up(lambda: parse_vsftpd_logs(24)), interval=5)
+metrics.register("disk", get_disk_usage, interval=60)
+metrics.register("transfer_stats_flush", transfer_stats.flush, interval=5, shared=False)
+# Crawl completo na partida e reconciliação a cada 6h; usuários "sujos" a cada minuto
+metrics.register("usage_crawl", usage_index.crawl_all, interval=6 * 3600, operation="usage", shared=False)
+metrics.register("usage_rescan", usage_index.rescan_dirty, interval=60, operation="usage", shared=False)
+# Primeira passada indexa todo o histórico; depois só o que foi anexado
+metrics.register("log_index", log_search.refresh, interval=30, operation="log_index", shared=False)
+metrics.register("analytics", after_log_catch_up(collect_analytics), interval=15)
+# Jobs encerrados há mais de 7 dias saem do banco
+metrics.register("jobs_purge", job_queue.purge_finished, interval=3600, operation="jobs", shared=False)
+metrics.register("users", user_store.count, interval=2, version_func=lambda: file_version(VIRTUAL_USERS_FILE))
+if ROLE == "collector":
+    metrics.register("usage_publish", publish_usage, interval=5, operation="usage", shared=False)
+    # Workers não mantêm o log em memória: somam as parciais por hora publicadas pelo coletor
+    metrics.register("throughput_hours", after_log_catch_up(log_ingestor.throughput_hours), interval=30)
+
+# Campo da resposta -> métrica que o produz
+STATS_FIELD_SOURCES = {
+    "active_users": "connections",
+    "server_status": "server",
+    "server_version": "server",
+    "uptime": "server",
+    "transfers_24h": "transfers",
+    "disk_used_gb": "disk",
+    "disk_total_gb": "disk",
+    "disk_usage_percent": "disk",
+    "active_connections": "connections",
+    "data_connections": "connections",
+    "total_users": "users",
+}
+
+def collect_dashboard_stats() -> Dict[str, Any]:
+    """Build the dashboard statistics from the latest metrics snapshot"""
+    server_info = metrics.get("server", {"status": "unknown", "version": process_tracker.version, "uptime": "0"})
+    connections = metrics.get("connections", {"control": 0, "data": 0})
+    active_users = connections["control"]
+    log_data = metrics.get("transfers", {"transfers": 0})
+    disk_info = metrics.get("disk", {"total_gb": 0.0, "used_gb": 0.0, "usage_percent": 0.0})
+    collected = {source: metrics.updated_at(source) for source in set(STATS_FIELD_SOURCES.values())}
+    freshness = {
+        field: datetime.fromtimestamp(collected[source]).isoformat() if collected[source] else None
+        for field, source in STATS_FIELD_SOURCES.items()
+    }
+    # Antes da primeira coleta de todas as fontes os valores acima são padrões, não medições
+    ready = all(collected.values())
+    return {
+        "active_users": active_users,
+        "server_status": server_info["status"],
+        "server_version": server_info["version"],
+        "uptime": server_info["uptime"],
+        "transfers_24h": log_data["transfers"],
+        "disk_used_gb": disk_info["used_gb"],
+        "disk_total_gb": disk_info["total_gb"],
+        "disk_usage_percent": disk_info["usage_percent"],
+        "active_connections": active_users,
+        "data_connections": connections["data"],
+        "ftp_port": 21,
+        "ssl_enabled": True,
+        "total_users": metrics.get("users", 0),
+        "freshness": freshness,
+        "ready": ready,
+        "updated_at": datetime.fromtimestamp(min(collected.values())).isoformat() if ready else None,
+    }
+
+# Métricas do FTP expostas direto ao Prometheus, a partir do último snapshot coletado
+# (histogramas de requisição são por processo; com vários workers, cada um expõe os seus)
+FTP_GAUGES = {
+    name: REGISTRY.register(Gauge(name, documentation))
+    for name, documentation in (
+        ("ftp_server_up", "1 when the vsftpd master process is running"),
+        ("ftp_control_connections", "Established FTP control connections"),
+        ("ftp_data_connections", "Established FTP data connections"),
+        ("ftp_transfers_24h", "Completed transfers in the last 24 hours"),
+        ("ftp_disk_used_bytes", "Used bytes on the FTP home filesystem"),
+        ("ftp_disk_total_bytes", "Size of the FTP home filesystem"),
+        ("ftp_virtual_users", "Virtual users in the users file"),
+    )
+}
+FTP_METRIC_AGE = REGISTRY.register(Gauge(
+    "ftp_dashboard_metric_age_seconds", "Seconds since each background metric was refreshed", ("metric",),
+))
+
+def update_ftp_gauges():
+    connections = metrics.get("connections", {"control": 0, "data": 0})
+    disk_info = metrics.get("disk", {})
+    FTP_GAUGES["ftp_server_up"].set(1 if metrics.get("server", {}).get("status") == "online" else 0)
+    FTP_GAUGES["ftp_control_connections"].set(connections["control"])
+    FTP_GAUGES["ftp_data_connections"].set(connections["data"])
+    FTP_GAUGES["ftp_transfers_24h"].set(metrics.get("transfers", {"transfers": 0})["transfers"])
+    FTP_GAUGES["ftp_disk_used_bytes"].set(disk_info.get("used_bytes", 0))
+    FTP_GAUGES["ftp_disk_total_bytes"].set(disk_info.get("total_bytes", 0))
+    FTP_GAUGES["ftp_virtual_users"].set(metrics.get("users", 0))
+    now = time.time()
+    for source in set(STATS_FIELD_SOURCES.values()):
+        updated_at = metrics.updated_at(source)
+        if updated_at:
+            FTP_METRIC_AGE.set(round(now - updated_at, 3), metric=source)
+
+REGISTRY.add_collector(update_ftp_gauges)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas no formato texto do Prometheus"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Superfície de diagnóstico: desligada a menos que FTP_ADMIN_TOKEN esteja definido
+ADMIN_TOKEN = os.environ.get("FTP_ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Debug endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/api/debug/slow-requests", dependencies=[Depends(require_admin)])
+async def get_slow_requests(limit: int = Query(50, ge=1, le=1000), route: Optional[str] = None):
+    """Requisições acima do limite (FTP_SLOW_REQUEST_MS), mais recentes primeiro, com tempo por fase"""
+    return {"threshold_ms": slow_requests.threshold_ms, "requests": slow_requests.entries(limit, route)}
+
+@app.delete("/api/debug/slow-requests", dependencies=[Depends(require_admin)])
+async def clear_slow_requests():
+    slow_requests.clear()
+    return {"message": "Slow request log cleared"}
+
+@app.post("/api/debug/profile", dependencies=[Depends(require_admin)])
+async def run_profile(
+    seconds: float = Query(10.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=100),
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+):
+    """Amostra as pilhas de todas as threads por `seconds` e devolve o perfil (speedscope ou collapsed)"""
+    profile = await run_blocking(profiler.profile, seconds, interval_ms / 1000, operation="profile")
+    if profile is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if format == "collapsed":
+        return PlainTextResponse(to_collapsed(profile))
+    return to_speedscope(profile)
+
+@app.get("/api/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None, pattern="^(queued|running|succeeded|failed)$"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Jobs mais recentes primeiro"""
+    return await job_queue.list(status, limit)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado, progresso (arquivos/bytes removidos, etapa atual) e resultado de um job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/users/{username}/usage")
+async def get_user_usage_info(username: str):
+    """Uso de disco, número de arquivos e percentual da quota de um usuário"""
+    if not await run_blocking(user_store.exists, username, operation="users"):
+        raise HTTPException(status_code=404, detail="User not found")
+    config = await run_blocking(load_config, operation="config")
+    usage = await read_usage(usage_reader.get, username)
+    return {"username": username, "indexed": await read_usage(lambda: usage_reader.ready),
+            **get_user_usage(username, int(config["default_quota_mb"]), usage)}
+
+@app.get("/api/users/{username}/files")
+async def browse_user_files(
+    username: str,
+    path: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = Query("none", pattern="^(" + "|".join(BROWSE_SORTS) + ")$"),
+):
+    """Conteúdo de um diretório dentro da home do usuário, paginado por cursor.
+
+    sort=none segue a ordem do diretório e lê só a página pedida; as demais
+    ordenações (name, size, mtime; "-" para decrescente) leem o diretório
+    inteiro uma vez e reaproveitam a listagem enquanto ele não muda.
+    """
+    if not await run_blocking(user_store.exists, username, operation="users"):
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        home = user_home(username)
+        target = resolve_under(home, path)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Path outside the user's home directory")
+    try:
+        page = await run_blocking(dir_browser.list, target, sort, cursor, limit, operation="browse")
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor for this sort order")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Directory not found")
+    except NotADirectoryError:
+        raise HTTPException(status_code=400, detail="Not a directory")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    relative = os.path.relpath(target, home)
+    return {"username": username, "path": "/" if relative == "." else "/" + relative, **page}
+
+@app.get("/api/usage/top")
+async def get_top_usage(limit: int = Query(10, ge=1, le=100)):
+    """Usuários que mais ocupam disco"""
+    return {"indexed": await read_usage(lambda: usage_reader.ready),
+            "users": await run_blocking(usage_reader.top, limit, operation="usage")}
+
+@app.get("/api/stats/transfers")
+async def get_transfer_history(
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    step: int = Query(3600, ge=60, multiple_of=60, description="Intervalo de cada ponto, em segundos (múltiplo de 60)"),
+):
+    """Série histórica de uploads/downloads, bytes e usuários distintos.
+
+    `step` na resposta é o intervalo realmente usado: períodos além da
+    retenção dos buckets por minuto só têm passos de hora inteira.
+    """
+    end = to.timestamp() if to else time.time()
+    start = from_.timestamp() if from_ else end - 86400
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if (end - start) / step > 10000:
+        raise HTTPException(status_code=400, detail="Too many points; increase 'step'")
+    used_step, points = await run_blocking(transfer_stats.query, start, end, step, operation="stats")
+    return {"from": datetime.fromtimestamp(start).isoformat(), "to": datetime.fromtimestamp(end).isoformat(),
+            "step": used_step, "points": points}
+
+@app.get("/api/stats/throughput")
+async def get_transfer_throughput(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Bytes transferidos, vazão (MB/s), duração p50/p95 e usuários com mais bytes"""
+    if timedelta(hours=hours) > log_ingestor.window:
+        summary = await run_blocking(log_archive.transfer_summary, time.time() - hours * 3600,
+                                     operation="archive")
+        return summary.throughput(hours * 3600, limit)
+    if ROLE == "worker":
+        await metrics.ensure_ready("throughput_hours")
+        partials = metrics.get("throughput_hours")
+        if partials is not None:
+            return merge_throughput_hours(partials, hours, limit)
+        summary = await run_blocking(log_archive.transfer_summary, time.time() - hours * 3600,
+                                     operation="archive")
+        return summary.throughput(hours * 3600, limit)
+    await metrics.ensure_ready("transfers")
+    return await run_blocking(log_ingestor.throughput, hours, limit, operation="stats")
+
+async def analytics_response(request: Request, section: str, window: str, limit: int) -> Response:
+    """One section of the published analytics report for `window`, trimmed to `limit` items"""
+    await metrics.ensure_ready("analytics")
+
+    async def build():
+        report = (metrics.get("analytics") or {}).get(window, {})
+        content = {"window": window, "events": report.get("events", 0), "approximate": True}
+        if section == "distinct":
+            content["distinct_clients"] = report.get("distinct_clients", 0)
+            content["distinct_users"] = report.get("distinct_users", 0)
+        else:
+            content[section] = report.get(section, [])[:limit]
+        return content, {}
+
+    return await cached_json(request, ("analytics", section, window, limit),
+                             (metrics.updated_at("analytics"),), build)
+
+ANALYTICS_WINDOW = Query("24h", pattern="^(" + "|".join(ANALYTICS_WINDOWS) + ")$")
+
+@app.get("/api/analytics/top-files")
+async def get_top_files(request: Request, window: str = ANALYTICS_WINDOW, limit: int = Query(10, ge=1, le=100)):
+    """Arquivos mais transferidos na janela (contagens estimadas, com o erro máximo de cada item)"""
+    return await analytics_response(request, "top_files", window, limit)
+
+@app.get("/api/analytics/top-users")
+async def get_top_transfer_users(request: Request, window: str = ANALYTICS_WINDOW,
+                                 limit: int = Query(10, ge=1, le=100)):
+    """Usuários com mais transferências na janela"""
+    return await analytics_response(request, "top_users", window, limit)
+
+@app.get("/api/analytics/top-ips")
+async def get_top_ips(request: Request, window: str = ANALYTICS_WINDOW, limit: int = Query(10, ge=1, le=100)):
+    """IPs com mais eventos no log (conexões, comandos, transferências) na janela"""
+    return await analytics_response(request, "top_ips", window, limit)
+
+@app.get("/api/analytics/distinct-clients")
+async def get_distinct_clients(request: Request, window: str = ANALYTICS_WINDOW):
+    """Número estimado de IPs e usuários distintos na janela"""
+    return await analytics_response(request, "distinct", window, 0)
+
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        # Get server status
-        server_info = get_vsftpd_status()
-        # Get active connections
-        active_users = get_active_connections()
-        # Get transfer statistics
-        log_data = parse_vsftpd_logs(24)
-        # Get disk usage
-        disk_info = get_disk_usage()
-        # Contar total de usuários lendo o arquivo de usuários virtuais
-        total_users = 0
-        if os.path.exists(VIRTUAL_USERS_FILE):
-            with open(VIRTUAL_USERS_FILE, 'r') as f:
-                lines = f.readlines()
-                total_users = len(lines) // 2  # Cada usuário ocupa 2 linhas
-        return {
-            "active_users": active_users,
-            "server_status": server_info["status"],
-            "server_version": server_info["version"],
-            "uptime": server_info["uptime"],
-            "transfers_24h": log_data["transfers"],
-            "disk_used_gb": disk_info["used_gb"],
-            "disk_total_gb": disk_info["total_gb"],
-            "disk_usage_percent": disk_info["usage_percent"],
-            "active_connections": active_users,
-            "ftp_port": 21,
-            "ssl_enabled": True,
-            "total_users": total_users
-        }
+        # Nunca espera a primeira coleta: com ready=false o cliente repete (ou recebe pelo SSE)
+        return collect_dashboard_stats()
     except Exception as e:
         logger.error(f"Error getting dashboard stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def read_recent_users(limit: int = 5) -> List[Dict[str, Any]]:
+    """Read the most recent distinct users from the vsftpd log (xferlog or native format)"""
+    log_path = VSFTPD_LOG
+    if not os.path.exists(log_path):
+        return []
+    users = []
+    seen = set()
+    online = online_users()
+    # Lê do fim para o começo e para assim que tiver usuários suficientes
+    for line in iter_lines_reverse(log_path):
+        record = parse_line(line)
+        if record is None or not record.is_transfer or not record.user:
+            continue
+        username = record.user
+        if username not in seen:
+            users.append({
+                "username": username,
+                "last_transfer": datetime.fromtimestamp(record.timestamp).strftime("%a %b %d %H:%M:%S"),
+                "file": record.path,
+                "status": "Ativo" if online is None or username in online else "Inativo",
+                "home_dir": os.path.join(FTP_HOME_BASE, username),
+                "quota_mb": 0,
+                "permissions": "Completo",
+                "created_at": "-"
+            })
+            seen.add(username)
+            if len(users) >= limit:
+                break
+    return users
+
+@app.get("/api/dashboard/connections")
+async def get_connections():
+    """Conexões FTP atuais: controle, dados e por IP (comparado com max_per_ip)"""
+    await metrics.ensure_ready("connections")
+    return metrics.get("connections", {"control": 0, "data": 0, "per_ip": {}, "over_limit": {}})
+
+@app.get("/api/dashboard/sessions")
+async def get_sessions():
+    """Processos de sessão do vsftpd (um por cliente conectado) com CPU e RSS"""
+    await metrics.ensure_ready("sessions")
+    return metrics.get("sessions", [])
+
+@app.get("/api/sessions")
+async def get_ftp_sessions(user: Optional[str] = None):
+    """Sessões FTP abertas agora: usuário, IP, login, comandos, bytes e tempo ocioso"""
+    await metrics.ensure_ready("ftp_sessions")
+    snapshot = metrics.get("ftp_sessions") or {"tracking": False, "active": [], "online_users": []}
+    active = [s for s in snapshot["active"] if user is None or s["user"] == user]
+    return {"tracking": snapshot["tracking"], "count": len(active),
+            "online_users": snapshot["online_users"], "sessions": active}
+
+@app.get("/api/sessions/history")
+async def get_ftp_session_history(user: Optional[str] = None, limit: int = Query(50, ge=1, le=200)):
+    """Sessões encerradas mais recentes, com duração e motivo (quit, timeout, vanished, ...)"""
+    await metrics.ensure_ready("ftp_sessions")
+    history = (metrics.get("ftp_sessions") or {}).get("history", [])
+    return [s for s in history if user is None or s["user"] == user][:limit]
+
 @app.get("/api/dashboard/recent-users")
-async def get_recent_users():
-    """Get recent user activity from vsftpd log (xferlog format)"""
+async def get_recent_users(request: Request, limit: int = Query(5, ge=1, le=100)):
+    """Get recent user activity from vsftpd log"""
+    async def build():
+        return await run_blocking(read_recent_users, limit, operation="logs"), {}
+
     try:
-        log_path = VSFTPD_LOG
-        if not os.path.exists(log_path):
-            return []
-        users = []
-        seen = set()
-        with open(log_path, 'r') as f:
-            for line in reversed(f.readlines()):
-                parts = line.strip().split()
-                if len(parts) < 15:
-                    continue
-                username = parts[-5]  # Corrigido para pegar a coluna correta
-                if username not in seen:
-                    users.append({
-                        "username": username,
-                        "last_transfer": " ".join(parts[:4]),
-                        "file": parts[8],
-                        "status": "Ativo",
-                        "home_dir": f"/home/ftpusers/{username}",
-                        "quota_mb": 0,
-                        "permissions": "Completo",
-                        "created_at": "-"
-                    })
-                    seen.add(username)
-                if len(users) >= 5:
-                    break
-        return users
+        online = online_users()
+        version = (file_version(VSFTPD_LOG), tuple(sorted(online)) if online is not None else None)
+        return await cached_json(request, ("recent-users", limit), version, build)
+    except OperationTimeout:
+        raise
     except Exception as e:
         logger.error(f"Error getting recent users: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Canal em tempo real: um único watcher do log para todos os clientes
+live_feed = LiveFeed(VSFTPD_LOG, collect_dashboard_stats, read_recent_users)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Versão real do vsftpd, detectada uma única vez
+    await run_blocking(process_tracker.detect_version, operation="command")
+    # No modo worker a coleta e os jobs são do processo coletor; metrics.start() só acompanha o que ele publica
+    metrics.start()
+    if ROLE == "all":
+        global log_catch_up
+        log_catch_up = asyncio.create_task(catch_up_log())
+        job_queue.start()
+    live_feed.start()
+
+async def run_collector():
+    """Collector process for multi-worker deployments: refresh and publish, no HTTP"""
+    shared_state.set_flag("usage_ready", False)
+    await run_blocking(process_tracker.detect_version, operation="command")
+    global log_catch_up
+    log_catch_up = asyncio.create_task(catch_up_log())
+    metrics.start()
+    job_queue.start()
+    logger.info(f"Collector publishing to {SHARED_STATE_DB}")
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await job_queue.stop()
+        await metrics.stop()
+        shutdown_executor()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await live_feed.stop()
+    await job_queue.stop()
+    await metrics.stop()
+    shutdown_executor()
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Canal SSE com novas linhas de log (`log`) e snapshots de métricas (`stats`, `recent-users`)"""
+    sub = live_feed.subscribe()
+
+    async def event_stream():
+        try:
+            # Sugere ao EventSource reconectar após 3s
+            yield "retry: 3000\n\n"
+            while not sub.dropped:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event, data = await asyncio.wait_for(sub.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep-alive para proxies não fecharem a conexão
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            live_feed.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/logs/search")
+async def search_logs(
+    user: Optional[str] = None,
+    ip: Optional[str] = None,
+    filename: Optional[str] = Query(None, description="Trecho do caminho do arquivo"),
+    direction: Optional[str] = Query(None, pattern="^(upload|download)$"),
+    status: Optional[str] = Query(None, pattern="^(ok|fail)$"),
+    action: Optional[str] = Query(None, description="Ação do vsftpd (LOGIN, DELETE, MKDIR, ...)"),
+    q: Optional[str] = Query(None, description="Texto livre na linha"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Busca no log do vsftpd e nos arquivos rotacionados, em ordem cronológica.
+
+    Use `next_cursor` da resposta como `cursor` para a próxima página.
+    """
+    if direction and action:
+        raise HTTPException(status_code=400, detail="Use either 'direction' or 'action'")
+    criteria = LogFilter(
+        user=user, ip=ip, filename=filename, action=direction or action,
+        ok=None if status is None else status == "ok", text=q,
+        start=from_.timestamp() if from_ else None, end=to.timestamp() if to else None,
+    )
+    # Indexa o que foi anexado desde a última passada antes de consultar
+    await metrics.refresh("log_index")
+    try:
+        return await run_blocking(log_search.search, criteria, cursor, limit, operation="logs")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/logs/vsftpd", response_class=PlainTextResponse)
-async def get_vsftpd_log():
-    """Retorna o conteúdo do log do vsftpd"""
+async def get_vsftpd_log(
+    request: Request,
+    since_offset: Optional[int] = Query(None, ge=0),
+    tail: Optional[int] = Query(None, ge=0, le=100000),
+    inode: Optional[int] = None,
+):
+    """Retorna o log do vsftpd em streaming.
+
+    `since_offset` devolve apenas o que foi anexado após o cursor; `tail`
+    devolve as últimas N linhas. O novo cursor vem nos cabeçalhos
+    X-Log-Offset / X-Log-Inode (X-Log-Reset indica rotação/truncamento).
+    Sem o arquivo responde 404, para o cliente não tomar a mensagem por conteúdo do log.
+    """
+    if not os.path.exists(VSFTPD_LOG):
+        raise HTTPException(status_code=404, detail="Arquivo de log não encontrado.")
     try:
-        if not os.path.exists(VSFTPD_LOG):
-            return "Arquivo de log não encontrado."
-        with open(VSFTPD_LOG, "r") as f:
-            return f.read()
+        start, end, current_inode, reset = await run_blocking(
+            resolve_range, VSFTPD_LOG, since_offset, tail, inode, operation="logs"
+        )
+        headers = {
+            "X-Log-Offset": str(end),
+            "X-Log-Inode": str(current_inode),
+            "X-Log-Reset": "1" if reset else "0",
+            "Access-Control-Expose-Headers": "X-Log-Offset, X-Log-Inode, X-Log-Reset, ETag",
+        }
+        # O log só cresce: o trecho [start, end) de um inode nunca muda, então identifica o conteúdo
+        etag = f'"log-{current_inode}-{start}-{end}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, headers)
+        if end - start > MAX_CACHED_LOG_RANGE:
+            return StreamingResponse(
+                iter_range(VSFTPD_LOG, start, end),
+                media_type="text/plain",
+                headers={**headers, "ETag": etag},
+            )
+        key = ("log", current_inode, start, end)
+        entry = response_cache.lookup(key, etag)
+        if entry is None:
+            body = await run_blocking(lambda: b"".join(iter_range(VSFTPD_LOG, start, end)), operation="logs")
+            entry = response_cache.store(key, etag, body, "text/plain", etag=etag)
+        # X-Log-Reset depende do cursor da requisição, não do trecho
+        return await respond(request, entry, headers)
     except Exception as e:
         logger.error(f"Erro ao ler o log do vsftpd: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def read_config_file() -> Dict[str, Any]:
+    with open(CONFIG_FILE, "r") as f:
+        return json.load(f)
+
+def write_config_file(config: dict):
+    # Escrita atômica e serializada entre workers: leitores nunca veem o JSON pela metade
+    with file_lock(CONFIG_FILE):
+        tmp_path = f"{CONFIG_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, CONFIG_FILE)
+
 @app.get("/api/config")
-async def get_config():
+async def get_config(request: Request):
     """Retorna configurações gerais do sistema (persistente em config.json)"""
-    default_config = {
-        "ftp_port": 21,
-        "passive_ports": "40000-40100",
-        "max_clients": 50,
-        "max_per_ip": 10,
-        "log_level": "detalhado",
-        "ssl_enabled": True,
-        "ssl_cert_file": "/etc/ssl/cert.pem",
-        "ssl_key_file": "/etc/ssl/key.pem",
-        "default_quota_mb": 100,
-        "dashboard_theme": "auto",
-        "language": "pt-BR"
-    }
-    try:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    except Exception:
-        return default_config
+    async def build():
+        try:
+            return await run_blocking(read_config_file, operation="config"), {}
+        except Exception:
+            return DEFAULT_CONFIG, {}
+
+    return await cached_json(request, ("config",), (file_version(CONFIG_FILE),), build)
 
 @app.post("/api/config")
 async def update_config(config: dict):
-    """Atualiza configurações gerais do sistema (persistente em config.json) e aplica no vsftpd.conf"""
+    """Atualiza configurações gerais do sistema (persistente em config.json) e aplica no vsftpd.conf.
+
+    Só grava e recarrega o vsftpd se algum valor mudou; a resposta traz as
+    chaves alteradas, a ação usada (reload/restart) e quanto tempo levou.
+    """
     try:
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        apply_vsftpd_config(config)
-        return {"message": "Configurações atualizadas e aplicadas com sucesso!", "config": config}
+        # Valida e aplica antes de persistir: config inválida não chega ao config.json
+        # Operação própria: um restart lento não estoura o timeout nem segura as leituras de "config"
+        applied = await run_blocking(vsftpd_config.apply, {**DEFAULT_CONFIG, **config}, operation="config_apply")
+        await run_blocking(write_config_file, config, operation="config")
+        return {"message": "Configurações atualizadas e aplicadas com sucesso!", "config": config,
+                "applied": applied}
+    except ConfigValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    except OperationTimeout:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar/aplicar configurações: {e}")
 
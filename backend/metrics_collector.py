@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Coletor de métricas em background com cache de snapshot
+"""
+import asyncio
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from executor import run_blocking
+from profiling import record_phase
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+
+# Métrica cuja fonte ainda está carregando é tentada de novo neste intervalo
+PENDING_RETRY = 1.0
+
+
+class MetricPending(Exception):
+    """Raised by a metric function whose source is still loading; the metric stays unset, no error is logged"""
+
+
+class Metric:
+    """One metric refreshed on its own schedule"""
+
+    def __init__(self, name: str, func: Callable[[], Any], interval: float,
+                 version_func: Optional[Callable[[], Any]] = None, operation: str = "stats",
+                 shared: bool = True):
+        self.name = name
+        self.func = func
+        self.operation = operation
+        # Publicada no estado compartilhado (False para tarefas de manutenção sem valor útil)
+        self.shared = shared
+        self.interval = interval
+        # Quando definido, só recalcula se a "versão" (ex.: mtime) mudar
+        self.version_func = version_func
+        self.version: Any = None
+        self.value: Any = None
+        self.updated_at: Optional[float] = None
+        self.next_due = 0.0
+        self.lock = asyncio.Lock()
+
+
+class MetricsCollector:
+    """Refresh registered metrics in the background and serve the latest snapshot.
+
+    Reading the snapshot never touches the filesystem, psutil or the log; it
+    only returns what the background task last stored, with the wall-clock
+    time each value was refreshed.
+
+    With a `store`, the collector either publishes every shared metric after
+    refreshing it (the single collector process) or, with `reader=True`,
+    runs nothing and serves the values the collector published (API workers).
+    A reader copies the published values into memory every `tick` from the
+    executor, so `get` and `updated_at` never query the store on the event
+    loop.
+    """
+
+    def __init__(self, tick: float = 0.5, store: Optional[SharedState] = None, reader: bool = False,
+                 ready_timeout: float = 30.0):
+        self.tick = tick
+        self.store = store
+        self.reader = reader
+        self.ready_timeout = ready_timeout
+        self._metrics: Dict[str, Metric] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        # Modo leitor: nome -> (valor, updated_at) publicados pelo coletor
+        self._published: Dict[str, Tuple[Any, float]] = {}
+
+    def register(self, name: str, func: Callable[[], Any], interval: float,
+                 version_func: Optional[Callable[[], Any]] = None, operation: str = "stats",
+                 shared: bool = True):
+        self._metrics[name] = Metric(name, func, interval, version_func, operation, shared)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow() if self.reader else self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self, name: str):
+        """Refresh one metric now (skipped when its version did not change; no-op for readers)"""
+        if self.reader:
+            return
+        metric = self._metrics[name]
+        requested_at = time.time()
+        waited = time.perf_counter()
+        async with metric.lock:
+            # Tempo esperando uma atualização que já estava em andamento (ex.: a do loop de background)
+            record_phase("metric_wait", time.perf_counter() - waited)
+            # Outra chamada concluiu a atualização enquanto esperávamos
+            if metric.updated_at is not None and metric.updated_at >= requested_at:
+                return
+            delay = metric.interval
+            try:
+                version = None
+                if metric.version_func is not None:
+                    version = await run_blocking(metric.version_func, operation="stats")
+                    if metric.updated_at is not None and version == metric.version:
+                        # Valor continua válido; só marca como verificado
+                        metric.updated_at = time.time()
+                        if self.store is not None and metric.shared:
+                            await run_blocking(self.store.put_metric, name, metric.value, metric.updated_at,
+                                               operation="stats")
+                        return
+                metric.value = await run_blocking(metric.func, operation=metric.operation)
+                # Só depois do sucesso: se func falhar, a próxima tentativa recalcula o valor
+                metric.version = version
+                metric.updated_at = time.time()
+                if self.store is not None and metric.shared:
+                    await run_blocking(self.store.put_metric, name, metric.value, metric.updated_at,
+                                       operation="stats")
+            except MetricPending:
+                delay = min(metric.interval, PENDING_RETRY)
+            except Exception as e:
+                logger.error(f"Error refreshing metric {name}: {e}")
+            finally:
+                metric.next_due = time.monotonic() + delay
+
+    async def ensure_ready(self, *names: str):
+        """Populate the given metrics (all by default) if they were never collected"""
+        if self.reader:
+            await self._wait_published(names or [n for n, m in self._metrics.items() if m.shared])
+            return
+        pending = [name for name in (names or self._metrics) if self._metrics[name].updated_at is None]
+        if pending:
+            await asyncio.gather(*(self.refresh(name) for name in pending))
+
+    async def _wait_published(self, names):
+        """Wait (bounded) for the collector process to publish the given metrics"""
+        deadline = time.monotonic() + self.ready_timeout
+        waited = time.perf_counter()
+        while time.monotonic() < deadline:
+            if all(name in self._published for name in names):
+                break
+            await asyncio.sleep(self.tick)
+        else:
+            logger.warning(f"Metrics not published by the collector yet: {sorted(names)}")
+        record_phase("metric_wait", time.perf_counter() - waited)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if self.reader:
+            published = self._published.get(name)
+            value = published[0] if published else None
+        else:
+            value = self._metrics[name].value
+        return default if value is None else value
+
+    def updated_at(self, name: str) -> Optional[float]:
+        if self.reader:
+            published = self._published.get(name)
+            return published[1] if published else None
+        return self._metrics[name].updated_at
+
+    async def _sync_published(self):
+        known = {name: updated_at for name, (_, updated_at) in self._published.items()}
+        changed = await run_blocking(self.store.changed_metrics, known, operation="stats")
+        if changed:
+            self._published = {**self._published, **changed}
+
+    async def _follow(self):
+        """Reader loop: copy what the collector published since the last tick"""
+        while True:
+            try:
+                await self._sync_published()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading published metrics: {e}")
+            await asyncio.sleep(self.tick)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            for metric in self._metrics.values():
+                if not metric.lock.locked() and now >= metric.next_due:
+                    # Cada métrica roda independente: disco lento não atrasa conexões
+                    task = asyncio.create_task(self.refresh(metric.name))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+            await asyncio.sleep(self.tick)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Rastreamento do processo master do vsftpd e das sessões filhas
+"""
+import re
+import subprocess
+import threading
+import time
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+VERSION_RE = re.compile(r'version\s+([\w.\-]+)')
+# Título de processo com setproctitle_enable=YES: "vsftpd: 10.0.0.5/alice: IDLE"
+PROCTITLE_RE = re.compile(r'vsftpd:\s+(?P<ip>[0-9a-fA-F.:]+)(?:/(?P<user>[^:\s]+))?:?\s*(?P<state>.*)')
+
+
+def detect_vsftpd_version() -> str:
+    """Ask the installed vsftpd binary for its version"""
+    try:
+        # vsftpd -v escreve no fd 0, por isso o redirecionamento
+        result = subprocess.run("vsftpd -v 0>&1", shell=True, capture_output=True, text=True, timeout=5)
+        match = VERSION_RE.search(result.stdout + result.stderr)
+        if match:
+            return f"vsftpd v{match.group(1)}"
+    except Exception as e:
+        logger.error(f"Error detecting vsftpd version: {e}")
+    return "vsftpd"
+
+
+class VsftpdProcessTracker:
+    """Cache the vsftpd master PID and only rescan the process table when it disappears"""
+
+    def __init__(self, process_name: str = "vsftpd"):
+        self.process_name = process_name
+        self.version = "vsftpd"
+        self._lock = threading.Lock()
+        self._master: Optional[psutil.Process] = None
+        # Objetos Process mantidos entre chamadas para cpu_percent() medir o intervalo
+        self._children: Dict[int, psutil.Process] = {}
+
+    def detect_version(self):
+        self.version = detect_vsftpd_version()
+
+    def _is_alive(self, proc: psutil.Process) -> bool:
+        try:
+            return (proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE
+                    and self.process_name in proc.name())
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return False
+
+    def _scan(self) -> Optional[psutil.Process]:
+        candidates = []
+        for proc in psutil.process_iter(['pid', 'ppid', 'name']):
+            if self.process_name in (proc.info['name'] or ''):
+                candidates.append(proc)
+        pids = {p.info['pid'] for p in candidates}
+        # O master é o vsftpd cujo pai não é outro vsftpd
+        for proc in candidates:
+            if proc.info['ppid'] not in pids:
+                return proc
+        return candidates[0] if candidates else None
+
+    def master(self) -> Optional[psutil.Process]:
+        with self._lock:
+            if self._master is None or not self._alive_master():
+                self._master = self._scan()
+                self._children = {}
+                if self._master is not None:
+                    logger.info(f"Tracking vsftpd master PID {self._master.pid}")
+            return self._master
+
+    def _alive_master(self) -> bool:
+        return self._master is not None and self._is_alive(self._master)
+
+    def status(self) -> Dict[str, Any]:
+        """Get vsftpd server status and information"""
+        master = self.master()
+        if master is None:
+            return {"status": "offline", "version": self.version, "uptime": "0", "pid": None}
+        try:
+            uptime_seconds = time.time() - master.create_time()
+        except psutil.Error:
+            return {"status": "offline", "version": self.version, "uptime": "0", "pid": None}
+        return {
+            "status": "online",
+            "version": self.version,
+            "uptime": str(timedelta(seconds=int(uptime_seconds))),
+            "pid": master.pid,
+        }
+
+    def sessions(self) -> List[Dict[str, Any]]:
+        """List the master's child processes with CPU and RSS usage"""
+        master = self.master()
+        if master is None:
+            return []
+        try:
+            children = master.children(recursive=True)
+        except psutil.Error:
+            return []
+
+        sessions = []
+        with self._lock:
+            current = {}
+            for child in children:
+                proc = self._children.get(child.pid, child)
+                try:
+                    with proc.oneshot():
+                        cpu = proc.cpu_percent(None)
+                        rss = proc.memory_info().rss
+                        cmdline = " ".join(proc.cmdline())
+                        started = proc.create_time()
+                        ppid = proc.ppid()
+                except psutil.Error:
+                    continue
+                current[proc.pid] = proc
+                session = {
+                    "pid": proc.pid,
+                    "ppid": ppid,
+                    "cpu_percent": cpu,
+                    "rss_bytes": rss,
+                    "started_at": started,
+                    "remote_ip": None,
+                    "username": None,
+                    "state": None,
+                }
+                match = PROCTITLE_RE.match(cmdline)
+                if match:
+                    session["remote_ip"] = match.group("ip")
+                    session["username"] = match.group("user")
+                    session["state"] = match.group("state") or None
+                sessions.append(session)
+            self._children = current
+        return sessions
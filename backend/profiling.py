@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Diagnóstico: tempo por fase de cada requisição, registro de requisições lentas e profiler por amostragem
+"""
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+# Requisições acima deste tempo vão para o buffer de requisições lentas
+SLOW_REQUEST_MS = float(os.environ.get("FTP_SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_CAPACITY = int(os.environ.get("FTP_SLOW_REQUEST_CAPACITY", "200"))
+MAX_PROFILE_SECONDS = 60.0
+
+
+class RequestTrace:
+    """Per-request wall time split by phase (log parsing, psutil, subprocess, file I/O, ...).
+
+    Phases may nest (a log parse inside an executor call), so they do not
+    have to add up to the total.
+    """
+    __slots__ = ("method", "path", "route", "started_at", "duration_ms", "status", "phases", "_lock")
+
+    def __init__(self, method: str, path: str, route: str):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.status = 0
+        self.phases: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            entry = self.phases.setdefault(phase, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = {name: {"ms": round(total * 1000, 2), "calls": calls}
+                      for name, (total, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0])}
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            "status": self.status,
+            "phases": phases,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def start_trace(method: str, path: str, route: str) -> contextvars.Token:
+    return _current_trace.set(RequestTrace(method, path, route))
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+
+def record_phase(phase: str, seconds: float):
+    """Charge `seconds` to `phase` of the request being served, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+class SlowRequestLog:
+    """Bounded ring buffer of requests slower than `threshold_ms`"""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_MS, capacity: int = SLOW_REQUEST_CAPACITY):
+        self.threshold_ms = threshold_ms
+        self._entries: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def offer(self, trace: RequestTrace) -> bool:
+        if trace.duration_ms < self.threshold_ms:
+            return False
+        entry = trace.to_dict()
+        with self._lock:
+            self._entries.append(entry)
+        return True
+
+    def entries(self, limit: int = 50, route: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent first"""
+        with self._lock:
+            entries = list(self._entries)
+        result = []
+        for entry in reversed(entries):
+            if route is not None and entry["route"] != route:
+                continue
+            result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _frame_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:
+    """Statistical profiler: snapshots every thread's stack at a fixed interval.
+
+    Runs in its own thread with sys._current_frames(), so nothing is
+    instrumented and the overhead is bounded by the sampling rate. Only one
+    profile runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005) -> Optional[Dict[str, Any]]:
+        """Sample for `seconds`; None if another profile is already running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sample(min(seconds, MAX_PROFILE_SECONDS), interval)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> Dict[str, Any]:
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        started = time.time()
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = _frame_stack(frame)
+                if not stack:
+                    continue
+                thread_name = names.get(thread_id) or str(thread_id)
+                stacks[(thread_name, *stack)] += 1
+            samples += 1
+            time.sleep(interval)
+        return {"started_at": started, "seconds": seconds, "interval": interval,
+                "samples": samples, "stacks": stacks}
+
+
+def to_collapsed(profile: Dict[str, Any]) -> str:
+    """Brendan Gregg's collapsed format ("thread;frame;frame count"), for flamegraph.pl / speedscope"""
+    lines = [";".join(stack).replace(" ", "_") + f" {count}"
+             for stack, count in profile["stacks"].most_common()]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Speedscope "sampled" profile, one per thread"""
+    frames: List[Dict[str, str]] = []
+    frame_index: Dict[str, int] = {}
+    by_thread: Dict[str, List] = {}
+    for (thread_name, *stack), count in profile["stacks"].items():
+        indices = []
+        for name in stack:
+            if name not in frame_index:
+                frame_index[name] = len(frames)
+                frames.append({"name": name})
+            indices.append(frame_index[name])
+        samples, weights = by_thread.setdefault(thread_name, ([], []))
+        samples.append(indices)
+        weights.append(count * profile["interval"])
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {"type": "sampled", "name": thread_name, "unit": "seconds", "startValue": 0,
+             "endValue": sum(weights), "samples": samples, "weights": weights}
+            for thread_name, (samples, weights) in by_thread.items()
+        ],
+        "name": f"ftp-dashboard {profile['seconds']:.0f}s",
+        "exporter": "ftp-dashboard",
+    }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Cache de respostas serializadas (e comprimidas) com ETag / If-None-Match
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Collection, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+
+from executor import run_blocking
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele só gzip é oferecido
+    brotli = None
+
+# Corpos menores que isso não compensam comprimir
+MIN_COMPRESS_SIZE = 1024
+# Corpos maiores não ficam em memória (ainda recebem ETag/304)
+MAX_CACHED_BODY = 4 * 1024 * 1024
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def _without(value: Any, volatile: Collection[str]) -> Any:
+    if isinstance(value, dict):
+        return {k: _without(v, volatile) for k, v in value.items() if k not in volatile}
+    if isinstance(value, list):
+        return [_without(item, volatile) for item in value]
+    return value
+
+
+def content_etag(content: Any, volatile: Collection[str] = ()) -> str:
+    """ETag of JSON-compatible `content` ignoring the `volatile` keys at any depth.
+
+    Fields regenerated on every build (e.g. a timestamp) would otherwise
+    change the ETag of an unchanged response, and no client would ever get
+    a 304.
+    """
+    stable = json.dumps(_without(content, volatile), sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha1(stable.encode()).hexdigest()[:24] + '"'
+
+
+def preferred_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CachedBody:
+    """One serialized response plus its compressed variants, built at most once"""
+    __slots__ = ("version", "etag", "body", "media_type", "headers", "encoded", "_lock")
+
+    def __init__(self, version: Hashable, etag: str, body: bytes, media_type: str,
+                 headers: Optional[Dict[str, str]] = None):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, encoding: str) -> bytes:
+        with self._lock:
+            data = self.encoded.get(encoding)
+            if data is None:
+                if encoding == "br":
+                    data = brotli.compress(self.body, quality=5)
+                else:
+                    data = gzip.compress(self.body, compresslevel=6, mtime=0)
+                self.encoded[encoding] = data
+            return data
+
+
+class ResponseCache:
+    """LRU of serialized responses keyed on (endpoint, params), valid while the source version holds.
+
+    The caller passes the current version of whatever the response is built
+    from (typically file (inode, mtime, size) tuples); a hit costs only
+    computing that version, and a client already holding the ETag gets an
+    empty 304.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: Hashable, version: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key: Hashable, version: Hashable, body: bytes, media_type: str,
+              headers: Optional[Dict[str, str]] = None, etag: Optional[str] = None) -> CachedBody:
+        etag = etag or '"' + hashlib.sha1(body).hexdigest()[:24] + '"'
+        entry = CachedBody(version, etag, body, media_type, headers)
+        if len(body) <= MAX_CACHED_BODY:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag,
+                                              "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+
+
+async def respond(request: Request, entry: CachedBody, headers: Optional[Dict[str, str]] = None) -> Response:
+    """304 when the client has this version, otherwise the body (compressed if accepted).
+
+    `headers` overrides the cached ones for values that depend on the request.
+    """
+    extra = {**entry.headers, **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return not_modified(entry.etag, extra)
+    headers = {**extra, "ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    body = entry.body
+    encoding = preferred_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        # Só a primeira compressão de cada versão custa CPU; fora do event loop
+        body = entry.encoded.get(encoding) or await run_blocking(entry.encode, encoding, operation="stats")
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=entry.media_type, headers=headers)
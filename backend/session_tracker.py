@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Sessões FTP reconstruídas a partir do log de protocolo (log_ftp_protocol=YES), por PID do vsftpd
+"""
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+import psutil
+
+from log_parser import LogRecord
+
+logger = logging.getLogger(__name__)
+
+# Sessões encerradas mantidas em memória
+HISTORY_SIZE = 200
+RECENT_COMMANDS = 5
+# Folga entre o horário do log (em segundos inteiros) e o create_time do processo
+PID_CLOCK_SLACK = 2.0
+# Só eventos recentes consultam o processo pai (um PID de log antigo pode ter sido reutilizado)
+PARENT_LOOKUP_MAX_AGE = 60.0
+# Teto de sessões abertas (ex.: log antigo reprocessado antes da primeira reconciliação)
+MAX_OPEN_SESSIONS = 10000
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class Session:
+    """One FTP control connection, from CONNECT until QUIT, timeout or its process going away"""
+    __slots__ = ("pid", "pids", "ip", "user", "connected_at", "login_at", "last_activity",
+                 "commands", "recent_commands", "failed_logins", "transfers", "bytes_in", "bytes_out",
+                 "closed_at", "close_reason", "quitting", "seen_alive_at")
+
+    def __init__(self, pid: int, ip: str, timestamp: float):
+        self.pid = pid
+        # Com separação de privilégios o vsftpd loga de mais de um processo por sessão
+        self.pids = {pid}
+        self.ip = ip
+        self.user: Optional[str] = None
+        self.connected_at = timestamp
+        self.login_at: Optional[float] = None
+        self.last_activity = timestamp
+        self.commands = 0
+        self.recent_commands: deque = deque(maxlen=RECENT_COMMANDS)
+        self.failed_logins = 0
+        self.transfers = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.closed_at: Optional[float] = None
+        self.close_reason: Optional[str] = None
+        self.quitting = False
+        # Última amostra de processos em que a sessão estava viva
+        self.seen_alive_at: Optional[float] = None
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        end = self.closed_at or now
+        return {
+            "pid": self.pid,
+            "pids": sorted(self.pids),
+            "user": self.user,
+            "ip": self.ip,
+            "state": "closed" if self.closed_at else ("logged_in" if self.user else "connected"),
+            "connected_at": _iso(self.connected_at),
+            "login_at": _iso(self.login_at),
+            "last_activity": _iso(self.last_activity),
+            "duration_seconds": round(end - self.connected_at, 1),
+            "idle_seconds": None if self.closed_at else round(max(0.0, now - self.last_activity), 1),
+            "commands": self.commands,
+            "last_command": self.recent_commands[-1] if self.recent_commands else None,
+            "recent_commands": list(self.recent_commands),
+            "failed_logins": self.failed_logins,
+            "transfers": self.transfers,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "closed_at": _iso(self.closed_at),
+            "close_reason": self.close_reason,
+        }
+
+
+class SessionTracker:
+    """Live FTP sessions joined from protocol-log events, answered from memory.
+
+    Events are keyed by vsftpd PID: CONNECT opens a session, LOGIN names its
+    user, FTP commands and transfers update activity and byte counters, and
+    QUIT/221 or a 421 response closes it. Events from a process the tracker
+    has not seen (the unprivileged child after login) are attached to the
+    session of its parent PID. `reconcile` cross-checks open sessions with
+    the live vsftpd processes and closes the ones whose process is gone or
+    was reused, which also cleans up sessions replayed from old log lines.
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self._lock = threading.Lock()
+        # PID (do processo que abriu a sessão ou de um filho) -> sessão aberta
+        self._by_pid: Dict[int, Session] = {}
+        # PID que abriu a sessão -> sessão, em ordem de abertura
+        self._open: Dict[int, Session] = {}
+        self._by_ip: Dict[str, Dict[int, Session]] = {}
+        self._history: deque = deque(maxlen=history_size)
+        # Só há sessões se o log tiver eventos com PID (formato nativo / log_ftp_protocol)
+        self.tracking = False
+
+    def apply_record(self, record: LogRecord):
+        """Account one parsed log record (log listener)"""
+        if record.pid is None:
+            return
+        with self._lock:
+            self.tracking = True
+            self._apply(record)
+
+    def _apply(self, record: LogRecord):
+        action = record.action
+        if action == "CONNECT":
+            previous = self._by_pid.get(record.pid)
+            if previous is not None:
+                self._close(previous, previous.seen_alive_at or previous.last_activity, "replaced")
+            self._open_session(record.pid, record.remote_host, record.timestamp)
+            return
+
+        session = self._by_pid.get(record.pid)
+        if session is not None and session.ip != record.remote_host:
+            # PID reutilizado por outra conexão: a sessão antiga já tinha acabado
+            self._close(session, session.seen_alive_at or session.last_activity, "replaced")
+            session = None
+        if session is None:
+            session = self._adopt(record)
+        session.last_activity = max(session.last_activity, record.timestamp)
+        if record.user and session.user is None and action != "LOGIN":
+            session.user = record.user
+        if action == "LOGIN":
+            if record.ok:
+                session.user = record.user
+                session.login_at = record.timestamp
+            else:
+                session.failed_logins += 1
+        elif action == "FTP command":
+            command = record.path or ""
+            session.commands += 1
+            # A senha nunca vai para a memória/API
+            session.recent_commands.append("PASS <password>" if command.upper().startswith("PASS") else command)
+            if command.upper().startswith("QUIT"):
+                session.quitting = True
+        elif action == "FTP response":
+            response = record.path or ""
+            if response.startswith("421"):
+                self._close(session, record.timestamp, "timeout" if "imeout" in response else "421")
+            elif response.startswith("221") and session.quitting:
+                self._close(session, record.timestamp, "quit")
+        elif record.is_transfer and record.ok:
+            session.transfers += 1
+            if action == "UPLOAD":
+                session.bytes_in += record.bytes
+            else:
+                session.bytes_out += record.bytes
+
+    def _open_session(self, pid: int, ip: str, timestamp: float) -> Session:
+        if len(self._open) >= MAX_OPEN_SESSIONS:
+            oldest = next(iter(self._open.values()))
+            self._close(oldest, oldest.last_activity, "vanished")
+        session = Session(pid, ip, timestamp)
+        self._by_pid[pid] = session
+        self._open[pid] = session
+        self._by_ip.setdefault(ip, {})[pid] = session
+        return session
+
+    def _adopt(self, record: LogRecord) -> Session:
+        """Session for a PID seen for the first time without CONNECT"""
+        parent = None
+        running = False
+        if time.time() - record.timestamp < PARENT_LOOKUP_MAX_AGE:
+            try:
+                parent = self._by_pid.get(psutil.Process(record.pid).ppid())
+                running = True
+            except psutil.Error:
+                pass
+        if parent is None and not running:
+            # Processo já encerrado (log antigo): a sessão mais recente do mesmo IP e usuário
+            candidates = [s for s in self._by_ip.get(record.remote_host, {}).values()
+                          if s.connected_at <= record.timestamp and (s.user is None or s.user == record.user)]
+            parent = max(candidates, key=lambda s: s.connected_at) if candidates else None
+        if parent is not None:
+            parent.pids.add(record.pid)
+            self._by_pid[record.pid] = parent
+            return parent
+        # Conexão aberta antes do início do log atual: a sessão começa no primeiro evento visto
+        return self._open_session(record.pid, record.remote_host, record.timestamp)
+
+    def _close(self, session: Session, timestamp: float, reason: str):
+        if session.closed_at is not None:
+            return
+        session.closed_at = max(timestamp, session.last_activity)
+        session.close_reason = reason
+        for pid in session.pids:
+            if self._by_pid.get(pid) is session:
+                del self._by_pid[pid]
+        del self._open[session.pid]
+        same_ip = self._by_ip[session.ip]
+        del same_ip[session.pid]
+        if not same_ip:
+            del self._by_ip[session.ip]
+        self._history.append(session)
+
+    def reconcile(self, live: Iterable[Dict[str, Any]], sampled_at: float):
+        """Close open sessions whose vsftpd process is gone, given the child processes seen at `sampled_at`.
+
+        `live` holds dicts with "pid", "ppid" and "started_at" (process
+        create time). A PID counts only if its process started before the
+        session's first event, so a reused PID does not keep an old session
+        open. Sessions that began too close to the sample are left alone.
+        """
+        processes = {proc["pid"]: proc for proc in live}
+        with self._lock:
+            # Filhos que ainda não logaram nada também pertencem à sessão do pai
+            for pid, proc in processes.items():
+                session = self._by_pid.get(proc.get("ppid"))
+                if session is not None and pid not in self._by_pid:
+                    session.pids.add(pid)
+                    self._by_pid[pid] = session
+            for session in list(self._open.values()):
+                if session.connected_at + PID_CLOCK_SLACK > sampled_at:
+                    continue
+                alive = any(
+                    pid in processes and (processes[pid].get("started_at") or 0) <= session.connected_at + PID_CLOCK_SLACK
+                    for pid in session.pids
+                )
+                if alive:
+                    session.seen_alive_at = sampled_at
+                else:
+                    # Encerrou entre a última amostra em que estava viva e esta
+                    self._close(session, session.seen_alive_at or session.last_activity, "vanished")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Open sessions (newest first) and the bounded history of closed ones"""
+        now = time.time()
+        with self._lock:
+            active = [session.to_dict(now) for session in reversed(self._open.values())]
+            history = [session.to_dict(now) for session in reversed(self._history)]
+        return {
+            "tracking": self.tracking,
+            "active": active,
+            "online_users": sorted({s["user"] for s in active if s["user"]}),
+            "history": history,
+        }
@@ -106,6 +106,7 @@ xferlog_enable=YES
 xferlog_file=/var/log/vsftpd.log
 xferlog_std_format=NO
 log_ftp_protocol=YES
+setproctitle_enable=YES
 debug_ssl=YES
 connect_from_port_20=YES
 chroot_local_user=YES
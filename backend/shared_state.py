@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Estado compartilhado entre o processo coletor e os workers da API (SQLite + locks de arquivo)
+"""
+import os
+import asyncio
+import json
+import fcntl
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Quanto tempo um worker reaproveita um valor lido antes de consultar o banco de novo
+READ_CACHE_TTL = 0.5
+# Parâmetros por consulta IN (...): abaixo do limite de 999 das versões antigas do SQLite
+IN_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    username TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_bytes ON usage (bytes DESC);
+CREATE TABLE IF NOT EXISTS flags (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """Hold an flock on `path`.lock; serializes writers across worker processes"""
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@asynccontextmanager
+async def async_file_lock(path: str, poll: float = 0.05) -> AsyncIterator[None]:
+    """file_lock for coroutines: polls a non-blocking flock instead of parking an executor thread"""
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(poll)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class SharedState:
+    """Metric snapshots and the per-user usage table, written by the collector and read by workers.
+
+    The collector process publishes each metric after it refreshes; API
+    workers only read (metrics incrementally, flags through a short
+    in-process cache), so log parsing and directory crawls happen once per
+    host however many workers serve HTTP.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # flag -> (lido em, linha)
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def put_metric(self, name: str, value: Any, updated_at: float):
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO metrics (name, value, updated_at) VALUES (?, ?, ?)",
+                    (name, payload, updated_at),
+                )
+
+    def changed_metrics(self, known: Dict[str, float]) -> Dict[str, Tuple[Any, float]]:
+        """(value, updated_at) of every metric published after the `updated_at` in `known`.
+
+        Only the timestamps are read for all metrics; values are fetched and
+        decoded just for the ones that changed.
+        """
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute("SELECT name, updated_at FROM metrics").fetchall()
+            changed = [name for name, updated_at in rows if known.get(name) != updated_at]
+            result = {}
+            for start in range(0, len(changed), IN_BATCH_SIZE):
+                batch = changed[start:start + IN_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for name, value, updated_at in conn.execute(
+                    f"SELECT name, value, updated_at FROM metrics WHERE name IN ({placeholders})", batch
+                ):
+                    result[name] = (json.loads(value), updated_at)
+            return result
+
+    def put_usage(self, changes: Dict[str, Optional[Dict[str, Any]]], replace: bool = False):
+        """Upsert changed users; a None value removes the user. `replace` drops everyone else"""
+        if not changes and not replace:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if replace:
+                    conn.execute("DELETE FROM usage")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO usage (username, bytes, files, scanned_at) VALUES (?, ?, ?, ?)",
+                    [(u, d["bytes"], d["files"], d["scanned_at"]) for u, d in changes.items() if d is not None],
+                )
+                conn.executemany(
+                    "DELETE FROM usage WHERE username = ?",
+                    [(u,) for u, d in changes.items() if d is None],
+                )
+
+    def get_usage(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT bytes, files, scanned_at FROM usage WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"bytes": row[0], "files": row[1], "scanned_at": row[2]}
+
+    def get_usage_many(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Usage of the given users in one query per IN_BATCH_SIZE names (unindexed users are left out)"""
+        result = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(usernames), IN_BATCH_SIZE):
+                batch = usernames[start:start + IN_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for username, size, files, scanned_at in conn.execute(
+                    f"SELECT username, bytes, files, scanned_at FROM usage WHERE username IN ({placeholders})", batch
+                ):
+                    result[username] = {"bytes": size, "files": files, "scanned_at": scanned_at}
+        return result
+
+    def top_usage(self, n: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT username, bytes, files FROM usage ORDER BY bytes DESC LIMIT ?", (n,)
+            ).fetchall()
+        return [{"username": u, "bytes": b, "files": f} for u, b, f in rows]
+
+    def set_flag(self, name: str, value: Any):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO flags (name, value) VALUES (?, ?)",
+                             (name, json.dumps(value)))
+            self._cache.pop(name, None)
+
+    def get_flag(self, name: str, default: Any = None) -> Any:
+        """Value of a flag, reused for READ_CACHE_TTL before reading the database again"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached and now - cached[0] < READ_CACHE_TTL:
+                row = cached[1]
+            else:
+                row = self._connection().execute("SELECT value FROM flags WHERE name = ?", (name,)).fetchone()
+                self._cache[name] = (now, row)
+        return json.loads(row[0]) if row else default
+
+
+class SharedUsage:
+    """Read side of the usage index for API workers (same interface as UsageIndex)"""
+
+    def __init__(self, state: SharedState):
+        self.state = state
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.state.get_flag("usage_ready", False))
+
+    @property
+    def version(self) -> int:
+        return self.state.get_flag("usage_version", 0)
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        return self.state.get_usage(username)
+
+    def get_many(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self.state.get_usage_many(usernames)
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        return self.state.top_usage(n)
+
+    def forget(self, username: str):
+        # O coletor remove o usuário da memória no próximo crawl completo
+        self.state.put_usage({username: None})
@@ -1,12 +1,61 @@
 #!/usr/bin/env python3
+"""
+Inicialização do backend.
+
+Desenvolvimento: um processo com reload. Produção (ENVIRONMENT=production)
+sem reload; com --workers N > 1 sobe um processo coletor (métricas, log,
+uso de disco) e N workers uvicorn que leem o estado compartilhado.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+
 import uvicorn
-from main import app
+
+
+def run_collector():
+    os.environ["FTP_ROLE"] = "collector"
+    import main
+    try:
+        asyncio.run(main.run_collector())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTP Dashboard backend")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("FTP_WORKERS", "1")),
+                        help="Processos uvicorn (>1 ativa o coletor compartilhado)")
+    parser.add_argument("--collector", action="store_true", help="Roda só o processo coletor")
+    args = parser.parse_args()
+
+    if args.collector:
+        run_collector()
+        return
+
+    production = os.environ.get("ENVIRONMENT") == "production"
+    if args.workers <= 1:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=not production, log_level="info")
+        return
+
+    # Um único coletor por host; os workers só servem HTTP
+    collector = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--collector"],
+                                 env={**os.environ, "FTP_ROLE": "collector"})
+    os.environ["FTP_ROLE"] = "worker"
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
+    finally:
+        collector.send_signal(signal.SIGTERM)
+        try:
+            collector.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            collector.kill()
+
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+    main()
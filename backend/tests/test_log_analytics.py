@@ -0,0 +1,45 @@
+import random
+import time
+
+import log_analytics
+from log_analytics import LogAnalytics, WINDOWS
+from log_parser import LogRecord
+
+
+def transfer(timestamp: float, user: str) -> LogRecord:
+    return LogRecord(timestamp, 1, user, True, "DOWNLOAD", "10.0.0.1", f"/{user}/file", bytes_=100)
+
+
+def test_top_users_with_more_users_than_capacity(monkeypatch):
+    capacity = 50
+    monkeypatch.setattr(log_analytics, "USER_CAPACITY", capacity)
+    rng = random.Random(7)
+    now = time.time()
+    # 7 dias com ~120 transferências por hora: 5% de um usuário, o resto espalhado entre 300
+    records = []
+    for hour in range(7 * 24):
+        for _ in range(120):
+            user = "heavy" if rng.random() < 0.05 else f"user{rng.randrange(300)}"
+            records.append(transfer(now - hour * 3600 - rng.random() * 3600, user))
+    records.sort(key=lambda record: record.timestamp)
+    analytics = LogAnalytics()
+    for record in records:
+        analytics.apply_record(record)
+
+    report = analytics.report()
+    for window, (resolution, duration) in WINDOWS.items():
+        top_users = report[window]["top_users"]
+        events = report[window]["events"]
+        heavy = top_users[0]
+        assert heavy["user"] == "heavy", window
+        # Janelas são arredondadas para o bucket: a real fica entre a janela exata e a estendida
+        exact = sum(1 for r in records if r.user == "heavy" and r.timestamp >= now - duration)
+        extended = sum(1 for r in records if r.user == "heavy" and r.timestamp >= now - duration - resolution)
+        assert heavy["transfers"] >= exact, window
+        assert heavy["transfers"] - heavy["error"] <= extended, window
+        assert heavy["error"] <= events / capacity, window
+        # Ordenado pela contagem garantida, e nada é publicado com mais erro do que ela
+        guaranteed = [entry["transfers"] - entry["error"] for entry in top_users]
+        assert guaranteed == sorted(guaranteed, reverse=True), window
+        for entry in top_users:
+            assert entry["error"] <= entry["transfers"] - entry["error"], (window, entry)
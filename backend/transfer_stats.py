@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Série temporal de transferências (buckets por minuto e por hora) em SQLite
+"""
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log_parser import LogRecord
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+# Buckets por minuto ficam 7 dias; por hora, 1 ano
+RETENTION = {MINUTE: 7 * 86400, HOUR: 365 * 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    resolution INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    uploads INTEGER NOT NULL DEFAULT 0,
+    downloads INTEGER NOT NULL DEFAULT 0,
+    upload_bytes INTEGER NOT NULL DEFAULT 0,
+    download_bytes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bucket_users (
+    resolution INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (resolution, ts, username)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class TransferStatsStore:
+    """Append-only per-minute and per-hour transfer buckets fed from the log-ingest path.
+
+    Transfers are buffered in memory by `apply_record` and written in one
+    transaction by `flush`, together with the log position (inode, offset)
+    of the last buffered line, so a restart that re-reads the live log skips
+    exactly the lines already stored. Minute buckets are pruned after a
+    week, so longer ranges are served from hour buckets.
+    """
+
+    def __init__(self, db_path: str, position: Optional[Callable[[], Tuple[Optional[int], int]]] = None):
+        self.db_path = db_path
+        # Posição no log da linha sendo entregue (LogIngestor.position)
+        self._position = position
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[tuple, List[int]] = {}
+        self._pending_users: set = set()
+        self._cursor: Optional[Tuple[int, int]] = None
+        self._pending_cursor: Optional[Tuple[int, int]] = None
+        # Bancos anteriores ao cursor guardavam só o horário do último evento
+        self._legacy_high_water: Optional[float] = None
+        self._last_prune = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            if "cursor_inode" in meta:
+                self._cursor = (int(meta["cursor_inode"]), int(meta["cursor_offset"]))
+            elif "high_water" in meta:
+                self._legacy_high_water = float(meta["high_water"])
+        return self._conn
+
+    def resume_offset(self, inode: int) -> Optional[int]:
+        """Offset of the live log (file `inode`) up to which lines are already stored; None if unknown"""
+        with self._lock:
+            self._connection()
+            if self._cursor is not None and self._cursor[0] == inode:
+                return self._cursor[1]
+            return None
+
+    def _seen(self, ts: float, position: Optional[Tuple[Optional[int], int]]) -> bool:
+        if position is not None and position[0] is not None:
+            if self._cursor is not None:
+                return position[0] == self._cursor[0] and position[1] <= self._cursor[1]
+            if self._legacy_high_water is not None:
+                # Só no primeiro ciclo após a atualização: o mesmo segundo pode ter linhas não gravadas
+                return ts < self._legacy_high_water
+            return False
+        return self._legacy_high_water is not None and ts < self._legacy_high_water
+
+    def apply_record(self, record: LogRecord):
+        """Buffer one transfer record (log listener)"""
+        if not record.is_transfer or not record.ok or not record.user:
+            return
+        ts = record.timestamp
+        username, size = record.user, record.bytes
+        position = self._position() if self._position else None
+        with self._lock:
+            self._connection()
+            if self._seen(ts, position):
+                return
+            upload = record.action == "UPLOAD"
+            for resolution in (MINUTE, HOUR):
+                bucket = int(ts) // resolution * resolution
+                counters = self._pending.setdefault((resolution, bucket), [0, 0, 0, 0])
+                counters[0 if upload else 1] += 1
+                counters[2 if upload else 3] += size
+                self._pending_users.add((resolution, bucket, username))
+            if position is not None and position[0] is not None:
+                self._pending_cursor = (position[0], position[1])
+
+    def flush(self):
+        """Write buffered buckets in a single transaction and prune expired ones"""
+        with self._lock:
+            conn = self._connection()
+            if self._pending:
+                pending, self._pending = self._pending, {}
+                users, self._pending_users = self._pending_users, set()
+                cursor, self._pending_cursor = self._pending_cursor, None
+                with conn:
+                    conn.executemany(
+                        """INSERT INTO buckets (resolution, ts, uploads, downloads, upload_bytes, download_bytes)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (resolution, ts) DO UPDATE SET
+                             uploads = uploads + excluded.uploads,
+                             downloads = downloads + excluded.downloads,
+                             upload_bytes = upload_bytes + excluded.upload_bytes,
+                             download_bytes = download_bytes + excluded.download_bytes""",
+                        [(res, ts, *counters) for (res, ts), counters in pending.items()],
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO bucket_users (resolution, ts, username) VALUES (?, ?, ?)",
+                        list(users),
+                    )
+                    if cursor is not None:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                            [("cursor_inode", str(cursor[0])), ("cursor_offset", str(cursor[1]))],
+                        )
+                        conn.execute("DELETE FROM meta WHERE key = 'high_water'")
+                if cursor is not None:
+                    self._cursor = cursor
+                    self._legacy_high_water = None
+            if time.time() - self._last_prune > HOUR:
+                self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        now = time.time()
+        with conn:
+            for resolution, retention in RETENTION.items():
+                cutoff = int(now - retention)
+                conn.execute("DELETE FROM buckets WHERE resolution = ? AND ts < ?", (resolution, cutoff))
+                conn.execute("DELETE FROM bucket_users WHERE resolution = ? AND ts < ?", (resolution, cutoff))
+        self._last_prune = now
+
+    def query(self, start: float, end: float, step: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """Aggregate buckets in [start, end) into points; return the step used and the points.
+
+        `step` must be a whole number of minutes. Hour buckets serve steps
+        that are whole hours; ranges older than the minute retention only
+        have hour buckets, so their step is rounded up to a whole hour.
+        """
+        resolution = MINUTE
+        if step % HOUR == 0 or start < time.time() - RETENTION[MINUTE]:
+            resolution = HOUR
+        step = -(-step // resolution) * resolution
+        # Inclui o que ainda está no buffer: sem isso a série fica vazia até o próximo flush
+        self.flush()
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                """SELECT ts / :step * :step AS point, SUM(uploads), SUM(downloads),
+                          SUM(upload_bytes), SUM(download_bytes)
+                   FROM buckets WHERE resolution = :res AND ts >= :start AND ts < :end
+                   GROUP BY point ORDER BY point""",
+                {"step": step, "res": resolution, "start": int(start), "end": int(end)},
+            ).fetchall()
+            users = dict(conn.execute(
+                """SELECT ts / :step * :step AS point, COUNT(DISTINCT username)
+                   FROM bucket_users WHERE resolution = :res AND ts >= :start AND ts < :end
+                   GROUP BY point""",
+                {"step": step, "res": resolution, "start": int(start), "end": int(end)},
+            ).fetchall())
+        return step, [
+            {
+                "timestamp": datetime.fromtimestamp(point).isoformat(),
+                "uploads": uploads,
+                "downloads": downloads,
+                "upload_bytes": upload_bytes,
+                "download_bytes": download_bytes,
+                "distinct_users": users.get(point, 0),
+            }
+            for point, uploads, downloads, upload_bytes, download_bytes in rows
+        ]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Remoção paralela de árvores de diretórios grandes, com progresso e retomável
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Progresso é reportado a cada N arquivos removidos (e ao fim de cada diretório)
+REPORT_EVERY = 1000
+MAX_ERRORS = 20
+
+ProgressCallback = Callable[..., None]
+
+
+class Stopped(Exception):
+    """The caller asked the removal to stop (the work done so far was reported)"""
+
+
+def _clear_files(path: str, on_progress: ProgressCallback, errors: List[str],
+                 should_stop: Callable[[], bool]) -> List[str]:
+    """Unlink every non-directory entry of `path`; return its subdirectories"""
+    subdirs: List[str] = []
+    files = freed = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if should_stop():
+                    break
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    if len(errors) < MAX_ERRORS:
+                        errors.append(f"{entry.path}: {e.strerror}")
+                    continue
+                files += 1
+                freed += size
+                if files >= REPORT_EVERY:
+                    on_progress(files=files, bytes=freed)
+                    files = freed = 0
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        if len(errors) < MAX_ERRORS:
+            errors.append(f"{path}: {e.strerror}")
+    if files:
+        on_progress(files=files, bytes=freed)
+    return subdirs
+
+
+def _remove_dir(path: str, on_progress: ProgressCallback, errors: List[str]):
+    try:
+        os.rmdir(path)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        if len(errors) < MAX_ERRORS:
+            errors.append(f"{path}: {e.strerror}")
+        return
+    on_progress(dirs=1)
+
+
+def remove_tree(path: str, on_progress: ProgressCallback, workers: int = 4,
+                errors: Optional[List[str]] = None,
+                should_stop: Callable[[], bool] = lambda: False) -> Tuple[bool, List[str]]:
+    """Delete `path` and everything under it without following symlinks.
+
+    Directories are emptied level by level with `workers` threads (files
+    first, breadth-first), then removed deepest level first.
+    `on_progress(files=, bytes=, dirs=)` receives increments as the work
+    goes. Already-missing entries are skipped, so calling it again after
+    an interruption resumes where the last run stopped. Returns (whether
+    `path` is gone, errors); raises Stopped as soon as `should_stop()`
+    returns True.
+    """
+    errors = [] if errors is None else errors
+    if os.path.islink(path):
+        os.unlink(path)
+        return True, errors
+    if not os.path.isdir(path):
+        return not os.path.exists(path), errors
+    levels: List[List[str]] = []
+    current = [path]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tree-remove") as pool:
+        while current:
+            levels.append(current)
+            found = pool.map(lambda d: _clear_files(d, on_progress, errors, should_stop), current)
+            current = [subdir for subdirs in found for subdir in subdirs]
+            if should_stop():
+                raise Stopped(path)
+        for level in reversed(levels):
+            list(pool.map(lambda d: _remove_dir(d, on_progress, errors), level))
+    gone = not os.path.exists(path)
+    if not gone:
+        logger.warning(f"Could not remove {path} completely: {errors[:3]}")
+    return gone, errors
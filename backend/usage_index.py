@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Índice de uso de disco por usuário em /home/ftpusers
+"""
+import os
+import heapq
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from log_parser import LogRecord
+
+logger = logging.getLogger(__name__)
+
+# Eventos que alteram a árvore do usuário
+TREE_ACTIONS = ("UPLOAD", "DELETE", "RMDIR", "RENAME")
+
+
+def scan_tree(path: str) -> Tuple[int, int]:
+    """Return (total bytes, file count) under `path` using os.scandir cached stat data"""
+    total_bytes = 0
+    files = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total_bytes += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total_bytes, files
+
+
+class UserUsage:
+    __slots__ = ("bytes", "files", "scanned_at")
+
+    def __init__(self, bytes_: int = 0, files: int = 0, scanned_at: float = 0.0):
+        self.bytes = bytes_
+        self.files = files
+        self.scanned_at = scanned_at
+
+
+class UsageIndex:
+    """Per-user bytes and file counts, crawled once and then kept current from the log.
+
+    UPLOAD entries in vsftpd.log add their byte count to the user's total
+    right away, but the log cannot tell a new file from an overwrite or a
+    resumed append, so they also mark the user dirty. DELETE/RMDIR/RENAME
+    entries carry no size and only mark the user dirty. Dirty users have
+    only their own tree rescanned on the next maintenance pass.
+    """
+
+    def __init__(self, base_dir: str, workers: int = 8):
+        self.base_dir = base_dir
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._usage: Dict[str, UserUsage] = {}
+        self._dirty: Set[str] = set()
+        # Usuários alterados desde o último drain_changes (publicação para os workers)
+        self._changed: Set[str] = set()
+        self._full_sync = False
+        self._version = 0
+        self._top_cache: Dict[int, Tuple[int, List[Dict[str, Any]]]] = {}
+        self.ready = False
+
+    def _user_dirs(self) -> List[str]:
+        try:
+            with os.scandir(self.base_dir) as it:
+                return [e.name for e in it if e.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+
+    def _scan_user(self, username: str):
+        started = time.time()
+        total_bytes, files = scan_tree(os.path.join(self.base_dir, username))
+        with self._lock:
+            previous = self._usage.get(username)
+            self._usage[username] = UserUsage(total_bytes, files, started)
+            self._changed.add(username)
+            # Rescan que só confirma os totais não invalida os caches de resposta
+            if previous is None or (previous.bytes, previous.files) != (total_bytes, files):
+                self._version += 1
+
+    def crawl_all(self):
+        """Initial (or reconciliation) crawl: one parallel os.scandir walk per user directory"""
+        started = time.time()
+        usernames = self._user_dirs()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="usage-scan") as pool:
+            list(pool.map(self._scan_user, usernames))
+        with self._lock:
+            removed = set(self._usage) - set(usernames)
+            for username in removed:
+                del self._usage[username]
+            self._dirty.clear()
+            self._full_sync = True
+            if removed:
+                self._version += 1
+        self.ready = True
+        logger.info(f"Usage index: crawled {len(usernames)} users in {time.time() - started:.1f}s")
+
+    def rescan_dirty(self):
+        """Rescan only the users whose trees changed in ways the log cannot quantify"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for username in dirty:
+            self._scan_user(username)
+
+    def apply_record(self, record: LogRecord):
+        """Update totals from one vsftpd log record (log listener)"""
+        if not record.ok or not record.user or record.action not in TREE_ACTIONS:
+            return
+        event_time = record.timestamp
+        username = record.user
+        with self._lock:
+            usage = self._usage.get(username)
+            # Eventos anteriores ao último scan já estão refletidos no total
+            if usage is None or event_time < usage.scanned_at:
+                if usage is None and self.ready:
+                    self._dirty.add(username)
+                return
+            self._dirty.add(username)
+            if record.action == "UPLOAD":
+                # Estimativa até o rescan (conta como arquivo novo)
+                usage.bytes += record.bytes
+                usage.files += 1
+                self._changed.add(username)
+                self._version += 1
+
+    def forget(self, username: str):
+        with self._lock:
+            self._usage.pop(username, None)
+            self._dirty.discard(username)
+            self._changed.add(username)
+            self._version += 1
+
+    @property
+    def version(self) -> int:
+        """Bumped when some user's bytes or file count change (for response caches)"""
+        return self._version
+
+    def drain_changes(self) -> Tuple[Dict[str, Optional[Dict[str, Any]]], bool]:
+        """Users changed since the last call (None = removed) and whether a full crawl happened.
+
+        After a full crawl every user is returned, so the consumer can replace
+        its copy instead of merging.
+        """
+        with self._lock:
+            if self._full_sync:
+                changed = set(self._usage)
+            else:
+                changed = self._changed
+            full, self._full_sync, self._changed = self._full_sync, False, set()
+            changes = {}
+            for username in changed:
+                usage = self._usage.get(username)
+                changes[username] = None if usage is None else {
+                    "bytes": usage.bytes, "files": usage.files, "scanned_at": usage.scanned_at}
+            return changes, full
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            usage = self._usage.get(username)
+            if usage is None:
+                return None
+            return {"bytes": usage.bytes, "files": usage.files, "scanned_at": usage.scanned_at}
+
+    def get_many(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Usage of the given users; users not indexed yet are left out"""
+        with self._lock:
+            return {
+                username: {"bytes": usage.bytes, "files": usage.files, "scanned_at": usage.scanned_at}
+                for username in usernames
+                if (usage := self._usage.get(username)) is not None
+            }
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        """Largest users by bytes (cached until the index changes)"""
+        with self._lock:
+            cached = self._top_cache.get(n)
+            if cached and cached[0] == self._version:
+                return cached[1]
+            largest = heapq.nlargest(n, self._usage.items(), key=lambda item: item[1].bytes)
+            result = [{"username": u, "bytes": usage.bytes, "files": usage.files} for u, usage in largest]
+            self._top_cache = {n: (self._version, result)}
+            return result
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Índice em memória do arquivo de usuários virtuais (virtual_users.txt)
+"""
+import os
+import bisect
+import json
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from shared_state import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class UserStore:
+    """Username -> password index over the vsftpd users file.
+
+    The file (one username line followed by one password line) is parsed
+    once and reparsed only when its inode, mtime or size changes, so
+    lookups and counts cost a single stat(). A sorted list of usernames
+    backs prefix filtering and pagination. Writes hold an flock on the file
+    and recheck it first, so several API worker processes can share it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._version: Optional[Tuple[int, int, int]] = None
+        self._users: Dict[str, str] = {}
+        self._sorted: List[str] = []
+
+    def _stat_version(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _ensure_fresh(self):
+        version = self._stat_version()
+        if version == self._version:
+            return
+        users: Dict[str, str] = {}
+        if version is not None:
+            with open(self.path, 'r') as f:
+                lines = f.read().splitlines()
+            for i in range(0, len(lines) - 1, 2):
+                username = lines[i].strip()
+                if username:
+                    users[username] = lines[i + 1].strip()
+        self._users = users
+        self._sorted = sorted(users)
+        self._version = version
+        logger.info(f"Loaded {len(users)} users from {self.path}")
+
+    def exists(self, username: str) -> bool:
+        with self._lock:
+            self._ensure_fresh()
+            return username in self._users
+
+    def count(self) -> int:
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._users)
+
+    def list(self, offset: int = 0, limit: Optional[int] = None, prefix: str = "") -> Tuple[List[str], int]:
+        """Return a page of usernames in sorted order and the total matching `prefix`"""
+        with self._lock:
+            self._ensure_fresh()
+            lo = bisect.bisect_left(self._sorted, prefix) if prefix else 0
+            hi = bisect.bisect_left(self._sorted, prefix + "\U0010ffff") if prefix else len(self._sorted)
+            start = lo + offset
+            end = hi if limit is None else min(hi, start + limit)
+            return self._sorted[start:end], hi - lo
+
+    def add(self, username: str, password: str) -> bool:
+        """Append a user to the file; return False if it already exists"""
+        with self._lock, file_lock(self.path):
+            self._ensure_fresh()
+            if username in self._users:
+                return False
+            with open(self.path, 'a') as f:
+                f.write(f"{username}\n{password}\n")
+            self._users[username] = password
+            bisect.insort(self._sorted, username)
+            self._version = self._stat_version()
+            return True
+
+    def add_many(self, users: List[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+        """Append several users with a single write; return (added, already existing)"""
+        with self._lock, file_lock(self.path):
+            self._ensure_fresh()
+            added, existing = [], []
+            lines = []
+            for username, password in users:
+                if username in self._users:
+                    existing.append(username)
+                    continue
+                self._users[username] = password
+                bisect.insort(self._sorted, username)
+                lines.append(f"{username}\n{password}\n")
+                added.append(username)
+            if lines:
+                with open(self.path, 'a') as f:
+                    f.writelines(lines)
+                self._version = self._stat_version()
+            return added, existing
+
+    def remove_many(self, usernames: List[str]) -> Tuple[List[str], List[str]]:
+        """Remove several users with a single rewrite; return (removed, not found)"""
+        with self._lock, file_lock(self.path):
+            self._ensure_fresh()
+            removed, missing = [], []
+            for username in usernames:
+                if self._users.pop(username, None) is None:
+                    missing.append(username)
+                else:
+                    removed.append(username)
+            if removed:
+                self._sorted = sorted(self._users)
+                self._write_all()
+            return removed, missing
+
+    def export(self, path: str):
+        """Write a consistent snapshot of the users file to `path` (mode 600)"""
+        with self._lock:
+            self._ensure_fresh()
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(f"{u}\n{p}\n" for u, p in self._users.items())
+
+    def _write_all(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{u}\n{p}\n" for u, p in self._users.items())
+        if os.path.exists(self.path):
+            # Preserva dono e permissões do arquivo original
+            st = os.stat(self.path)
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp_path, self.path)
+        self._version = self._stat_version()
+
+
+class QuotaStore:
+    """Per-user quota (MB) persisted as a JSON object next to the users file.
+
+    Reloaded when the file changes on disk (another worker process wrote it).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._quotas: Optional[Dict[str, int]] = None
+        self._version: Optional[Tuple[int, int, int]] = None
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            st = os.stat(self.path)
+            version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            version = None
+        if self._quotas is None or version != self._version:
+            try:
+                with open(self.path, 'r') as f:
+                    self._quotas = {k: int(v) for k, v in json.load(f).items()}
+            except FileNotFoundError:
+                self._quotas = {}
+            self._version = version
+        return self._quotas
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._quotas, f)
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._version = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, username: str, default: int) -> int:
+        with self._lock:
+            return self._load().get(username, default)
+
+    def set_many(self, quotas: Dict[str, int]):
+        with self._lock, file_lock(self.path):
+            self._load().update(quotas)
+            self._save()
+
+    def remove_many(self, usernames: List[str]):
+        with self._lock, file_lock(self.path):
+            quotas = self._load()
+            changed = [quotas.pop(u) for u in usernames if u in quotas]
+            if changed:
+                self._save()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Motor de configuração do vsftpd.conf: modelo ordenado, diff semântico, validação,
+escrita atômica e aplicação pelo caminho mais barato (SIGHUP ou restart do serviço)
+"""
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+from process_tracker import VsftpdProcessTracker
+from shared_state import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Lidas só na partida do master (socket de escuta / modo de execução): exigem restart.
+# O resto é relido no SIGHUP e vale para as próximas sessões.
+RESTART_KEYS = frozenset({
+    "listen", "listen_ipv6", "listen_port", "listen_address", "listen_address6", "background",
+    "run_as_launching_user",
+})
+
+BOOL_VALUES = {"YES": True, "TRUE": True, "1": True, "NO": False, "FALSE": False, "0": False}
+INT_KEYS = frozenset({
+    "listen_port", "ftp_data_port", "pasv_min_port", "pasv_max_port", "max_clients", "max_per_ip",
+    "idle_session_timeout", "data_connection_timeout", "local_max_rate", "anon_max_rate",
+})
+
+# Tempo máximo esperando o vsftpd voltar a aceitar conexões após um restart
+RESTART_READY_TIMEOUT = 5.0
+# Limite para o systemctl devolver o controle
+SYSTEMCTL_TIMEOUT = 30.0
+# Após um SIGHUP, quanto esperar para confirmar que o master não morreu com a nova config
+RELOAD_SETTLE = 0.2
+
+
+class ConfigValidationError(ValueError):
+    """The requested configuration is invalid; nothing was written"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def normalize(key: str, value: str) -> Any:
+    """Value as vsftpd interprets it (YES/true/1 are the same boolean, "021" is 21)"""
+    value = value.strip()
+    if key in INT_KEYS:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    upper = value.upper()
+    if upper in BOOL_VALUES:
+        return BOOL_VALUES[upper]
+    return value
+
+
+class VsftpdConf:
+    """vsftpd.conf as an ordered list of lines, keeping comments, blank lines and key order.
+
+    vsftpd applies the last occurrence of a key, so lookups and updates
+    target that line; new keys are appended at the end.
+    """
+
+    def __init__(self, lines: Optional[List[str]] = None):
+        self.lines: List[str] = list(lines or [])
+        self._index: Dict[str, int] = {}
+        for i, line in enumerate(self.lines):
+            key = self._key_of(line)
+            if key is not None:
+                self._index[key] = i
+
+    @staticmethod
+    def _key_of(line: str) -> Optional[str]:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#") or "=" not in stripped:
+            return None
+        return stripped.split("=", 1)[0].strip()
+
+    @classmethod
+    def parse(cls, text: str) -> "VsftpdConf":
+        return cls(text.splitlines())
+
+    def get(self, key: str) -> Optional[str]:
+        i = self._index.get(key)
+        if i is None:
+            return None
+        return self.lines[i].split("=", 1)[1].strip()
+
+    def items(self) -> Dict[str, str]:
+        return {key: self.get(key) for key in self._index}
+
+    def diff(self, values: Dict[str, str]) -> Dict[str, Tuple[Optional[str], str]]:
+        """Keys whose value would change in meaning: key -> (current, requested)"""
+        changes = {}
+        for key, value in values.items():
+            current = self.get(key)
+            if current is None or normalize(key, current) != normalize(key, value):
+                changes[key] = (current, value)
+        return changes
+
+    def updated(self, values: Dict[str, str]) -> "VsftpdConf":
+        """Copy with `values` applied in place (appended when the key is new)"""
+        conf = VsftpdConf(self.lines)
+        for key, value in values.items():
+            i = conf._index.get(key)
+            if i is None:
+                conf._index[key] = len(conf.lines)
+                conf.lines.append(f"{key}={value}")
+            else:
+                conf.lines[i] = f"{key}={value}"
+        return conf
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def dashboard_to_vsftpd(config: Dict[str, Any]) -> Dict[str, str]:
+    """Map the dashboard settings (config.json) to vsftpd.conf keys"""
+    passive = str(config.get("passive_ports", "40000-40100")).split("-")
+    return {
+        "listen_port": str(config.get("ftp_port", 21)),
+        "pasv_min_port": passive[0].strip(),
+        "pasv_max_port": passive[-1].strip(),
+        "max_clients": str(config.get("max_clients", 50)),
+        "max_per_ip": str(config.get("max_per_ip", 10)),
+        "ssl_enable": "YES" if config.get("ssl_enabled", True) else "NO",
+        "rsa_cert_file": str(config.get("ssl_cert_file", "/etc/ssl/cert.pem")),
+        "rsa_private_key_file": str(config.get("ssl_key_file", "/etc/ssl/key.pem")),
+    }
+
+
+def _int_in_range(values: Dict[str, str], key: str, low: int, high: int, errors: List[str]) -> Optional[int]:
+    raw = values.get(key)
+    if raw is None:
+        return None
+    try:
+        number = int(raw)
+    except ValueError:
+        errors.append(f"{key} must be an integer, got {raw!r}")
+        return None
+    if not low <= number <= high:
+        errors.append(f"{key} must be between {low} and {high}, got {number}")
+        return None
+    return number
+
+
+def validate(effective: Dict[str, str], changes: Dict[str, Tuple[Optional[str], str]]) -> List[str]:
+    """Check the configuration vsftpd would end up with; return the problems found"""
+    errors: List[str] = []
+    for key, value in effective.items():
+        if "\n" in value or "\r" in value:
+            errors.append(f"{key} must be a single line")
+    listen_port = _int_in_range(effective, "listen_port", 1, 65535, errors)
+    pasv_min = _int_in_range(effective, "pasv_min_port", 1024, 65535, errors)
+    pasv_max = _int_in_range(effective, "pasv_max_port", 1024, 65535, errors)
+    if pasv_min is not None and pasv_max is not None:
+        if pasv_min > pasv_max:
+            errors.append(f"pasv_min_port ({pasv_min}) must not exceed pasv_max_port ({pasv_max})")
+        elif listen_port is not None and pasv_min <= listen_port <= pasv_max:
+            errors.append(f"listen_port ({listen_port}) falls inside the passive port range")
+    max_clients = _int_in_range(effective, "max_clients", 0, 100000, errors)
+    max_per_ip = _int_in_range(effective, "max_per_ip", 0, 100000, errors)
+    if max_clients and max_per_ip and max_per_ip > max_clients:
+        errors.append(f"max_per_ip ({max_per_ip}) must not exceed max_clients ({max_clients})")
+    # Com SSL ligado o vsftpd não sobe sem certificado; só confere quando algo de SSL muda
+    ssl_keys = {"ssl_enable", "rsa_cert_file", "rsa_private_key_file"}
+    if normalize("ssl_enable", effective.get("ssl_enable", "NO")) is True and ssl_keys & set(changes):
+        for key in ("rsa_cert_file", "rsa_private_key_file"):
+            path = effective.get(key)
+            if path and not os.access(path, os.R_OK):
+                errors.append(f"{key} {path} is not readable")
+    return errors
+
+
+class VsftpdConfigEngine:
+    """Apply dashboard settings to vsftpd.conf transactionally.
+
+    The file is parsed once and reparsed only when its (inode, mtime, size)
+    changes. An apply with no semantic change touches nothing. Otherwise the
+    new file is written atomically (temp + fsync + rename, previous copy in
+    .bak) and vsftpd picks it up with a SIGHUP to the master (open sessions
+    keep running), or with `systemctl restart` of its service when a
+    RESTART_KEYS key changed, so the process stays under the service
+    manager. If vsftpd does not survive the change, the previous file is
+    restored and the service is started again.
+    """
+
+    def __init__(self, path: str, tracker: VsftpdProcessTracker, service: str = "vsftpd"):
+        self.path = path
+        self.tracker = tracker
+        self.service = service
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[int, int, int]] = None
+        self._conf = VsftpdConf()
+
+    def _stat_version(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> VsftpdConf:
+        with self._lock:
+            version = self._stat_version()
+            if version != self._version:
+                if version is None:
+                    self._conf = VsftpdConf()
+                else:
+                    with open(self.path, "r") as f:
+                        self._conf = VsftpdConf.parse(f.read())
+                self._version = version
+            return self._conf
+
+    def _write(self, conf: VsftpdConf):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(conf.render())
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(self.path):
+            st = os.stat(self.path)
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+            # Cópia da versão anterior para restauração manual
+            shutil.copy2(self.path, f"{self.path}.bak")
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._conf = conf
+            self._version = self._stat_version()
+
+    def plan(self, config: Dict[str, Any]) -> Tuple[VsftpdConf, VsftpdConf, Dict[str, Tuple[Optional[str], str]]]:
+        """(current, updated, changes) for the dashboard settings; raises ConfigValidationError"""
+        current = self.load()
+        values = dashboard_to_vsftpd(config)
+        changes = current.diff(values)
+        updated = current.updated({key: new for key, (_, new) in changes.items()})
+        errors = validate({**current.items(), **values}, changes)
+        if errors:
+            raise ConfigValidationError(errors)
+        return current, updated, changes
+
+    def apply(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate, write and load the settings into vsftpd; return what changed and how it was applied"""
+        started = time.perf_counter()
+        with file_lock(self.path):
+            current, updated, changes = self.plan(config)
+            report: Dict[str, Any] = {
+                "path": self.path,
+                "changed": {key: {"old": old, "new": new} for key, (old, new) in changes.items()},
+                "action": "none",
+                "reload_ms": None,
+            }
+            if not changes:
+                return report
+            self._write(updated)
+            master = self.tracker.master()
+            if master is None:
+                report["action"] = "written"
+                report["detail"] = "vsftpd is not running; the new settings apply on its next start"
+            else:
+                restart = bool(RESTART_KEYS & set(changes))
+                report["action"] = "restart" if restart else "reload"
+                signal_started = time.perf_counter()
+                try:
+                    if restart:
+                        self._restart(updated)
+                    else:
+                        self._reload(master)
+                except Exception as e:
+                    logger.error(f"vsftpd rejected the new configuration, restoring the previous one: {e}")
+                    self._write(current)
+                    try:
+                        self._recover()
+                    except Exception as recover_error:
+                        logger.error(f"Could not start vsftpd again: {recover_error}")
+                    raise RuntimeError(f"vsftpd did not accept the new configuration (restored): {e}")
+                report["reload_ms"] = round((time.perf_counter() - signal_started) * 1000, 1)
+        report["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"vsftpd.conf applied ({report['action']}): {sorted(changes)}")
+        return report
+
+    def _reload(self, master: psutil.Process):
+        master.send_signal(signal.SIGHUP)
+        time.sleep(RELOAD_SETTLE)
+        current = self.tracker.master()
+        if current is None or current.pid != master.pid:
+            raise RuntimeError("vsftpd master exited after SIGHUP")
+
+    def _restart(self, conf: VsftpdConf):
+        systemctl("restart", self.service)
+        port = int(conf.get("listen_port") or 21)
+        if not wait_for_port(port, RESTART_READY_TIMEOUT):
+            raise RuntimeError(f"vsftpd is not accepting connections on port {port}")
+
+    def _recover(self):
+        """Bring vsftpd back with the restored file if the failed apply took it down"""
+        if self.tracker.master() is None:
+            systemctl("restart", self.service)
+
+
+def systemctl(action: str, service: str):
+    """Run `systemctl <action> <service>`; raises RuntimeError if it fails"""
+    try:
+        result = subprocess.run(["systemctl", action, service], capture_output=True, text=True,
+                                timeout=SYSTEMCTL_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"systemctl {action} {service} failed: {e}")
+    if result.returncode != 0:
+        raise RuntimeError(f"systemctl {action} {service} failed: {result.stderr.strip()}")
+
+
+def wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
@@ -1,20 +1,43 @@
-import { useQuery } from '@tanstack/react-query';
+import { useEffect, useState } from 'react';
+import { useQuery, useQueryClient } from '@tanstack/react-query';
 import { apiService, DashboardStats, RecentUser } from '@/services/api';
 
-export const useDashboardStats = () => {
-  return useQuery({
+// Recebe métricas via SSE; enquanto conectado, o polling fica desligado
+export const useLiveDashboard = () => {
+  const queryClient = useQueryClient();
+  const [connected, setConnected] = useState(false);
+
+  useEffect(() => {
+    const source = apiService.openEventStream();
+    source.onopen = () => setConnected(true);
+    source.onerror = () => setConnected(false);
+    source.addEventListener('stats', (event) => {
+      queryClient.setQueryData(['dashboard-stats'], JSON.parse((event as MessageEvent).data));
+    });
+    source.addEventListener('recent-users', (event) => {
+      queryClient.setQueryData(['recent-users'], JSON.parse((event as MessageEvent).data));
+    });
+    return () => source.close();
+  }, [queryClient]);
+
+  return connected;
+};
+
+export const useDashboardStats = (live = false) => {
+  return useQuery<DashboardStats>({
     queryKey: ['dashboard-stats'],
     queryFn: () => apiService.getDashboardStats(),
-    refetchInterval: 30000, // Refresh every 30 seconds
+    // Before the backend's first collection (ready=false), poll every 2 seconds even with the live feed
+    refetchInterval: (query) => (query.state.data?.ready === false ? 2000 : live ? false : 30000),
     retry: 3,
   });
 };
 
-export const useRecentUsers = () => {
-  return useQuery({
+export const useRecentUsers = (live = false) => {
+  return useQuery<RecentUser[]>({
     queryKey: ['recent-users'],
     queryFn: () => apiService.getRecentUsers(),
-    refetchInterval: 60000, // Refresh every minute
+    refetchInterval: live ? false : 60000, // Refresh every minute without the live feed
     retry: 3,
   });
-};
\ No newline at end of file
+};
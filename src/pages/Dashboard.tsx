@@ -4,32 +4,28 @@ import { PermissionBadge } from "@/components/PermissionBadge";
 import { StatusItem } from "@/components/StatusItem";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
-import { apiService } from "@/services/api";
 import { User } from "@/services/api";
+import { useDashboardStats, useLiveDashboard, useRecentUsers } from "@/hooks/useDashboard";
 import { RefreshCw, User as UserIcon, HardDrive, Activity, Shield, Server } from "lucide-react";
 import { motion } from "framer-motion";
-import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 
 export default function Dashboard() {
-  const [stats, setStats] = useState<any>(null);
-  const [recentUsers, setRecentUsers] = useState<User[]>([]);
-  const [loading, setLoading] = useState(true);
   const navigate = useNavigate();
+  // Métricas chegam pelo canal SSE; sem ele, os hooks voltam ao polling
+  const live = useLiveDashboard();
+  const statsQuery = useDashboardStats(live);
+  const recentUsersQuery = useRecentUsers(live);
+  const stats: any = statsQuery.data ?? null;
+  const recentUsers = (recentUsersQuery.data ?? []) as unknown as User[];
+  // ready=false: o backend ainda não coletou tudo e os números são apenas padrões
+  const loading = statsQuery.isLoading || stats?.ready === false || recentUsersQuery.isLoading;
 
-  const fetchData = async () => {
-    setLoading(true);
-    const stats = await apiService.getDashboardStats();
-    const users = await apiService.getRecentUsers();
-    setStats(stats);
-    setRecentUsers(users as any);
-    setLoading(false);
+  const fetchData = () => {
+    statsQuery.refetch();
+    recentUsersQuery.refetch();
   };
 
-  useEffect(() => {
-    fetchData();
-  }, []);
-
   // Exemplo de trends
   const trends = {
     users: "+12% este mês",
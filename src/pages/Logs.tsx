@@ -1,26 +1,70 @@
 import { useEffect, useState, useRef } from "react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
-import { apiService } from "@/services/api";
+import { apiService, LogEvent } from "@/services/api";
+
+const TAIL_LINES = 1000;
+const MAX_LOG_CHARS = 2 * 1024 * 1024;
 
 export default function Logs() {
   const [log, setLog] = useState("");
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const logRef = useRef<HTMLPreElement>(null);
+  const cursorRef = useRef<{ offset: number; inode: number | null } | null>(null);
 
-  // Função para buscar logs
+  // Função para buscar logs: últimas linhas na primeira vez, depois só o que foi anexado
   const fetchLog = () => {
-    setLoading(true);
-    apiService.getVsftpdLog()
-      .then(setLog)
+    const cursor = cursorRef.current;
+    const request = cursor
+      ? apiService.getVsftpdLogChunk({ sinceOffset: cursor.offset, inode: cursor.inode })
+      : apiService.getVsftpdLogChunk({ tail: TAIL_LINES });
+    request
+      .then((chunk) => {
+        cursorRef.current = { offset: chunk.offset, inode: chunk.inode };
+        setError(null);
+        setLog((prev) => {
+          const next = !cursor || chunk.reset ? chunk.text : prev + chunk.text;
+          return next.length > MAX_LOG_CHARS ? next.slice(next.length - MAX_LOG_CHARS) : next;
+        });
+      })
       .catch((err) => setError(err.message || "Erro ao buscar logs"))
       .finally(() => setLoading(false));
   };
 
   useEffect(() => {
     fetchLog();
-    const interval = setInterval(fetchLog, 5000); // Atualiza a cada 5s
-    return () => clearInterval(interval);
+    // Novas linhas chegam via SSE; o polling só roda enquanto o canal está fora
+    let interval: ReturnType<typeof setInterval> | null = setInterval(fetchLog, 5000); // Atualiza a cada 5s
+    const stopPolling = () => {
+      if (interval) clearInterval(interval);
+      interval = null;
+    };
+    const source = apiService.openEventStream();
+    source.onopen = () => {
+      stopPolling();
+      fetchLog(); // recupera o que foi escrito enquanto desconectado
+    };
+    source.onerror = () => {
+      if (!interval) interval = setInterval(fetchLog, 5000);
+    };
+    source.addEventListener("log", (event) => {
+      const chunk: LogEvent = JSON.parse((event as MessageEvent).data);
+      const cursor = cursorRef.current;
+      if (!cursor) return;
+      if (chunk.inode === cursor.inode && chunk.start === cursor.offset) {
+        cursorRef.current = { offset: chunk.end, inode: chunk.inode };
+        setLog((prev) => {
+          const next = prev + chunk.text;
+          return next.length > MAX_LOG_CHARS ? next.slice(next.length - MAX_LOG_CHARS) : next;
+        });
+      } else if (chunk.inode !== cursor.inode || chunk.end > cursor.offset) {
+        fetchLog(); // cursor fora de sincronia: busca pelo offset
+      }
+    });
+    return () => {
+      stopPolling();
+      source.close();
+    };
   }, []);
 
   useEffect(() => {
@@ -47,4 +91,4 @@ export default function Logs() {
       </Card>
     </div>
   );
-} 
\ No newline at end of file
+}
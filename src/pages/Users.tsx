@@ -23,24 +23,33 @@ import { Search, Plus, MoreHorizontal, Edit, Trash, Key, User } from "lucide-rea
 import { Link } from "react-router-dom";
 import { apiService, User as ApiUser } from "@/services/api";
 
+const PAGE_SIZE = 50;
+
 export default function Users() {
   const [searchTerm, setSearchTerm] = useState("");
   const [users, setUsers] = useState<ApiUser[]>([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
-  useEffect(() => {
+  // Busca paginada no backend (filtro por prefixo do nome de usuário)
+  const loadUsers = (offset: number, prefix: string) => {
     setLoading(true);
-    apiService.getUsers()
-      .then(setUsers)
+    apiService.getUsers({ offset, limit: PAGE_SIZE, prefix })
+      .then((page) => {
+        setUsers((prev) => (offset === 0 ? page.users : [...prev, ...page.users]));
+        setTotal(page.total);
+      })
       .catch((err) => setError(err.message || "Erro ao carregar usuários"))
       .finally(() => setLoading(false));
-  }, []);
+  };
 
-  const filteredUsers = users.filter(user =>
-    user.username.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    user.email.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  useEffect(() => {
+    const timeout = setTimeout(() => loadUsers(0, searchTerm.trim()), 300);
+    return () => clearTimeout(timeout);
+  }, [searchTerm]);
+
+  const filteredUsers = users;
 
   const getStatusBadge = (status: string) => {
     const statusColors = {
@@ -94,7 +103,7 @@ export default function Users() {
             <div className="flex items-center space-x-2">
               <User className="w-4 h-4 text-accent" />
               <div>
-                <p className="text-2xl font-bold">{users.length}</p>
+                <p className="text-2xl font-bold">{total}</p>
                 <p className="text-xs text-muted-foreground">Total</p>
               </div>
             </div>
@@ -219,6 +228,13 @@ export default function Users() {
               </TableBody>
             </Table>
           </div>
+          {users.length < total && (
+            <div className="flex justify-center mt-4">
+              <Button variant="outline" disabled={loading} onClick={() => loadUsers(users.length, searchTerm.trim())}>
+                Carregar mais ({users.length} de {total})
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
     </div>
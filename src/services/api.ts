@@ -10,6 +10,12 @@ export interface DashboardStats {
   disk_used_gb: number;
   disk_total_gb: number;
   disk_usage_percent: number;
+  // Momento (ISO) em que cada campo foi coletado pelo backend
+  freshness?: Record<string, string | null>;
+  // false até cada fonte ter sido coletada uma vez; até lá os valores são apenas padrões
+  ready?: boolean;
+  // Coleta mais antiga entre as fontes (ISO); null enquanto ready=false
+  updated_at?: string | null;
 }
 
 export interface RecentUser {
@@ -24,6 +30,126 @@ export interface User {
   home_dir: string;
   quota_mb: number;
   created_at: string;
+  used_bytes?: number | null;
+  file_count?: number | null;
+  quota_percent?: number | null;
+}
+
+export interface LogChunk {
+  text: string;
+  offset: number;
+  inode: number | null;
+  reset: boolean;
+}
+
+export interface LogEvent {
+  start: number;
+  end: number;
+  inode: number;
+  text: string;
+}
+
+export interface UserPage {
+  users: User[];
+  total: number;
+}
+
+export interface Job {
+  id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: Record<string, unknown>;
+  result: Record<string, unknown> | null;
+  error: string | null;
+  attempts: number;
+  created_at: number;
+  started_at: number | null;
+  finished_at: number | null;
+}
+
+export interface JobAccepted {
+  message: string;
+  job_id: string;
+}
+
+export interface FtpSession {
+  pid: number;
+  pids: number[];
+  user: string | null;
+  ip: string;
+  state: 'connected' | 'logged_in' | 'closed';
+  connected_at: string;
+  login_at: string | null;
+  last_activity: string;
+  duration_seconds: number;
+  idle_seconds: number | null;
+  commands: number;
+  last_command: string | null;
+  recent_commands: string[];
+  failed_logins: number;
+  transfers: number;
+  bytes_in: number;
+  bytes_out: number;
+  closed_at: string | null;
+  close_reason: string | null;
+}
+
+export interface FtpSessions {
+  tracking: boolean;
+  count: number;
+  online_users: string[];
+  sessions: FtpSession[];
+}
+
+export type FileSort = 'none' | 'name' | '-name' | 'size' | '-size' | 'mtime' | '-mtime';
+
+export interface FileEntry {
+  name: string;
+  type: 'file' | 'dir' | 'link' | 'other';
+  size: number | null;
+  mtime: string;
+}
+
+export interface FilePage {
+  username: string;
+  path: string;
+  sort: FileSort;
+  entries: FileEntry[];
+  // Desconhecido (null) ao paginar na ordem do diretório sem listagem em cache
+  total: number | null;
+  cached: boolean;
+  next_cursor: string | null;
+}
+
+export type AnalyticsWindow = '1h' | '24h' | '7d';
+
+// Contagens estimadas: `error` é o quanto cada item pode estar superestimado
+export interface TopFile {
+  user: string;
+  path: string;
+  transfers: number;
+  error: number;
+  bytes: number;
+}
+
+export interface TopTransferUser {
+  user: string;
+  transfers: number;
+  error: number;
+  bytes: number;
+}
+
+export interface TopIp {
+  ip: string;
+  events: number;
+  error: number;
+}
+
+export interface DistinctClients {
+  window: AnalyticsWindow;
+  events: number;
+  distinct_clients: number;
+  distinct_users: number;
 }
 
 export interface CreateUserRequest {
@@ -61,28 +187,88 @@ class ApiService {
     return this.request<DashboardStats>('/api/dashboard/stats');
   }
 
-  async getRecentUsers(): Promise<RecentUser[]> {
-    return this.request<RecentUser[]>('/api/dashboard/recent-users');
+  async getRecentUsers(limit?: number): Promise<RecentUser[]> {
+    const query = limit !== undefined ? `?limit=${limit}` : '';
+    return this.request<RecentUser[]>(`/api/dashboard/recent-users${query}`);
   }
 
   // User management endpoints
-  async getUsers(): Promise<User[]> {
-    return this.request<User[]>('/api/users');
+  async getUsers(params: { offset?: number; limit?: number; prefix?: string } = {}): Promise<UserPage> {
+    const query = new URLSearchParams();
+    if (params.offset !== undefined) query.set('offset', String(params.offset));
+    if (params.limit !== undefined) query.set('limit', String(params.limit));
+    if (params.prefix) query.set('prefix', params.prefix);
+    const response = await fetch(`${API_BASE_URL}/api/users?${query.toString()}`);
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
+      throw new Error(errorData.detail || `HTTP ${response.status}`);
+    }
+    const users: User[] = await response.json();
+    return { users, total: Number(response.headers.get('X-Total-Count') ?? users.length) };
   }
 
-  async createUser(userData: CreateUserRequest): Promise<{ message: string }> {
-    return this.request<{ message: string }>('/api/users', {
+  async createUser(userData: CreateUserRequest): Promise<JobAccepted> {
+    return this.request<JobAccepted>('/api/users', {
       method: 'POST',
       body: JSON.stringify(userData),
     });
   }
 
-  async deleteUser(username: string): Promise<{ message: string }> {
-    return this.request<{ message: string }>(`/api/users/${username}`, {
+  async deleteUser(username: string): Promise<JobAccepted> {
+    return this.request<JobAccepted>(`/api/users/${username}`, {
       method: 'DELETE',
     });
   }
 
+  async getUserFiles(
+    username: string,
+    params: { path?: string; cursor?: string | null; limit?: number; sort?: FileSort } = {},
+  ): Promise<FilePage> {
+    const query = new URLSearchParams();
+    if (params.path) query.set('path', params.path);
+    if (params.cursor) query.set('cursor', params.cursor);
+    if (params.limit !== undefined) query.set('limit', String(params.limit));
+    if (params.sort) query.set('sort', params.sort);
+    return this.request<FilePage>(`/api/users/${encodeURIComponent(username)}/files?${query.toString()}`);
+  }
+
+  async getJob(jobId: string): Promise<Job> {
+    return this.request<Job>(`/api/jobs/${jobId}`);
+  }
+
+  // Sessões FTP reconstruídas do log de protocolo
+  async getSessions(user?: string): Promise<FtpSessions> {
+    const query = user ? `?user=${encodeURIComponent(user)}` : '';
+    return this.request<FtpSessions>(`/api/sessions${query}`);
+  }
+
+  async getSessionHistory(params: { user?: string; limit?: number } = {}): Promise<FtpSession[]> {
+    const query = new URLSearchParams();
+    if (params.user) query.set('user', params.user);
+    if (params.limit !== undefined) query.set('limit', String(params.limit));
+    return this.request<FtpSession[]>(`/api/sessions/history?${query.toString()}`);
+  }
+
+  // Analytics endpoints
+  async getTopFiles(window: AnalyticsWindow = '24h', limit = 10): Promise<TopFile[]> {
+    const data = await this.request<{ top_files: TopFile[] }>(`/api/analytics/top-files?window=${window}&limit=${limit}`);
+    return data.top_files;
+  }
+
+  async getTopTransferUsers(window: AnalyticsWindow = '24h', limit = 10): Promise<TopTransferUser[]> {
+    const data = await this.request<{ top_users: TopTransferUser[] }>(`/api/analytics/top-users?window=${window}&limit=${limit}`);
+    return data.top_users;
+  }
+
+  async getTopIps(window: AnalyticsWindow = '24h', limit = 10): Promise<TopIp[]> {
+    const data = await this.request<{ top_ips: TopIp[] }>(`/api/analytics/top-ips?window=${window}&limit=${limit}`);
+    return data.top_ips;
+  }
+
+  async getDistinctClients(window: AnalyticsWindow = '24h'): Promise<DistinctClients> {
+    return this.request<DistinctClients>(`/api/analytics/distinct-clients?window=${window}`);
+  }
+
   async getVsftpdLog(): Promise<string> {
     const response = await fetch(`${API_BASE_URL}/api/logs/vsftpd`);
     if (!response.ok) {
@@ -90,6 +276,33 @@ class ApiService {
     }
     return response.text();
   }
+
+  // Canal SSE com eventos `log`, `stats` e `recent-users`
+  openEventStream(): EventSource {
+    return new EventSource(`${API_BASE_URL}/api/events`);
+  }
+
+  // Lê o log incrementalmente: `tail` na primeira carga, depois `sinceOffset`
+  async getVsftpdLogChunk(params: { tail?: number; sinceOffset?: number; inode?: number | null }): Promise<LogChunk> {
+    const query = new URLSearchParams();
+    if (params.sinceOffset !== undefined) query.set('since_offset', String(params.sinceOffset));
+    else if (params.tail !== undefined) query.set('tail', String(params.tail));
+    if (params.inode !== undefined && params.inode !== null) query.set('inode', String(params.inode));
+    const response = await fetch(`${API_BASE_URL}/api/logs/vsftpd?${query.toString()}`);
+    if (response.status === 404) {
+      throw new Error('Arquivo de log não encontrado.');
+    }
+    if (!response.ok) {
+      throw new Error('Erro ao buscar log do vsftpd');
+    }
+    const inode = response.headers.get('X-Log-Inode');
+    return {
+      text: await response.text(),
+      offset: Number(response.headers.get('X-Log-Offset') ?? 0),
+      inode: inode !== null ? Number(inode) : null,
+      reset: response.headers.get('X-Log-Reset') === '1',
+    };
+  }
 }
 
 export const apiService = new ApiService();
\ No newline at end of file